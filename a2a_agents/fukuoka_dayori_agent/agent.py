@@ -1,7 +1,8 @@
 import os
 
 from google.adk.agents import Agent
-from google.adk.tools import VertexAiSearchTool
+
+from search_tool import create_search_tool
 
 root_agent = Agent(
     name='福岡市ジェネラルエージェント',
@@ -25,6 +26,16 @@ root_agent = Agent(
         '''
         ),
     tools=[
-        VertexAiSearchTool(data_store_id=os.environ['DATASTORE_ID_FUKUOKA_DAYORI']),
+        # SEARCH_TOOL_MODE=cached・local の場合は、関数ツールとして呼び出す
+        create_search_tool(
+            # local モードではデータストアを使わないため、未設定でもよい
+            data_store_id=os.environ.get('DATASTORE_ID_FUKUOKA_DAYORI', ''),
+            name='search_fukuoka_dayori',
+            description='''福岡市の市政だよりのデータストアを検索します。ゴミの出し方・子育て支援・防災・イベント・交通などの市政情報を調べるときに使います。
+
+            Args:
+                query: 検索する内容
+            ''',
+        ),
     ],
 )
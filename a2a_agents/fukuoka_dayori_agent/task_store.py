@@ -0,0 +1,129 @@
+import os
+import time
+import asyncio
+import sqlite3
+import threading
+
+from a2a.server.tasks import TaskStore
+from a2a.types import Task, TaskState
+
+
+# タスクを保存する SQLite ファイルのパス（未指定の場合はプロセス内のメモリ上の SQLite に保存する）
+TASK_DB_ENV = "A2A_TASK_DB_PATH"
+# 完了したタスクを残しておく時間（秒）。この時間を過ぎたタスクは削除する
+TASK_RETENTION_SECONDS = int(os.getenv("A2A_TASK_RETENTION_SECONDS", "600"))
+# 完了したタスクを削除する間隔（秒）
+PRUNE_INTERVAL = 60
+# これ以上状態が変わらないタスクの状態
+TERMINAL_STATES = (TaskState.completed, TaskState.canceled, TaskState.failed, TaskState.rejected)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id TEXT PRIMARY KEY,
+    context_id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    update_time REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tasks_state_update_time ON tasks (state, update_time);
+"""
+
+
+class SqliteTaskStore(TaskStore):
+    """SQLite にタスクを保存し、完了から retention 秒を過ぎたタスクを削除するタスクストア
+
+    削除は保存のついでに PRUNE_INTERVAL 秒ごとに行うため、バックグラウンドのタスクは使わない。
+    """
+
+    def __init__(self, path: str = ":memory:", retention: float = TASK_RETENTION_SECONDS):
+        """
+        path: SQLite ファイルのパス（":memory:" の場合はプロセス内のメモリに保存する）
+        retention: 完了したタスクを残しておく秒数
+        """
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.retention = retention
+        self.__conn = sqlite3.connect(path, check_same_thread=False)
+        self.__lock = threading.Lock()
+        with self.__lock:
+            if path != ":memory:":
+                self.__conn.execute("PRAGMA journal_mode=WAL")
+                self.__conn.execute("PRAGMA synchronous=NORMAL")
+            self.__conn.executescript(SCHEMA)
+        self.__last_pruned = time.monotonic()
+        self.saved = 0
+        self.pruned = 0
+
+    async def __run(self, func, *args):
+        """DB 操作をスレッドで実行する（イベントループを止めないため）"""
+        def locked():
+            with self.__lock:
+                with self.__conn:
+                    return func(*args)
+        return await asyncio.to_thread(locked)
+
+    def __db_save(self, task_id, context_id, state, now, data):
+        self.__conn.execute(
+            "INSERT OR REPLACE INTO tasks (id, context_id, state, update_time, data) VALUES (?, ?, ?, ?, ?)",
+            (task_id, context_id, state, now, data),
+        )
+
+    def __db_get(self, task_id):
+        row = self.__conn.execute("SELECT data FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        return row[0] if row else None
+
+    def __db_delete(self, task_id):
+        self.__conn.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+
+    def __db_prune(self, cutoff):
+        placeholders = ", ".join("?" for _ in TERMINAL_STATES)
+        return self.__conn.execute(
+            f"DELETE FROM tasks WHERE state IN ({placeholders}) AND update_time < ?",
+            (*[state.value for state in TERMINAL_STATES], cutoff),
+        ).rowcount
+
+    def __db_counts(self):
+        return dict(self.__conn.execute("SELECT state, COUNT(*) FROM tasks GROUP BY state").fetchall())
+
+    async def save(self, task: Task, context=None) -> None:
+        await self.__run(
+            self.__db_save,
+            task.id,
+            task.context_id,
+            task.status.state.value,
+            time.time(),
+            task.model_dump_json(exclude_none=True),
+        )
+        self.saved += 1
+        if time.monotonic() - self.__last_pruned >= PRUNE_INTERVAL:
+            await self.prune()
+
+    async def get(self, task_id: str, context=None) -> Task | None:
+        data = await self.__run(self.__db_get, task_id)
+        return Task.model_validate_json(data) if data is not None else None
+
+    async def delete(self, task_id: str, context=None) -> None:
+        await self.__run(self.__db_delete, task_id)
+
+    async def prune(self):
+        """完了から retention 秒を過ぎたタスクを削除する"""
+        self.__last_pruned = time.monotonic()
+        removed = await self.__run(self.__db_prune, time.time() - self.retention)
+        self.pruned += removed
+        if removed:
+            print(f"🧹 完了したタスクを {removed} 件削除しました")
+        return removed
+
+    async def stats(self):
+        """状態ごとのタスク数と、保存・削除した件数を返す"""
+        return {
+            "tasks": await self.__run(self.__db_counts),
+            "saved": self.saved,
+            "pruned": self.pruned,
+        }
+
+
+def create_task_store(path: str = None):
+    """環境変数 A2A_TASK_DB_PATH が指定されていればそのファイル、なければメモリ上の SQLite にタスクを保存する"""
+    return SqliteTaskStore(path or os.getenv(TASK_DB_ENV) or ":memory:")
@@ -8,7 +8,6 @@ import uvicorn
 
 from a2a.server.apps import A2AStarletteApplication
 from a2a.server.request_handlers import DefaultRequestHandler
-from a2a.server.tasks import InMemoryTaskStore
 from a2a.types import (
     AgentCapabilities,
     AgentCard,
@@ -19,11 +18,20 @@ load_dotenv()
 from agent import root_agent as yatai_agent
 from agent_executor import ADKAgentExecutor
 from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from search_tool import search_stats
+from task_store import create_task_store
 
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Yatai opening hours and availability change daily, so cached responses expire hourly
+RESPONSE_CACHE_TTL_SECONDS = int(
+    os.getenv('A2A_RESPONSE_CACHE_TTL_SECONDS', '3600')
+)
+
 
 class MissingAPIKeyError(Exception):
     """Exception for missing API key."""
@@ -63,19 +71,31 @@ async def main(host, port):
         ],
     )
 
-    task_store = InMemoryTaskStore()
+    # Completed tasks are pruned after A2A_TASK_RETENTION_SECONDS
+    task_store = create_task_store()
+    agent_executor = ADKAgentExecutor(
+        agent=yatai_agent,
+        cache_ttl=RESPONSE_CACHE_TTL_SECONDS,
+    )
 
     request_handler = DefaultRequestHandler(
-        agent_executor=ADKAgentExecutor(
-            agent=yatai_agent,
-        ),
+        agent_executor=agent_executor,
         task_store=task_store,
     )
 
+    async def metrics(request):
+        """Expose memory, session and task counts of this instance."""
+        return JSONResponse({
+            **agent_executor.stats(),
+            'task_store': await task_store.stats(),
+            'search': search_stats(),
+        })
+
     a2a_app = A2AStarletteApplication(
         agent_card=agent_card, http_handler=request_handler
     )
     routes = a2a_app.routes()
+    routes.append(Route('/metrics', metrics))
     app = Starlette(
         routes=routes,
         middleware=[],
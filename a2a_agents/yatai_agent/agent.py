@@ -1,7 +1,8 @@
 import os
 
 from google.adk.agents import Agent
-from google.adk.tools import VertexAiSearchTool
+
+from search_tool import create_search_tool
 
 root_agent = Agent(
     name='福岡屋台エージェント',
@@ -24,6 +25,16 @@ root_agent = Agent(
         '''
         ),
     tools=[
-        VertexAiSearchTool(data_store_id=os.environ['DATASTORE_ID_FUKUOKA_YATAI']),
+        # SEARCH_TOOL_MODE=cached・local の場合は、関数ツールとして呼び出す
+        create_search_tool(
+            # local モードではデータストアを使わないため、未設定でもよい
+            data_store_id=os.environ.get('DATASTORE_ID_FUKUOKA_YATAI', ''),
+            name='search_yatai',
+            description='''福岡市の屋台のデータストアを検索します。屋台の名前・場所・営業時間・メニュー・決済方法などを調べるときに使います。
+
+            Args:
+                query: 検索する内容
+            ''',
+        ),
     ],
 )
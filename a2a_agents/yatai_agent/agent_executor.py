@@ -1,3 +1,8 @@
+import os
+import time
+import uuid
+from collections import Counter, OrderedDict
+
 from a2a.server.agent_execution import AgentExecutor, RequestContext
 from a2a.server.events import EventQueue
 from a2a.server.tasks import TaskUpdater
@@ -7,12 +12,31 @@ from a2a.types import (
     TextPart,
 )
 from a2a.utils import new_agent_text_message, new_task
+from google.adk.agents.run_config import RunConfig, StreamingMode
 from google.adk.artifacts import InMemoryArtifactService
+from google.adk.events import Event
 from google.adk.memory.in_memory_memory_service import InMemoryMemoryService
 from google.adk.runners import Runner
-from google.adk.sessions import InMemorySessionService
 from google.genai import types
 
+from response_cache import RESPONSE_CACHE_TTL_SECONDS, ResponseCache, is_follow_up
+from sqlite_session_service import SqliteSessionService, create_session_service
+
+
+# Sessions idle for longer than this are deleted (seconds)
+SESSION_TTL_SECONDS = int(os.getenv('A2A_SESSION_TTL_SECONDS', '1800'))
+# Maximum number of sessions kept in memory (the least recently used are deleted first)
+MAX_SESSIONS = int(os.getenv('A2A_MAX_SESSIONS', '256'))
+
+
+def memory_usage():
+    """Return the resident set size of this process in bytes (0 if unknown)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
 
 class ADKAgentExecutor(AgentExecutor):
     def __init__(
@@ -20,6 +44,10 @@ class ADKAgentExecutor(AgentExecutor):
         agent,
         status_message='Processing request...',
         artifact_name='response',
+        session_service=None,
+        session_ttl=SESSION_TTL_SECONDS,
+        max_sessions=MAX_SESSIONS,
+        cache_ttl=RESPONSE_CACHE_TTL_SECONDS,
     ):
         """Initialize a generic ADK agent executor.
 
@@ -27,18 +55,128 @@ class ADKAgentExecutor(AgentExecutor):
             agent: The ADK agent instance
             status_message: Message to display while processing
             artifact_name: Name for the response artifact
+            session_service: Session service to use (defaults to SQLite if
+                SESSION_DB_PATH is set, in-memory otherwise)
+            session_ttl: Seconds of inactivity after which an in-memory
+                session is deleted
+            max_sessions: Maximum number of in-memory sessions
+            cache_ttl: Seconds to reuse the response to the same question
+                (0 disables the response cache)
         """
         self.agent = agent
         self.status_message = status_message
         self.artifact_name = artifact_name
+        self.session_ttl = session_ttl
+        self.max_sessions = max_sessions
+        self.response_cache = ResponseCache(ttl=cache_ttl) if cache_ttl else None
+        self.session_service = session_service or create_session_service()
+        # A persistent session service bounds its own memory and expires
+        # sessions itself, so only in-memory sessions are evicted here.
+        self._evicts_sessions = not isinstance(
+            self.session_service, SqliteSessionService
+        )
+        # (user_id, context_id) -> last used time (time.monotonic()) of the
+        # in-memory sessions evicted here
+        self._sessions = OrderedDict()
+        # Number of running tasks per (user_id, context_id)
+        self._active = Counter()
+        self.tasks_executed = 0
+        self.tasks_failed = 0
+        self.sessions_created = 0
+        self.sessions_evicted = 0
         self.runner = Runner(
             app_name=agent.name,
             agent=agent,
             artifact_service=InMemoryArtifactService(),
-            session_service=InMemorySessionService(),
+            session_service=self.session_service,
             memory_service=InMemoryMemoryService(),
         )
 
+    async def _get_or_create_session(self, user_id, context_id):
+        """Return the session of the context, creating it on first use."""
+        session = await self.session_service.get_session(
+            app_name=self.agent.name,
+            user_id=user_id,
+            session_id=context_id,
+        )
+        if session is None:
+            session = await self.session_service.create_session(
+                app_name=self.agent.name,
+                user_id=user_id,
+                state={},
+                session_id=context_id,
+            )
+            self.sessions_created += 1
+        if self._evicts_sessions:
+            # Only sessions evicted here are tracked, so the map stays bounded
+            key = (user_id, context_id)
+            self._sessions[key] = time.monotonic()
+            self._sessions.move_to_end(key)
+        return session
+
+    async def _evict_sessions(self):
+        """Delete idle sessions past the TTL and the least recently used
+        ones over max_sessions, skipping sessions with running tasks."""
+        if not self._evicts_sessions:
+            return
+        now = time.monotonic()
+        expired = []
+        overflow = len(self._sessions) - self.max_sessions
+        for key, last_used in self._sessions.items():
+            if self._active[key]:
+                continue
+            if overflow > 0:
+                overflow -= 1
+            elif now - last_used <= self.session_ttl:
+                # Ordered by last use, so the rest are newer
+                break
+            expired.append(key)
+        for user_id, context_id in expired:
+            del self._sessions[(user_id, context_id)]
+            await self.session_service.delete_session(
+                app_name=self.agent.name,
+                user_id=user_id,
+                session_id=context_id,
+            )
+        self.sessions_evicted += len(expired)
+
+    def stats(self):
+        """Return session and task counters together with process memory."""
+        stats = {
+            'memory_rss_bytes': memory_usage(),
+            'sessions': len(self._sessions),
+            'active_sessions': sum(1 for count in self._active.values() if count),
+            'sessions_created': self.sessions_created,
+            'sessions_evicted': self.sessions_evicted,
+            'tasks_executed': self.tasks_executed,
+            'tasks_failed': self.tasks_failed,
+        }
+        if isinstance(self.session_service, SqliteSessionService):
+            stats['session_store'] = self.session_service.stats()
+        if self.response_cache is not None:
+            stats['response_cache'] = self.response_cache.stats()
+        return stats
+
+    async def _append_cached_turn(self, session, content, response_text):
+        """Record a turn answered from the cache in the session, so
+        follow-up questions in the same context still see it."""
+        invocation_id = f'e-{uuid.uuid4()}'
+        await self.session_service.append_event(
+            session,
+            Event(invocation_id=invocation_id, author='user', content=content),
+        )
+        await self.session_service.append_event(
+            session,
+            Event(
+                invocation_id=invocation_id,
+                author=self.agent.name,
+                content=types.Content(
+                    role='model',
+                    parts=[types.Part.from_text(text=response_text)],
+                ),
+            ),
+        )
+
     async def cancel(
         self,
         context: RequestContext,
@@ -67,6 +205,8 @@ class ADKAgentExecutor(AgentExecutor):
         else:
             user_id = 'a2a_user'
 
+        key = (user_id, task.context_id)
+        self._active[key] += 1
         try:
             # Update status with custom message
             await updater.update_status(
@@ -76,47 +216,102 @@ class ADKAgentExecutor(AgentExecutor):
                 ),
             )
 
-            # Process with ADK agent
-            session = await self.runner.session_service.create_session(
-                app_name=self.agent.name,
-                user_id=user_id,
-                state={},
-                session_id=task.context_id,
+            # Process with ADK agent, reusing the session of the same context
+            session = await self._get_or_create_session(
+                user_id, task.context_id
             )
 
             content = types.Content(
                 role='user', parts=[types.Part.from_text(text=query)]
             )
 
+            artifact_id = str(uuid.uuid4())
+
+            # Answer repeated questions from the cache, unless the question
+            # refers back to earlier turns of the conversation
+            use_cache = self.response_cache is not None
+            if use_cache and is_follow_up(query, bool(session.events)):
+                self.response_cache.bypass()
+                use_cache = False
+            cached = self.response_cache.get(query) if use_cache else None
+            if cached is not None:
+                await self._append_cached_turn(session, content, cached)
+                await updater.add_artifact(
+                    [Part(root=TextPart(text=cached))],
+                    artifact_id=artifact_id,
+                    name=self.artifact_name,
+                    last_chunk=True,
+                )
+                await updater.complete()
+                self.tasks_executed += 1
+                return
+
+            # Forward text to the client as artifact chunks while ADK
+            # streams it, so the caller can start replying before the end
             response_text = ''
+            received_partial = False
             async for event in self.runner.run_async(
-                user_id=user_id, session_id=session.id, new_message=content
+                user_id=user_id,
+                session_id=session.id,
+                new_message=content,
+                run_config=RunConfig(streaming_mode=StreamingMode.SSE),
             ):
-                if (
-                    event.is_final_response()
-                    and event.content
-                    and event.content.parts
-                ):
-                    for part in event.content.parts:
-                        if hasattr(part, 'text') and part.text:
-                            response_text += part.text + '\n'
-                        elif hasattr(part, 'function_call'):
-                            # Log or handle function calls if needed
-                            pass  # Function calls are handled internally by ADK
-
-            # Add response as artifact with custom name
+                text = ''
+                if event.content and event.content.parts:
+                    # Function calls are handled internally by ADK
+                    text = ''.join(
+                        part.text for part in event.content.parts if part.text
+                    )
+                if event.partial:
+                    received_partial = True
+                elif received_partial:
+                    # The final event repeats the text already streamed
+                    received_partial = False
+                    continue
+                elif not event.is_final_response():
+                    continue
+                if not text:
+                    continue
+                if response_text and not event.partial:
+                    # Separate complete responses of successive agents
+                    text = '\n' + text
+                await updater.add_artifact(
+                    [Part(root=TextPart(text=text))],
+                    artifact_id=artifact_id,
+                    name=self.artifact_name,
+                    append=bool(response_text),
+                    last_chunk=False,
+                )
+                response_text += text
+
+            # Mark the end of the artifact
             await updater.add_artifact(
-                [Part(root=TextPart(text=response_text))],
+                [Part(root=TextPart(text=''))],
+                artifact_id=artifact_id,
                 name=self.artifact_name,
+                append=bool(response_text),
+                last_chunk=True,
             )
+            if use_cache:
+                self.response_cache.put(query, response_text)
 
             await updater.complete()
+            self.tasks_executed += 1
 
         except Exception as e:
+            self.tasks_failed += 1
             await updater.update_status(
                 TaskState.failed,
                 new_agent_text_message(
                     f'Error: {e!s}', task.context_id, task.id
                 ),
                 final=True,
-            )
\ No newline at end of file
+            )
+        finally:
+            self._active[key] -= 1
+            if not self._active[key]:
+                del self._active[key]
+            if key in self._sessions:
+                self._sessions[key] = time.monotonic()
+                self._sessions.move_to_end(key)
+            await self._evict_sessions()
@@ -0,0 +1,367 @@
+import os
+import csv
+import json
+import mmap
+import time
+import heapq
+import math
+import shutil
+import argparse
+import unicodedata
+from array import array
+from collections import Counter, defaultdict
+
+
+# ローカル検索のインデックスの保存先（SEARCH_TOOL_MODE=local の場合に使う）
+LOCAL_SEARCH_INDEX_DIR = os.getenv("LOCAL_SEARCH_INDEX_DIR", "search_index")
+# 文字 n-gram の長さ（日本語は分かち書きせずに文字 bigram で引く）
+NGRAM = 2
+# BM25 のパラメータ
+BM25_K1 = 1.2
+BM25_B = 0.75
+# テキストファイルを分割する1文書あたりの文字数の目安
+CHUNK_CHARS = 400
+# 1回の検索で返す件数
+TOP_K = 5
+# インデックスに取り込むファイルの拡張子
+TEXT_SUFFIXES = (".txt", ".md")
+RECORD_SUFFIXES = (".json", ".jsonl", ".csv")
+INDEX_VERSION = 1
+META_FILE = "meta.json"
+
+
+def tokenize(text: str, n: int = NGRAM):
+    """テキストを文字 n-gram に分割する（NFKC・小文字に統一し、空白・句読点・記号で区切る）"""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    tokens = []
+    run = []
+    for char in text + " ":
+        if char.isspace() or unicodedata.category(char)[0] in ("P", "S"):
+            if run:
+                if len(run) < n:
+                    tokens.append("".join(run))
+                else:
+                    tokens.extend("".join(run[i:i + n]) for i in range(len(run) - n + 1))
+                run = []
+        else:
+            run.append(char)
+    return tokens
+
+
+def chunk_text(text: str, size: int = CHUNK_CHARS):
+    """空行で区切った段落を、size 文字程度の文書にまとめる"""
+    chunks, current = [], ""
+    for paragraph in (p.strip() for p in text.split("\n\n")):
+        if not paragraph:
+            continue
+        if current and len(current) + len(paragraph) > size:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n{paragraph}" if current else paragraph
+        while len(current) > size * 2:
+            chunks.append(current[:size])
+            current = current[size:]
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def record_to_document(record: dict, doc_id: str):
+    """1行分のデータ（屋台の一覧など）を文書にする"""
+    fields = {key: value for key, value in record.items() if value not in (None, "")}
+    title = next((str(value) for value in fields.values() if isinstance(value, str)), doc_id)
+    text = "\n".join(f"{key}: {value}" for key, value in fields.items())
+    return {"id": doc_id, "title": title, "text": text, "data": fields}
+
+
+def load_documents(path: str):
+    """ファイルを読み込み、検索対象の文書のリストにする"""
+    name = os.path.basename(path)
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix in TEXT_SUFFIXES:
+        with open(path, encoding="utf-8") as f:
+            chunks = chunk_text(f.read())
+        return [{"id": f"{name}#{i}", "title": name, "text": chunk} for i, chunk in enumerate(chunks)]
+    with open(path, encoding="utf-8", newline="") as f:
+        if suffix == ".csv":
+            records = list(csv.DictReader(f))
+        elif suffix == ".jsonl":
+            records = [json.loads(line) for line in f if line.strip()]
+        else:
+            records = json.load(f)
+            if isinstance(records, dict):
+                records = [records]
+    return [record_to_document(record, f"{name}#{i}") for i, record in enumerate(records)]
+
+
+def find_sources(paths):
+    """指定したファイル・ディレクトリから、取り込むファイルを列挙する"""
+    suffixes = TEXT_SUFFIXES + RECORD_SUFFIXES
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in names if name.lower().endswith(suffixes))
+        else:
+            files.append(path)
+    return sorted(os.path.abspath(path) for path in files)
+
+
+def _map(path: str, typecode: str = None):
+    """ファイルを読み取り専用で mmap する（typecode を指定した場合は数値の配列として見る）"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            view = memoryview(b"")
+        else:
+            view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    return view.cast(typecode) if typecode else view
+
+
+class LocalSearchIndex:
+    """mmap で読み込んだ BM25 のインデックス
+
+    ファイル構成（数値はすべてネイティブのバイト順）
+        terms.bin     語（文字 n-gram）の UTF-8 を辞書順に連結したもの
+        terms.idx     各語の terms.bin 上の開始位置（uint32, 語数+1）
+        postings.idx  各語の postings.bin 上の開始位置（uint32, 語数+1。(文書, 出現回数) の組の単位）
+        postings.bin  (文書番号, 出現回数) の組（uint32 × 2）
+        doclens.bin   各文書の語数（uint32）
+        docs.bin      各文書の JSON を連結したもの
+        docs.idx      各文書の docs.bin 上の開始位置（uint64, 文書数+1）
+        meta.json     文書数・平均文書長と、取り込んだファイルごとの文書の範囲
+    """
+
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != INDEX_VERSION:
+            raise ValueError(f"インデックスの形式が異なります: {index_dir}")
+        self.ngram = meta["ngram"]
+        self.num_docs = meta["num_docs"]
+        self.avgdl = meta["avgdl"]
+        self.sources = meta["sources"]
+        self.__terms = _map(os.path.join(index_dir, "terms.bin"))
+        self.__term_offsets = _map(os.path.join(index_dir, "terms.idx"), "I")
+        self.__posting_offsets = _map(os.path.join(index_dir, "postings.idx"), "I")
+        self.__postings = _map(os.path.join(index_dir, "postings.bin"), "I")
+        self.__doclens = _map(os.path.join(index_dir, "doclens.bin"), "I")
+        self.__docs = _map(os.path.join(index_dir, "docs.bin"))
+        self.__doc_offsets = _map(os.path.join(index_dir, "docs.idx"), "Q")
+
+    @property
+    def num_terms(self):
+        return max(len(self.__term_offsets) - 1, 0)
+
+    def __term(self, i: int):
+        return bytes(self.__terms[self.__term_offsets[i]:self.__term_offsets[i + 1]])
+
+    def __find(self, term: bytes):
+        """語の番号を二分探索で求める（ない場合は -1）"""
+        lo, hi = 0, self.num_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.__term(mid) < term:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < self.num_terms and self.__term(lo) == term else -1
+
+    def document(self, i: int):
+        return json.loads(bytes(self.__docs[self.__doc_offsets[i]:self.__doc_offsets[i + 1]]))
+
+    def search(self, query: str, top_k: int = TOP_K):
+        """BM25 で文書を順位付けし、(スコア, 文書番号) を上位から返す"""
+        scores = defaultdict(float)
+        for token, query_tf in Counter(tokenize(query, self.ngram)).items():
+            t = self.__find(token.encode("utf-8"))
+            if t < 0:
+                continue
+            start, end = self.__posting_offsets[t], self.__posting_offsets[t + 1]
+            df = end - start
+            idf = math.log(1 + (self.num_docs - df + 0.5) / (df + 0.5))
+            for k in range(start, end):
+                doc, tf = self.__postings[2 * k], self.__postings[2 * k + 1]
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.__doclens[doc] / self.avgdl)
+                scores[doc] += query_tf * idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return heapq.nlargest(top_k, ((score, doc) for doc, score in scores.items()))
+
+
+def _write_array(path: str, typecode: str, values):
+    with open(path, "wb") as f:
+        array(typecode, values).tofile(f)
+
+
+def write_index(documents, sources: dict, index_dir: str, ngram: int = NGRAM):
+    """文書のリストからインデックスを作成する（別のディレクトリに書き出してから置き換える）"""
+    postings = defaultdict(list)
+    doclens = []
+    for doc_id, document in enumerate(documents):
+        counts = Counter(tokenize(f"{document.get('title', '')}\n{document['text']}", ngram))
+        doclens.append(sum(counts.values()))
+        for token, tf in counts.items():
+            postings[token].append((doc_id, tf))
+
+    tmp_dir = f"{index_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    terms = sorted(postings, key=lambda token: token.encode("utf-8"))
+    term_offsets, posting_offsets, flat = [0], [0], array("I")
+    with open(os.path.join(tmp_dir, "terms.bin"), "wb") as f:
+        for token in terms:
+            encoded = token.encode("utf-8")
+            f.write(encoded)
+            term_offsets.append(term_offsets[-1] + len(encoded))
+            for doc_id, tf in postings[token]:
+                flat.extend((doc_id, tf))
+            posting_offsets.append(posting_offsets[-1] + len(postings[token]))
+    _write_array(os.path.join(tmp_dir, "terms.idx"), "I", term_offsets)
+    _write_array(os.path.join(tmp_dir, "postings.idx"), "I", posting_offsets)
+    _write_array(os.path.join(tmp_dir, "postings.bin"), "I", flat)
+    _write_array(os.path.join(tmp_dir, "doclens.bin"), "I", doclens)
+    doc_offsets = [0]
+    with open(os.path.join(tmp_dir, "docs.bin"), "wb") as f:
+        for document in documents:
+            encoded = json.dumps(document, ensure_ascii=False).encode("utf-8")
+            f.write(encoded)
+            doc_offsets.append(doc_offsets[-1] + len(encoded))
+    _write_array(os.path.join(tmp_dir, "docs.idx"), "Q", doc_offsets)
+    meta = {
+        "version": INDEX_VERSION,
+        "ngram": ngram,
+        "num_docs": len(documents),
+        "avgdl": sum(doclens) / len(doclens) if doclens else 0.0,
+        "sources": sources,
+    }
+    with open(os.path.join(tmp_dir, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+    # 読み込み中のプロセスは古いファイルの mmap を使い続けられる
+    old_dir = f"{index_dir}.old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(index_dir):
+        os.replace(index_dir, old_dir)
+    os.replace(tmp_dir, index_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def build_index(paths, index_dir: str = LOCAL_SEARCH_INDEX_DIR, ngram: int = NGRAM):
+    """ファイルを取り込んでインデックスを作成する
+
+    既存のインデックスがある場合は、更新日時とサイズが変わっていないファイルの文書を
+    インデックスから引き継ぎ、追加・更新されたファイルだけを読み直す。変更がなければ書き出さない。
+    """
+    existing = None
+    if os.path.exists(os.path.join(index_dir, META_FILE)):
+        try:
+            existing = LocalSearchIndex(index_dir)
+        except ValueError:
+            existing = None
+        if existing is not None and existing.ngram != ngram:
+            existing = None
+    documents, sources = [], {}
+    result = {"added": 0, "updated": 0, "unchanged": 0, "removed": 0}
+    for path in find_sources(paths):
+        stat = os.stat(path)
+        previous = existing.sources.get(path) if existing else None
+        if previous and previous["mtime_ns"] == stat.st_mtime_ns and previous["size"] == stat.st_size:
+            first = previous["first_doc"]
+            docs = [existing.document(i) for i in range(first, first + previous["num_docs"])]
+            result["unchanged"] += 1
+        else:
+            docs = load_documents(path)
+            result["updated" if previous else "added"] += 1
+        sources[path] = {
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "first_doc": len(documents),
+            "num_docs": len(docs),
+        }
+        documents.extend(docs)
+    if existing:
+        result["removed"] = len(set(existing.sources) - set(sources))
+    result["documents"] = len(documents)
+    if existing and not (result["added"] or result["updated"] or result["removed"]):
+        return result
+    write_index(documents, sources, index_dir, ngram)
+    return result
+
+
+class LocalSearch:
+    """ローカルのインデックスを検索する（データストアの検索と同じ形式の結果を返す）
+
+    インデックスが作り直された場合は、次の検索のときに読み込み直す。
+    """
+
+    def __init__(self, index_dir: str = LOCAL_SEARCH_INDEX_DIR, top_k: int = TOP_K):
+        self.index_dir = index_dir
+        self.top_k = top_k
+        self.__index = None
+        self.__loaded_mtime = None
+        self.searches = 0
+        self.search_seconds = 0.0
+
+    def __load(self):
+        mtime = os.stat(os.path.join(self.index_dir, META_FILE)).st_mtime_ns
+        if mtime != self.__loaded_mtime:
+            self.__index = LocalSearchIndex(self.index_dir)
+            self.__loaded_mtime = mtime
+        return self.__index
+
+    def search(self, query: str):
+        started = time.perf_counter()
+        index = self.__load()
+        results = []
+        for score, doc in index.search(query, self.top_k):
+            document = index.document(doc)
+            result = {"id": document["id"], "title": document.get("title"), "snippets": [document["text"]]}
+            if document.get("data"):
+                result["data"] = document["data"]
+            result["score"] = round(score, 4)
+            results.append(result)
+        self.searches += 1
+        self.search_seconds += time.perf_counter() - started
+        return results
+
+    async def __call__(self, query: str):
+        # 数ミリ秒で終わるため、スレッドに逃がさずにそのまま検索する
+        return self.search(query)
+
+    def stats(self):
+        return {
+            "searches": self.searches,
+            "search_avg_ms": self.search_seconds * 1000 / self.searches if self.searches else 0.0,
+            "documents": self.__index.num_docs if self.__index else 0,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ローカル検索のインデックスの作成と検索")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="ファイル・ディレクトリを取り込んでインデックスを作成（更新）する")
+    build.add_argument("sources", nargs="+", help="取り込むファイルまたはディレクトリ（.txt .md .json .jsonl .csv）")
+    build.add_argument("--index", default=LOCAL_SEARCH_INDEX_DIR, help="インデックスの保存先")
+    query = subparsers.add_parser("query", help="インデックスを検索する")
+    query.add_argument("text", help="検索する内容")
+    query.add_argument("--index", default=LOCAL_SEARCH_INDEX_DIR, help="インデックスの保存先")
+    query.add_argument("--top-k", type=int, default=TOP_K, help="表示する件数")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        started = time.perf_counter()
+        result = build_index(args.sources, args.index)
+        print(
+            f"{result['documents']} 件の文書をインデックスしました"
+            f"（追加 {result['added']}・更新 {result['updated']}・削除 {result['removed']}・変更なし {result['unchanged']} ファイル、"
+            f"{time.perf_counter() - started:.2f} 秒）"
+        )
+    else:
+        search = LocalSearch(args.index, top_k=args.top_k)
+        for result in search.search(args.text):
+            print(f"[{result['score']:.3f}] {result['id']} {result['title']}")
+            print(f"    {result['snippets'][0][:100]!r}")
+        print(f"{search.stats()['search_avg_ms']:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
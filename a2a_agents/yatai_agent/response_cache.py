@@ -0,0 +1,92 @@
+import os
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+
+
+# 応答を保持する時間（秒）の既定値。エージェントごとに ADKAgentExecutor の cache_ttl で変更する
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("A2A_RESPONSE_CACHE_TTL_SECONDS", "3600"))
+# 保持する応答の最大件数
+RESPONSE_CACHE_SIZE = int(os.getenv("A2A_RESPONSE_CACHE_SIZE", "512"))
+# この文字数以下の質問は、それだけでは意味が決まらない相づち・聞き返しとみなす
+MIN_STANDALONE_CHARS = 4
+# 直前の会話を指す言葉（含まれる場合は文脈に依存する質問とみなす）
+FOLLOW_UP_PATTERN = re.compile(
+    r"それ|その|そこ|そっち|そちら|あれ|あの|あそこ|これ|この|ここ|さっき|先ほど|さきほど|"
+    r"他に|ほかに|他の|ほかの|もっと|続き|つづき|じゃあ|では|次は|詳しく|くわしく"
+)
+
+
+def normalize_query(text: str):
+    """キャッシュキー用に質問を正規化する
+
+    NFKC で全角/半角（半角カナを含む）を統一し、大文字/小文字・空白・句読点・記号の違いを無視する。
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return "".join(
+        char for char in text
+        if not char.isspace() and unicodedata.category(char)[0] not in ("P", "S")
+    )
+
+
+def is_follow_up(query: str, has_history: bool):
+    """直前の会話に依存する質問かどうか（会話の続きでなければ常に False）"""
+    if not has_history:
+        return False
+    normalized = normalize_query(query)
+    return len(normalized) <= MIN_STANDALONE_CHARS or FOLLOW_UP_PATTERN.search(normalized) is not None
+
+
+class ResponseCache:
+    """正規化した質問をキーに、エージェントの応答を TTL 付きで保持する LRU キャッシュ"""
+
+    def __init__(self, ttl: float = RESPONSE_CACHE_TTL_SECONDS, max_entries: int = RESPONSE_CACHE_SIZE):
+        """
+        ttl: 応答を保持する秒数
+        max_entries: 保持する応答の最大件数（超えた分は使われていないものから削除する）
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.__responses = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    def get(self, query: str):
+        """キャッシュした応答を返す（ないか期限切れの場合は None）"""
+        key = normalize_query(query)
+        entry = self.__responses.get(key)
+        if entry is not None:
+            response, expires_at = entry
+            if expires_at >= time.monotonic():
+                self.__responses.move_to_end(key)
+                self.hits += 1
+                return response
+            del self.__responses[key]
+        self.misses += 1
+        return None
+
+    def put(self, query: str, response: str):
+        key = normalize_query(query)
+        if not key or not response:
+            return
+        self.__responses[key] = (response, time.monotonic() + self.ttl)
+        self.__responses.move_to_end(key)
+        while len(self.__responses) > self.max_entries:
+            self.__responses.popitem(last=False)
+
+    def bypass(self):
+        """文脈に依存するためキャッシュを使わなかった回数を数える"""
+        self.bypassed += 1
+
+    def stats(self):
+        """キャッシュのヒット/ミス回数を返す"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "cached_responses": len(self.__responses),
+        }
@@ -0,0 +1,218 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict
+
+from google.adk.tools import FunctionTool, VertexAiSearchTool
+
+from local_search import LOCAL_SEARCH_INDEX_DIR, LocalSearch
+from response_cache import normalize_query
+
+
+# データストアの検索方法
+#   vertex: Gemini の Vertex AI Search グラウンディング（VertexAiSearchTool）
+#   cached: Discovery Engine の検索 API を関数ツールとして呼び出し、結果をキャッシュする
+#   local: ローカルのインデックス（local_search.py で作成）を関数ツールとして検索する
+SEARCH_TOOL_MODE = os.getenv("SEARCH_TOOL_MODE", "vertex")
+# 検索結果を新しいものとして扱う時間（秒）
+SEARCH_CACHE_TTL_SECONDS = int(os.getenv("SEARCH_CACHE_TTL_SECONDS", "3600"))
+# TTL を過ぎてからこの時間（秒）までは古い結果を返しつつ、バックグラウンドで検索し直す
+SEARCH_CACHE_STALE_SECONDS = int(os.getenv("SEARCH_CACHE_STALE_SECONDS", "86400"))
+# 保持する検索結果の最大件数
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "1024"))
+# 1回の検索で返す件数
+SEARCH_PAGE_SIZE = 5
+
+
+def document_to_result(document):
+    """Discovery Engine のドキュメントを、モデルに渡す辞書にする"""
+    data = type(document).to_dict(document)
+    result = {"id": data.get("id")}
+    derived = data.get("derived_struct_data") or {}
+    # 非構造化データ（Cloud Storage の PDF など）はタイトル・リンク・抜粋を返す
+    for key in ("title", "link"):
+        if derived.get(key):
+            result[key] = derived[key]
+    snippets = [item.get("snippet") for item in derived.get("snippets", []) if item.get("snippet")]
+    snippets += [item.get("content") for item in derived.get("extractive_answers", []) if item.get("content")]
+    if snippets:
+        result["snippets"] = snippets
+    # 構造化データ（BigQuery のテーブルなど）は行の内容をそのまま返す
+    if data.get("struct_data"):
+        result["data"] = data["struct_data"]
+    return result
+
+
+class DiscoveryEngineSearch:
+    """Discovery Engine（Vertex AI Search）の検索 API でデータストアを検索する"""
+
+    def __init__(self, data_store_id: str, page_size: int = SEARCH_PAGE_SIZE):
+        """
+        data_store_id: データストアのリソース名（projects/.../dataStores/ID）
+        page_size: 1回の検索で返す件数
+        """
+        self.data_store_id = data_store_id
+        self.page_size = page_size
+        self.__client = None
+
+    async def __call__(self, query: str):
+        # 使うときだけ読み込む（vertex モードでは不要なため）
+        from google.cloud import discoveryengine_v1 as discoveryengine
+
+        if self.__client is None:
+            self.__client = discoveryengine.SearchServiceAsyncClient()
+        request = discoveryengine.SearchRequest(
+            serving_config=f"{self.data_store_id}/servingConfigs/default_config",
+            query=query,
+            page_size=self.page_size,
+            content_search_spec=discoveryengine.SearchRequest.ContentSearchSpec(
+                snippet_spec=discoveryengine.SearchRequest.ContentSearchSpec.SnippetSpec(return_snippet=True),
+            ),
+        )
+        pager = await self.__client.search(request)
+        # 先頭のページだけを使う
+        return [document_to_result(result.document) for result in pager.results]
+
+
+class CachedSearch:
+    """データストアの検索結果を (データストア, 正規化した検索語) ごとにキャッシュする
+
+    TTL 内の結果はそのまま返す。TTL を過ぎても stale 秒以内であれば古い結果をすぐに返し、
+    バックグラウンドで検索し直す（stale-while-revalidate）。同じ検索語の検索は同時に1つだけ実行する。
+    """
+
+    def __init__(
+        self,
+        search,
+        data_store_id: str,
+        ttl: float = SEARCH_CACHE_TTL_SECONDS,
+        stale: float = SEARCH_CACHE_STALE_SECONDS,
+        max_entries: int = SEARCH_CACHE_SIZE,
+    ):
+        """
+        search: 検索語から検索結果のリストを返す非同期関数
+        data_store_id: キャッシュキーに含めるデータストアのリソース名
+        ttl: 検索結果を新しいものとして扱う秒数
+        stale: TTL を過ぎた結果を、検索し直している間に返してよい秒数
+        max_entries: 保持する検索結果の最大件数
+        """
+        self.search = search
+        self.data_store_id = data_store_id
+        self.ttl = ttl
+        self.stale = stale
+        self.max_entries = max_entries
+        # (データストア, 正規化した検索語) → (検索結果, 検索した時刻)
+        self.__results = OrderedDict()
+        self.__inflight = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.searches = 0
+        self.search_seconds = 0.0
+
+    def __store(self, key, results):
+        self.__results[key] = (results, time.monotonic())
+        self.__results.move_to_end(key)
+        while len(self.__results) > self.max_entries:
+            self.__results.popitem(last=False)
+
+    async def __fetch(self, key, query: str):
+        started = time.perf_counter()
+        try:
+            results = await self.search(query)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.searches += 1
+            self.search_seconds += time.perf_counter() - started
+        self.__store(key, results)
+        return results
+
+    def __start_fetch(self, key, query: str):
+        task = self.__inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self.__fetch(key, query))
+            self.__inflight[key] = task
+            task.add_done_callback(lambda _: self.__inflight.pop(key, None))
+        return task
+
+    def __revalidate(self, key, query: str):
+        """古い結果を返している間に、バックグラウンドで検索し直す"""
+        task = self.__start_fetch(key, query)
+        # 失敗しても古い結果を使い続けるため、例外は読み捨てる
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def __call__(self, query: str):
+        key = (self.data_store_id, normalize_query(query))
+        entry = self.__results.get(key)
+        if entry is not None:
+            results, fetched_at = entry
+            age = time.monotonic() - fetched_at
+            if age < self.ttl:
+                self.hits += 1
+                self.__results.move_to_end(key)
+                return results
+            if age < self.ttl + self.stale:
+                self.stale_hits += 1
+                self.__results.move_to_end(key)
+                self.__revalidate(key, query)
+                return results
+            del self.__results[key]
+        self.misses += 1
+        return await asyncio.shield(self.__start_fetch(key, query))
+
+    def stats(self):
+        """キャッシュのヒット/ミス回数と、検索 API の平均レイテンシを返す"""
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+            "searches": self.searches,
+            "search_avg_ms": self.search_seconds * 1000 / self.searches if self.searches else 0.0,
+            "cached_queries": len(self.__results),
+        }
+
+
+# 生成した検索（/metrics で集計するため）: 名前 → キャッシュ付き検索またはローカル検索
+search_backends = {}
+
+
+def create_search_tool(data_store_id: str, name: str, description: str, mode: str = None):
+    """データストアを検索するツールを生成する
+
+    data_store_id: データストアのリソース名
+    name: 関数ツールとしてモデルに見せる名前（cached・local モードのみ）
+    description: 関数ツールの説明（cached・local モードのみ）
+    mode: 検索方法（省略時は環境変数 SEARCH_TOOL_MODE）
+    """
+    mode = mode or SEARCH_TOOL_MODE
+    if mode == "vertex":
+        return VertexAiSearchTool(data_store_id=data_store_id)
+    if mode == "cached":
+        backend = CachedSearch(DiscoveryEngineSearch(data_store_id), data_store_id)
+    elif mode == "local":
+        backend = LocalSearch(LOCAL_SEARCH_INDEX_DIR)
+    else:
+        raise ValueError(f"未対応の SEARCH_TOOL_MODE です: {mode}")
+    search_backends[name] = backend
+
+    async def search(query: str) -> dict:
+        try:
+            results = await backend(query)
+        except Exception as e:
+            return {"status": "error", "error_message": f"検索に失敗しました: {e}"}
+        return {"status": "success", "results": results}
+
+    search.__name__ = name
+    search.__doc__ = description
+    return FunctionTool(search)
+
+
+def search_stats():
+    """生成したすべての検索の統計を返す"""
+    return {name: backend.stats() for name, backend in search_backends.items()}
@@ -0,0 +1,7 @@
+"""外部サービスを使わずに音声対話の1ターンを計測するベンチマーク
+
+Speech-to-Text・Vertex AI・Model Armor・VoiceVox をローカルの疑似実装に差し替え、
+RealtimeTranscriptionStream → ZundaAgent → SpeechSynthesis の経路を実時間より速く実行する。
+
+    python -m benchmarks --sessions 4 --turns 10
+"""
@@ -0,0 +1,64 @@
+import sys
+import json
+import asyncio
+import argparse
+
+from benchmarks.fakes import default_utterances, load_utterances
+from benchmarks.harness import BenchmarkConfig, format_report, run_benchmark, summarize_results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="外部サービスを使わずに音声対話のターンレイテンシを計測する")
+    parser.add_argument("--fixtures", help="<名前>.wav と <名前>.txt（文字起こし結果）を置いたディレクトリ（省略時は疑似音声）")
+    parser.add_argument("--sessions", type=int, default=1, help="並行して実行する会話セッション数")
+    parser.add_argument("--turns", type=int, default=5, help="セッションごとのターン数")
+    parser.add_argument("--llm-first-token-ms", type=float, default=300, help="疑似モデルの最初のトークンまでの遅延")
+    parser.add_argument("--llm-token-ms", type=float, default=20, help="疑似モデルのチャンクごとの遅延")
+    parser.add_argument("--stt-final-ms", type=float, default=100, help="疑似 Speech-to-Text の確定結果の遅延")
+    parser.add_argument("--audio-query-ms", type=float, default=30, help="疑似 VoiceVox の audio_query の遅延")
+    parser.add_argument("--synthesis-ms", type=float, default=80, help="疑似 VoiceVox の synthesis の遅延")
+    parser.add_argument("--synthesis-ms-per-char", type=float, default=2, help="疑似 VoiceVox の synthesis の1文字あたりの遅延")
+    parser.add_argument("--fixed-endpointing", action="store_true", help="適応的エンドポイント判定を使わない")
+    parser.add_argument("--json", action="store_true", help="結果を JSON 形式で出力する")
+    parser.add_argument("--max-e2e-p90-ms", type=float, help="end_to_end の p90 がこの値を超えたら終了コード 1 を返す")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    utterances = load_utterances(args.fixtures) if args.fixtures else default_utterances()
+    if not utterances:
+        print("再生する発話がありません。")
+        return 1
+    config = BenchmarkConfig(
+        sessions=args.sessions,
+        turns=args.turns,
+        llm_first_token_latency=args.llm_first_token_ms / 1000,
+        llm_token_delay=args.llm_token_ms / 1000,
+        stt_final_latency=args.stt_final_ms / 1000,
+        audio_query_latency=args.audio_query_ms / 1000,
+        synthesis_latency=args.synthesis_ms / 1000,
+        synthesis_latency_per_char=args.synthesis_ms_per_char / 1000,
+        adaptive_endpointing=not args.fixed_endpointing,
+    )
+    results, elapsed = asyncio.run(run_benchmark(utterances, config))
+    summary, throughput = summarize_results(results, elapsed)
+    if args.json:
+        print(json.dumps({
+            "summary": summary,
+            "throughput": throughput,
+            "turns": [result.to_dict() for result in results],
+        }, ensure_ascii=False, indent=2))
+    else:
+        print(format_report(summary, throughput))
+
+    if args.max_e2e_p90_ms is not None:
+        p90 = summary.get("end_to_end", {}).get("p90")
+        if p90 is None or p90 > args.max_e2e_p90_ms:
+            print(f"end_to_end の p90 が上限（{args.max_e2e_p90_ms:.0f}ms）を超えました: {p90}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
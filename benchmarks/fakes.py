@@ -0,0 +1,354 @@
+import io
+import json
+import time
+import asyncio
+import datetime
+import threading
+from collections import deque
+from glob import glob
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+from scipy.io import wavfile
+from google.adk.agents import Agent
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.cloud import speech
+from google.genai import types
+
+from module.audio_capture import AudioSource
+from module.audio_source import SilencePadding, load_wav
+from module.realtime_transcription import SAMPLE_RATE, CHANNEL_NUMS
+
+
+BYTES_PER_SECOND = SAMPLE_RATE * CHANNEL_NUMS * 2
+# 合成する疑似音声の話速（文字/秒）と先頭の無音（秒）
+SYNTHETIC_CHARS_PER_SECOND = 7.0
+SYNTHETIC_LEADING_SILENCE = 0.3
+# 疑似 VoiceVox が返す音声の長さ（1文字あたりの秒数）とサンプリングレート
+VOICEVOX_SECONDS_PER_CHAR = 0.12
+VOICEVOX_SAMPLE_RATE = 24000
+# 発話の何割を受け取ったら疑似 Speech-to-Text が確定結果を返すか
+FINAL_PROGRESS = 0.9
+# 既定の発話（WAV の指定がない場合は合成した疑似音声を使う）
+DEFAULT_TRANSCRIPTS = [
+    "こんにちは",
+    "福岡でおすすめの屋台を教えて",
+    "市政だよりの最新情報を教えてほしいのだ",
+    "今日はどんな一日だったのかな",
+]
+# 台本にない質問への既定の応答
+DEFAULT_REPLY = "ずんだもんなのだ。{query}についてお話しするのだ。ちょっと調べてみたのだ。また何でも聞いてほしいのだ！"
+
+
+class Utterance:
+    """ベンチマークで再生する1回分の発話"""
+
+    def __init__(self, name: str, audio: np.ndarray, transcript: str, samplerate: int = SAMPLE_RATE):
+        """
+        name: 発話の名前（WAV のファイル名など）
+        audio: int16 モノラルの音声
+        transcript: 疑似 Speech-to-Text が返す文字起こし結果
+        """
+        self.name = name
+        self.audio = audio
+        self.transcript = transcript
+        self.samplerate = samplerate
+
+    @property
+    def seconds(self):
+        return len(self.audio) / self.samplerate
+
+
+def synthetic_utterance(name: str, transcript: str, samplerate: int = SAMPLE_RATE):
+    """文字数に応じた長さの有声音（倍音を持つ低い音を音節ごとに揺らしたもの）を合成する"""
+    duration = max(len(transcript) / SYNTHETIC_CHARS_PER_SECOND, 0.6)
+    t = np.arange(int(duration * samplerate)) / samplerate
+    voice = sum(np.sin(2 * np.pi * 140 * k * t) / k for k in range(1, 5))
+    envelope = 0.6 + 0.4 * np.sin(2 * np.pi * 5 * t)
+    voiced = (voice * envelope * 0.2 * 32767 / np.max(np.abs(voice))).astype(np.int16)
+    silence = np.zeros(int(SYNTHETIC_LEADING_SILENCE * samplerate), dtype=np.int16)
+    return Utterance(name, np.concatenate((silence, voiced)), transcript, samplerate)
+
+
+def default_utterances():
+    return [synthetic_utterance(f"synthetic_{i}", text) for i, text in enumerate(DEFAULT_TRANSCRIPTS)]
+
+
+def load_utterances(directory: str):
+    """ディレクトリ内の <名前>.wav と、文字起こし結果を書いた <名前>.txt を読み込む"""
+    utterances = []
+    for path in sorted(glob(str(Path(directory) / "*.wav"))):
+        wav_path = Path(path)
+        txt_path = wav_path.with_suffix(".txt")
+        if not txt_path.exists():
+            print(f"文字起こし結果のファイルがないためスキップします: {txt_path}")
+            continue
+        transcript = txt_path.read_text(encoding="utf-8").strip()
+        utterances.append(Utterance(wav_path.stem, load_wav(path, SAMPLE_RATE), transcript))
+    return utterances
+
+
+class ReplayCapture(AudioSource):
+    """発話をリングバッファへ流し込む疑似マイク入力
+
+    発話は一括で書き込んで実時間より速く処理させ、それ以外は実時間の速さで無音を流し続ける
+    （発話終了の判定は実時間の無音タイマーで行われるため）。
+    """
+
+    def __init__(self, samplerate: int = SAMPLE_RATE, channels: int = CHANNEL_NUMS):
+        super().__init__(samplerate, channels)
+        self.__silence_task = None
+
+    def start(self):
+        if self.__silence_task is None:
+            padding = SilencePadding(self)
+            self.__silence_task = asyncio.get_running_loop().create_task(padding.run(gap=0))
+
+    def stop(self):
+        if self.__silence_task is not None:
+            self.__silence_task.cancel()
+            self.__silence_task = None
+
+    def play(self, audio: np.ndarray):
+        """発話を一括で書き込み、書き込み終えた時刻（= 発話終了時刻, perf_counter）を返す"""
+        self.write(audio)
+        return time.perf_counter()
+
+
+def _recognize_response(transcript: str, is_final: bool, stability: float, end_seconds: float):
+    return speech.StreamingRecognizeResponse(
+        results=[
+            speech.StreamingRecognitionResult(
+                alternatives=[speech.SpeechRecognitionAlternative(transcript=transcript)],
+                is_final=is_final,
+                stability=stability,
+                result_end_time=datetime.timedelta(seconds=end_seconds),
+            )
+        ]
+    )
+
+
+class FakeSpeechClient:
+    """受け取った音声の量に応じて中間結果・確定結果を返す疑似 Speech-to-Text クライアント"""
+
+    def __init__(self, interim_interval: float = 0.5, final_latency: float = 0.1):
+        """
+        interim_interval: 中間結果を返す間隔（受け取った音声の秒数）
+        final_latency: 確定結果を返すまでの遅延（秒）
+        """
+        self.interim_interval = interim_interval
+        self.final_latency = final_latency
+        self.__utterances = deque()
+        self.streams = 0
+
+    def expect(self, utterance: Utterance):
+        """次のストリームで認識させる発話を登録する"""
+        self.__utterances.append(utterance)
+
+    async def streaming_recognize(self, requests):
+        utterance = self.__utterances.popleft() if self.__utterances else None
+        transcript = utterance.transcript if utterance else ""
+        expected_seconds = max(utterance.seconds if utterance else 0.0, 1e-3)
+        self.streams += 1
+        responses = asyncio.Queue()
+
+        async def final(received: float):
+            await asyncio.sleep(self.final_latency)
+            responses.put_nowait(_recognize_response(transcript, True, 1.0, received))
+
+        async def consume():
+            received = 0.0
+            next_interim = self.interim_interval
+            finalized = False
+            try:
+                async for request in requests:
+                    if not request.audio_content:
+                        continue
+                    received += len(request.audio_content) / BYTES_PER_SECOND
+                    if finalized:
+                        continue
+                    progress = min(received / expected_seconds, 1.0)
+                    if progress >= FINAL_PROGRESS:
+                        await final(received)
+                        finalized = True
+                    elif received >= next_interim:
+                        next_interim += self.interim_interval
+                        partial = transcript[:int(len(transcript) * progress)]
+                        responses.put_nowait(_recognize_response(partial, False, progress, received))
+                if not finalized:
+                    await final(received)
+            finally:
+                responses.put_nowait(None)
+
+        consumer = asyncio.create_task(consume())
+
+        async def iterate():
+            try:
+                while True:
+                    response = await responses.get()
+                    if response is None:
+                        break
+                    yield response
+            finally:
+                consumer.cancel()
+
+        return iterate()
+
+
+def _last_user_text(llm_request: LlmRequest):
+    """リクエストの最後のユーザー発話を取り出す"""
+    for content in reversed(llm_request.contents or []):
+        if content.role == "user" and content.parts:
+            text = "".join(part.text for part in content.parts if part.text)
+            if text:
+                return text
+    return ""
+
+
+class ScriptedLlm(BaseLlm):
+    """台本どおりの応答を一定の遅延で少しずつ返す疑似モデル（ADK の Runner からそのまま使える）"""
+
+    model: str = "scripted-fake"
+    # 質問 → 応答の台本（ない場合は DEFAULT_REPLY）
+    responses: dict[str, str] = {}
+    # 最初のトークンまでの遅延と、以降のチャンクごとの遅延（秒）
+    first_token_latency: float = 0.3
+    token_delay: float = 0.02
+    # 1チャンクの文字数
+    chunk_chars: int = 4
+
+    def reply_for(self, query: str):
+        return self.responses.get(query) or DEFAULT_REPLY.format(query=query)
+
+    async def generate_content_async(self, llm_request: LlmRequest, stream: bool = False):
+        reply = self.reply_for(_last_user_text(llm_request))
+        await asyncio.sleep(self.first_token_latency)
+        if stream:
+            for i in range(0, len(reply), self.chunk_chars):
+                if i:
+                    await asyncio.sleep(self.token_delay)
+                yield LlmResponse(
+                    content=types.Content(role="model", parts=[types.Part(text=reply[i:i + self.chunk_chars])]),
+                    partial=True,
+                )
+        else:
+            await asyncio.sleep(self.token_delay * (len(reply) // self.chunk_chars))
+        yield LlmResponse(
+            content=types.Content(role="model", parts=[types.Part(text=reply)]),
+            partial=False,
+            turn_complete=True,
+        )
+
+
+def create_benchmark_agent(llm: ScriptedLlm):
+    """疑似モデルで動くルートエージェントを生成する"""
+    return Agent(
+        name="zundamon_benchmark_agent",
+        model=llm,
+        description="ベンチマーク用のずんだもんエージェント",
+        instruction="あなたはずんだもんです。",
+    )
+
+
+def _silent_wav(seconds: float, samplerate: int = VOICEVOX_SAMPLE_RATE):
+    """指定の長さの小さな音の WAV バイナリを生成する"""
+    t = np.arange(int(seconds * samplerate)) / samplerate
+    data = (np.sin(2 * np.pi * 220 * t) * 1000).astype(np.int16)
+    buffer = io.BytesIO()
+    wavfile.write(buffer, samplerate, data)
+    return buffer.getvalue()
+
+
+class _VoiceVoxHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def __reply(self, status: int, content_type: str, body: bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        server = self.server
+        server.requests += 1
+        if url.path == "/audio_query":
+            time.sleep(server.audio_query_latency)
+            text = params.get("text", [""])[0]
+            query = {
+                "accent_phrases": [],
+                "speedScale": 1.0,
+                "pitchScale": 0.0,
+                "intonationScale": 1.0,
+                "volumeScale": 1.0,
+                "prePhonemeLength": 0.1,
+                "postPhonemeLength": 0.1,
+                "outputSamplingRate": VOICEVOX_SAMPLE_RATE,
+                "outputStereo": False,
+                "kana": text,
+            }
+            self.__reply(200, "application/json", json.dumps(query, ensure_ascii=False).encode("utf-8"))
+        elif url.path == "/synthesis":
+            kana = json.loads(body or b"{}").get("kana", "")
+            time.sleep(server.synthesis_latency + server.synthesis_latency_per_char * len(kana))
+            self.__reply(200, "audio/wav", _silent_wav(max(len(kana), 1) * VOICEVOX_SECONDS_PER_CHAR))
+        else:
+            self.__reply(404, "text/plain", b"not found")
+
+    def log_message(self, format, *args):
+        # リクエストごとのログは出さない
+        pass
+
+
+class LocalVoiceVoxServer(ThreadingHTTPServer):
+    """VoiceVox の audio_query / synthesis を模したローカル HTTP サーバ（遅延を設定できる）"""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        audio_query_latency: float = 0.03,
+        synthesis_latency: float = 0.08,
+        synthesis_latency_per_char: float = 0.002,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        """
+        audio_query_latency: audio_query の応答遅延（秒）
+        synthesis_latency: synthesis の応答遅延（秒）
+        synthesis_latency_per_char: synthesis の1文字あたりの追加遅延（秒）
+        port: 待ち受けるポート（0 の場合は空いているポート）
+        """
+        super().__init__((host, port), _VoiceVoxHandler)
+        self.audio_query_latency = audio_query_latency
+        self.synthesis_latency = synthesis_latency
+        self.synthesis_latency_per_char = synthesis_latency_per_char
+        self.requests = 0
+        self.__thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def audio_query_url(self):
+        return f"{self.base_url}/audio_query"
+
+    @property
+    def synthesis_url(self):
+        return f"{self.base_url}/synthesis"
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,194 @@
+import time
+import asyncio
+
+import numpy as np
+
+from module.model_armor_guard import FakeModelArmorBackend, ModelArmorGuard
+from module.realtime_transcription import RealtimeTranscriptionStream
+from module.speech_synthesis import SpeechSynthesis
+from module.tracing import PERCENTILES, format_summary
+from module.voicevox_client import VoiceVoxClient
+from module.zunda_agent import ZundaAgent
+from benchmarks.fakes import FakeSpeechClient, LocalVoiceVoxServer, ReplayCapture, ScriptedLlm, create_benchmark_agent
+
+
+# 文字起こしを開始してから発話を流し込むまでの待ち時間（読み出しカーソルの位置合わせを待つ）
+CAPTURE_SETTLE_SECONDS = 0.05
+# 集計する指標（ミリ秒）
+METRICS = ("stt", "agent_first_sentence", "tts_first_audio", "end_to_end", "turn")
+
+
+class TurnResult:
+    """1ターン分の計測結果（単位はミリ秒）"""
+
+    def __init__(self, session: int, query: str, audio_seconds: float):
+        self.session = session
+        self.query = query
+        self.audio_seconds = audio_seconds
+        self.sentences = 0
+        # 発話終了 → 文字起こし結果
+        self.stt = None
+        # 文字起こし結果 → 最初の文
+        self.agent_first_sentence = None
+        # 最初の文 → 最初の音声の準備完了（合成・Model Armor 判定済み）
+        self.tts_first_audio = None
+        # 発話終了 → 最初の音声の準備完了
+        self.end_to_end = None
+        # 発話終了 → 全文の合成完了
+        self.turn = None
+
+    def to_dict(self):
+        return {"session": self.session, "query": self.query, "sentences": self.sentences,
+                **{metric: getattr(self, metric) for metric in METRICS}}
+
+
+class BenchmarkConfig:
+    """ベンチマークの設定"""
+
+    def __init__(
+        self,
+        sessions: int = 1,
+        turns: int = 5,
+        llm_first_token_latency: float = 0.3,
+        llm_token_delay: float = 0.02,
+        stt_final_latency: float = 0.1,
+        audio_query_latency: float = 0.03,
+        synthesis_latency: float = 0.08,
+        synthesis_latency_per_char: float = 0.002,
+        adaptive_endpointing: bool = True,
+    ):
+        self.sessions = sessions
+        self.turns = turns
+        self.llm_first_token_latency = llm_first_token_latency
+        self.llm_token_delay = llm_token_delay
+        self.stt_final_latency = stt_final_latency
+        self.audio_query_latency = audio_query_latency
+        self.synthesis_latency = synthesis_latency
+        self.synthesis_latency_per_char = synthesis_latency_per_char
+        self.adaptive_endpointing = adaptive_endpointing
+
+
+def _ms(seconds: float):
+    return seconds * 1000
+
+
+async def _run_turn(result: TurnResult, speech_end: float, transcript: str, zunda: ZundaAgent, speech_instance: SpeechSynthesis):
+    """エージェントの応答を文単位で音声合成し、パイプラインと同じ順序で各時点を記録する"""
+    transcribed_at = time.perf_counter()
+    result.stt = _ms(transcribed_at - speech_end)
+    sentences = asyncio.Queue()
+
+    async def synthesize():
+        # SynthesisStage と同様に文を順に合成し、再生前と同じく判定結果を待つ
+        while (chunk := await sentences.get()) is not None:
+            audio_data = await speech_instance.synthesize(chunk.text)
+            allowed = await chunk.verdict if chunk.verdict is not None else True
+            if audio_data and allowed and result.end_to_end is None:
+                ready_at = time.perf_counter()
+                result.end_to_end = _ms(ready_at - speech_end)
+                result.tts_first_audio = _ms(ready_at - first_sentence_at)
+
+    synthesizer = asyncio.create_task(synthesize())
+    first_sentence_at = None
+    try:
+        async for chunk in zunda.stream_conversation(transcript):
+            if not chunk.is_sentence:
+                continue
+            if first_sentence_at is None:
+                first_sentence_at = time.perf_counter()
+                result.agent_first_sentence = _ms(first_sentence_at - transcribed_at)
+            result.sentences += 1
+            await sentences.put(chunk)
+    finally:
+        await sentences.put(None)
+        await synthesizer
+    result.turn = _ms(time.perf_counter() - speech_end)
+
+
+async def run_session(index: int, utterances, config: BenchmarkConfig, server: LocalVoiceVoxServer, llm: ScriptedLlm):
+    """1つの会話セッションで turns 回のターンを順に実行する"""
+    capture = ReplayCapture()
+    stt_client = FakeSpeechClient(final_latency=config.stt_final_latency)
+    transcriber = RealtimeTranscriptionStream(
+        capture=capture,
+        adaptive_endpointing=config.adaptive_endpointing,
+        speech_client=stt_client,
+    )
+    zunda = ZundaAgent(
+        user_id=f"benchmark_user_{index}",
+        session_id=f"benchmark_session_{index}",
+        guard=ModelArmorGuard(backend=FakeModelArmorBackend()),
+        root_agent=create_benchmark_agent(llm),
+    )
+    speech_instance = SpeechSynthesis(
+        client=VoiceVoxClient(server.audio_query_url, server.synthesis_url),
+        use_cache=False,
+    )
+    results = []
+    try:
+        for turn in range(config.turns):
+            utterance = utterances[(index + turn) % len(utterances)]
+            stt_client.expect(utterance)
+            transcription = asyncio.create_task(transcriber.realtime_transcribe())
+            await asyncio.sleep(CAPTURE_SETTLE_SECONDS)
+            speech_end = capture.play(utterance.audio)
+            transcript = await transcription
+            result = TurnResult(index, transcript, utterance.seconds)
+            await _run_turn(result, speech_end, transcript, zunda, speech_instance)
+            results.append(result)
+    finally:
+        capture.stop()
+        await speech_instance.close()
+    return results
+
+
+async def run_benchmark(utterances, config: BenchmarkConfig):
+    """sessions 個のセッションを並行して実行し、全ターンの結果と経過時間（秒）を返す"""
+    server = LocalVoiceVoxServer(
+        audio_query_latency=config.audio_query_latency,
+        synthesis_latency=config.synthesis_latency,
+        synthesis_latency_per_char=config.synthesis_latency_per_char,
+    ).start()
+    llm = ScriptedLlm(first_token_latency=config.llm_first_token_latency, token_delay=config.llm_token_delay)
+    started = time.perf_counter()
+    try:
+        sessions = await asyncio.gather(
+            *(run_session(i, utterances, config, server, llm) for i in range(config.sessions))
+        )
+    finally:
+        server.stop()
+    elapsed = time.perf_counter() - started
+    return [result for session in sessions for result in session], elapsed
+
+
+def summarize_results(results, elapsed: float):
+    """指標ごとのパーセンタイルとスループットを計算する"""
+    summary = {}
+    for metric in METRICS:
+        values = [getattr(result, metric) for result in results if getattr(result, metric) is not None]
+        if not values:
+            continue
+        summary[metric] = {"count": len(values)}
+        for p in PERCENTILES:
+            summary[metric][f"p{p}"] = float(np.percentile(values, p))
+    audio_seconds = sum(result.audio_seconds for result in results)
+    throughput = {
+        "turns": len(results),
+        "elapsed_seconds": elapsed,
+        "turns_per_second": len(results) / elapsed if elapsed else 0.0,
+        # 入力音声の長さに対する処理速度（1.0 より大きければ実時間より速い）
+        "realtime_factor": audio_seconds / elapsed if elapsed else 0.0,
+    }
+    return summary, throughput
+
+
+def format_report(summary, throughput):
+    """集計結果を表形式の文字列にする"""
+    lines = [
+        format_summary(summary),
+        "",
+        f"turns: {throughput['turns']}  elapsed: {throughput['elapsed_seconds']:.2f}s  "
+        f"throughput: {throughput['turns_per_second']:.2f} turns/s  "
+        f"realtime factor: {throughput['realtime_factor']:.2f}x",
+    ]
+    return "\n".join(lines)
@@ -1,5 +1,6 @@
-import time
+import os
 import asyncio
+import argparse
 
 import dotenv
 # 環境変数の読み込み
@@ -7,55 +8,54 @@ dotenv.load_dotenv()
 
 from module.speech_synthesis import SpeechSynthesis
 from module.zunda_agent import ZundaAgent
-from module.realtime_transcription import RealtimeTranscriptionStream
-
-
-# TODO: 一定時間がたったら、セッションを初期化する処理を追加する
-async def main(zunda_instance: ZundaAgent, transcript_instance: RealtimeTranscriptionStream, speech_instance: SpeechSynthesis):
-    # メイン処理の実装箇所
-    pre_user_input = ""
-    user_input = ""
-    while True:
-        print("音声入力を待機中...")
-        # TODO: 音声入力の取得間隔にコンマ秒だけ取得できない時間があるので調査
-        pre_user_input = await transcript_instance.realtime_transcribe()
-        if pre_user_input == "":
-            continue
-        print(f"✅ 音声入力: {pre_user_input}")
-        if not pre_user_input or len(pre_user_input) < 3: # 入力なしの場合
-            if user_input == "":
-                # 何も入力がない場合は、デフォルトのプロンプトを送信
-                pass# zunda_instance.send_query(default_prompt)
-            else:
-                # 前回、文章の終わりを検出できなかった場合の処理。ずんだもんエージェントにクエリを送信
-                agent_output = await zunda_instance.run_conversation(user_input)
-                speech_instance.play_speech(agent_output)
-                user_input = ""  # クエリ送信後はインプットをリセット
-        else:# 音声入力ありの場合、インプットを更新
-            user_input += pre_user_input
-        # 文章の終わりを検出したら、エージェントにクエリを送信
-        if True:
-            agent_output = await zunda_instance.run_conversation(user_input)
-            speech_instance.play_speech(agent_output)
-            user_input = ""
-        time.sleep(0.01)
+from module.transcription_service import TranscriptionService
+from module.voice_pipeline import build_voice_pipeline
 
 
-if __name__ == "__main__":
-    # 各インスタンスを生成
-    zunda_instance = ZundaAgent(user_id="test_user", session_id="test_session")
-    transcript_instance = RealtimeTranscriptionStream()
-    speech_instance = SpeechSynthesis()
+# この時間会話がなかった場合、次の会話の前にセッションを初期化する（秒）
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "1800"))
+
 
-    # メイン処理を実行
+async def main(zunda_instance: ZundaAgent, transcript_instance: TranscriptionService, speech_instance: SpeechSynthesis):
+    # 文字起こし・エージェント・音声合成・再生をそれぞれ独立したタスクとして並行実行する
+    pipeline = build_voice_pipeline(
+        zunda_instance=zunda_instance,
+        transcript_instance=transcript_instance,
+        speech_instance=speech_instance,
+    )
+    # リモートエージェントのエージェントカードを取得し、最初の発話の前からヘルスチェックを始める
+    await zunda_instance.start()
     try:
-        asyncio.run(
-            main(
-                zunda_instance = zunda_instance,
-                transcript_instance = transcript_instance,
-                speech_instance = speech_instance
-            )
-        )
-    except KeyboardInterrupt:
-        print("\nプログラムを終了しました。")
+        await pipeline.run()
+    finally:
+        await zunda_instance.close()
 
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ずんだもん音声チャットボット")
+    parser.add_argument("--server", action="store_true", help="複数セッションを受け付ける WebSocket サーバとして起動する")
+    parser.add_argument("--host", default="0.0.0.0", help="サーバの待ち受けアドレス")
+    parser.add_argument("--port", type=int, default=8765, help="サーバの待ち受けポート")
+    args = parser.parse_args()
+
+    if args.server:
+        # 複数のキオスクから WebSocket で音声を受け付ける（Starlette・uvicorn はサーバとして起動する場合だけ読み込む）
+        from module.voice_server import run_server
+        run_server(host=args.host, port=args.port, session_ttl=SESSION_TTL_SECONDS)
+    else:
+        # 各インスタンスを生成
+        zunda_instance = ZundaAgent(user_id="test_user", session_id="test_session", session_ttl=SESSION_TTL_SECONDS)
+        transcript_instance = TranscriptionService()
+        speech_instance = SpeechSynthesis()
+
+        # メイン処理を実行
+        try:
+            asyncio.run(
+                main(
+                    zunda_instance = zunda_instance,
+                    transcript_instance = transcript_instance,
+                    speech_instance = speech_instance
+                )
+            )
+        except KeyboardInterrupt:
+            print("\nプログラムを終了しました。")
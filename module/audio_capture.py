@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+
+# リングバッファに保持する音声の長さ（秒）
+RING_BUFFER_SECONDS = 30
+# 読み出し開始時に遡るプリロールの長さ（秒）。発話の頭が欠けないようにする
+DEFAULT_PREROLL_SECONDS = 0.3
+# 新しいデータを待つときのポーリング間隔（秒）
+POLL_INTERVAL = 0.01
+
+
+class AudioRingBuffer:
+    """事前確保した NumPy 配列によるリングバッファ
+
+    書き込みはオーディオスレッド1つだけが行い、読み出し側はそれぞれ独立したカーソルで読む。
+    書き込み位置は単調増加する総フレーム数で管理するため、ロックを使わずに
+    読み出し側が上書き（オーバーラン）を検出できる。
+    """
+
+    def __init__(self, capacity_frames: int, channels: int = 1, dtype=np.int16):
+        self.capacity = capacity_frames
+        self.channels = channels
+        self.__data = np.zeros((capacity_frames, channels), dtype=dtype)
+        # これまでに書き込まれた総フレーム数（書き込みスレッドのみが更新する）
+        self.write_pos = 0
+
+    def write(self, frames: np.ndarray):
+        """フレームを書き込む（オーディオスレッドから呼ばれる）"""
+        total = len(frames)
+        if total > self.capacity:
+            frames = frames[-self.capacity:]
+        n = len(frames)
+        start = (self.write_pos + total - n) % self.capacity
+        first = min(n, self.capacity - start)
+        self.__data[start:start + first] = frames[:first]
+        if first < n:
+            self.__data[:n - first] = frames[first:]
+        # データを書き終えてから書き込み位置を進める
+        self.write_pos += total
+
+    def read(self, start: int, end: int):
+        """総フレーム数で指定した範囲 [start, end) をコピーして返す"""
+        n = end - start
+        offset = start % self.capacity
+        first = min(n, self.capacity - offset)
+        if first == n:
+            return self.__data[offset:offset + n].copy()
+        return np.concatenate((self.__data[offset:], self.__data[:n - first]))
+
+    def reader(self, preroll_frames: int = 0):
+        """独立したカーソルを持つ読み出しオブジェクトを生成する"""
+        return RingBufferReader(self, preroll_frames)
+
+
+class RingBufferReader:
+    """リングバッファの読み出しカーソル"""
+
+    def __init__(self, ring: AudioRingBuffer, preroll_frames: int = 0):
+        self.__ring = ring
+        self.cursor = max(ring.write_pos - min(preroll_frames, ring.capacity), 0)
+        # 読み出しが追いつかず上書きされたフレーム数と回数
+        self.dropped_frames = 0
+        self.overruns = 0
+
+    def available(self):
+        """読み出し可能なフレーム数"""
+        return self.__ring.write_pos - self.cursor
+
+    def __skip_overrun(self, write_pos: int):
+        """上書きされてしまった範囲を読み飛ばす"""
+        oldest = write_pos - self.__ring.capacity
+        if self.cursor < oldest:
+            self.dropped_frames += oldest - self.cursor
+            self.overruns += 1
+            self.cursor = oldest
+
+    def read(self, max_frames: int = None):
+        """読み出し可能なフレームを返す（ない場合は空の配列）"""
+        write_pos = self.__ring.write_pos
+        self.__skip_overrun(write_pos)
+        end = write_pos
+        if max_frames is not None:
+            end = min(end, self.cursor + max_frames)
+        frames = self.__ring.read(self.cursor, end)
+        # コピー中に書き込みが追い越していないか確認する
+        oldest = self.__ring.write_pos - self.__ring.capacity
+        if self.cursor < oldest:
+            lost = oldest - self.cursor
+            self.dropped_frames += lost
+            self.overruns += 1
+            frames = frames[lost:]
+        self.cursor = end
+        return frames
+
+    async def read_async(self, min_frames: int = 1, max_frames: int = None):
+        """min_frames 以上のデータが溜まるまで待ってから読み出す"""
+        while self.available() < min_frames:
+            await asyncio.sleep(POLL_INTERVAL)
+        return self.read(max_frames)
+
+    def seek_latest(self, preroll_frames: int = 0):
+        """カーソルを最新位置（からプリロール分戻った位置）に移動する"""
+        write_pos = self.__ring.write_pos
+        self.cursor = max(write_pos - min(preroll_frames, self.__ring.capacity), 0)
+
+
+class AudioSource(ABC):
+    """リングバッファに int16 の音声を書き込む音声入力の基底クラス
+
+    文字起こし側は reader() で得た読み出しカーソルから読むため、VAD・キュー・リクエスト生成の処理は
+    入力元（マイク・ファイル・ソケットなど）に関係なく共通で使える。
+    """
+
+    def __init__(self, samplerate: int, channels: int = 1, buffer_seconds: float = RING_BUFFER_SECONDS):
+        """
+        samplerate: サンプリングレート
+        channels: チャンネル数
+        buffer_seconds: リングバッファに保持する秒数
+        """
+        self.samplerate = samplerate
+        self.channels = channels
+        self.ring = AudioRingBuffer(int(samplerate * buffer_seconds), channels, np.int16)
+        self.__readers = []
+
+    @abstractmethod
+    def start(self):
+        """入力を開始する（開始済みの場合は何もしない）"""
+
+    def stop(self):
+        """入力を停止する"""
+
+    def write(self, frames: np.ndarray):
+        """int16 のフレームをリングバッファに書き込む"""
+        self.ring.write(np.asarray(frames, dtype=np.int16).reshape(-1, self.channels))
+
+    def reader(self, preroll_seconds: float = DEFAULT_PREROLL_SECONDS):
+        """プリロール付きの読み出しカーソルを生成する"""
+        reader = self.ring.reader(int(self.samplerate * preroll_seconds))
+        self.__readers.append(reader)
+        return reader
+
+    def max_lag(self):
+        """最も遅れている読み出しカーソルの未読フレーム数"""
+        return max((reader.available() for reader in self.__readers), default=0)
+
+    def stats(self):
+        """取りこぼし・オーバーランの回数を返す"""
+        return {
+            "frames_captured": self.ring.write_pos,
+            "dropped_frames": sum(reader.dropped_frames for reader in self.__readers),
+            "overruns": sum(reader.overruns for reader in self.__readers),
+        }
+
+
+class MicrophoneCapture(AudioSource):
+    """プロセス全体で1つの InputStream を開き続け、リングバッファに書き込むマイク入力"""
+
+    def __init__(self, samplerate: int, channels: int = 1, buffer_seconds: float = RING_BUFFER_SECONDS):
+        super().__init__(samplerate, channels, buffer_seconds)
+        self.__stream = None
+        # デバイス側で発生した入力オーバーフローの回数
+        self.input_overflows = 0
+
+    def __callback(self, indata, frames, time, status):
+        """オーディオスレッドから呼ばれ、リングバッファに書き込む"""
+        if status:
+            if status.input_overflow:
+                self.input_overflows += 1
+            else:
+                print(f"Sounddevice status: {status}")
+        self.ring.write(indata)
+
+    def start(self):
+        """入力ストリームを開始する（開始済みの場合は何もしない）"""
+        if self.__stream is not None:
+            return
+        # オーディオデバイスのないサーバでも他の入力元を使えるよう、マイクを使う場合だけ読み込む
+        import sounddevice as sd
+        self.__stream = sd.InputStream(
+            samplerate=self.samplerate,
+            channels=self.channels,
+            dtype='int16',
+            callback=self.__callback,
+        )
+        self.__stream.start()
+        print("🎙️ マイク入力を開始しました。")
+
+    def stop(self):
+        """入力ストリームを閉じる"""
+        if self.__stream is not None:
+            self.__stream.stop()
+            self.__stream.close()
+            self.__stream = None
+
+    def stats(self):
+        return {"input_overflows": self.input_overflows, **super().stats()}
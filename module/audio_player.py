@@ -0,0 +1,187 @@
+import io
+import asyncio
+import threading
+from collections import deque
+from math import gcd
+
+import numpy as np
+from scipy.io import wavfile
+from scipy.signal import resample_poly
+
+
+# 再生ストリームのサンプリングレート（VoiceVox の既定出力に合わせる）
+PLAYBACK_SAMPLE_RATE = 24000
+PLAYBACK_CHANNELS = 1
+# 1回のコールバックで出力するフレーム数
+PLAYBACK_BLOCKSIZE = 1024
+# 再生待ちにできるクリップの最大数（これを超えると enqueue が待機する）
+MAX_QUEUED_CLIPS = 2
+
+
+def decode_wav(audio_data: bytes):
+    """WAV バイナリをメモリ上でデコードし、(サンプリングレート, float32 モノラル配列) を返す"""
+    samplerate, data = wavfile.read(io.BytesIO(audio_data))
+    if data.dtype == np.int16:
+        data = data.astype(np.float32) / 32768.0
+    elif data.dtype == np.int32:
+        data = data.astype(np.float32) / 2147483648.0
+    elif data.dtype == np.uint8:
+        data = (data.astype(np.float32) - 128.0) / 128.0
+    else:
+        data = data.astype(np.float32)
+    if data.ndim > 1:
+        # ステレオ等はモノラルにミックスダウン
+        data = data.mean(axis=1)
+    return samplerate, data
+
+
+def resample(data: np.ndarray, src_rate: int, dst_rate: int):
+    """サンプリングレートを変換する"""
+    if src_rate == dst_rate:
+        return data
+    divisor = gcd(src_rate, dst_rate)
+    return resample_poly(data, dst_rate // divisor, src_rate // divisor).astype(np.float32)
+
+
+class AudioPlayer:
+    """常駐の OutputStream を使ったノンブロッキング音声再生エンジン"""
+
+    def __init__(self, samplerate=PLAYBACK_SAMPLE_RATE, max_queued=MAX_QUEUED_CLIPS):
+        """
+        samplerate: 出力ストリームのサンプリングレート（固定）
+        max_queued: 再生待ちにできるクリップの最大数
+        """
+        self.samplerate = samplerate
+        self.max_queued = max_queued
+        self.__stream = None
+        self.__loop = None
+        # 再生待ちのクリップ（オーディオスレッドと共有するためロックで保護）
+        self.__clips = deque()
+        self.__position = 0
+        self.__lock = threading.Lock()
+        self.__drained_event = None
+        self.__space_event = None
+
+    def __ensure_started(self):
+        """初回呼び出し時に出力ストリームを開く"""
+        if self.__stream is not None:
+            return
+        self.__loop = asyncio.get_running_loop()
+        self.__drained_event = asyncio.Event()
+        self.__drained_event.set()
+        self.__space_event = asyncio.Event()
+        self.__space_event.set()
+        # 音声を端末で再生しないサーバでも使えるよう、再生する場合だけ読み込む
+        import sounddevice as sd
+        self.__stream = sd.OutputStream(
+            samplerate=self.samplerate,
+            channels=PLAYBACK_CHANNELS,
+            dtype='float32',
+            blocksize=PLAYBACK_BLOCKSIZE,
+            callback=self.__callback,
+        )
+        self.__stream.start()
+
+    def __callback(self, outdata, frames, time, status):
+        """オーディオスレッドから呼ばれ、再生待ちのクリップを出力バッファへ書き込む"""
+        if status:
+            print(f"Sounddevice status: {status}")
+        written = 0
+        finished_clip = False
+        callbacks = []
+        with self.__lock:
+            while written < frames and self.__clips:
+                clip, on_start, on_end = self.__clips[0]
+                if self.__position == 0 and on_start is not None:
+                    callbacks.append(on_start)
+                n = min(frames - written, len(clip) - self.__position)
+                outdata[written:written + n, 0] = clip[self.__position:self.__position + n]
+                written += n
+                self.__position += n
+                if self.__position >= len(clip):
+                    self.__clips.popleft()
+                    self.__position = 0
+                    finished_clip = True
+                    if on_end is not None:
+                        callbacks.append(on_end)
+            is_empty = not self.__clips
+        if written < frames:
+            outdata[written:] = 0
+        for callback in callbacks:
+            self.__loop.call_soon_threadsafe(callback)
+        if finished_clip:
+            self.__loop.call_soon_threadsafe(self.__on_clip_finished, is_empty)
+
+    def __on_clip_finished(self, is_empty: bool):
+        """イベントループ上でクリップ再生完了を通知する"""
+        with self.__lock:
+            queued = len(self.__clips)
+        if queued < self.max_queued:
+            self.__space_event.set()
+        if is_empty and queued == 0:
+            self.__drained_event.set()
+
+    async def enqueue(self, audio, on_start=None, on_end=None):
+        """音声を再生キューに追加する（再生完了は待たない）
+        audio: WAV バイナリ、または出力サンプリングレートの float32 配列
+        on_start: クリップの出力を開始した時点でイベントループ上から呼ばれる関数
+        on_end: クリップを出力し終えた時点（clear() で破棄された場合はその時点）でイベントループ上から呼ばれる関数
+        """
+        self.__ensure_started()
+        if isinstance(audio, (bytes, bytearray)):
+            # デコードとリサンプリングはイベントループを止めないよう別スレッドで行う
+            samplerate, data = await asyncio.to_thread(decode_wav, bytes(audio))
+            data = await asyncio.to_thread(resample, data, samplerate, self.samplerate)
+        else:
+            data = np.asarray(audio, dtype=np.float32)
+        if len(data) == 0:
+            return
+        # 再生待ちが上限に達している場合は空きが出るまで待つ
+        while True:
+            with self.__lock:
+                queued = len(self.__clips)
+            if queued < self.max_queued:
+                break
+            self.__space_event.clear()
+            await self.__space_event.wait()
+        with self.__lock:
+            self.__clips.append((data, on_start, on_end))
+            queued = len(self.__clips)
+        self.__drained_event.clear()
+        if queued >= self.max_queued:
+            self.__space_event.clear()
+
+    async def drained(self):
+        """再生待ちの音声がすべて再生し終わるまで待つ"""
+        if self.__stream is None:
+            return
+        await self.__drained_event.wait()
+        # 出力デバイス側のバッファ分だけ待ってから戻る
+        await asyncio.sleep(self.__stream.latency)
+
+    def clear(self):
+        """再生中・再生待ちの音声を破棄する"""
+        with self.__lock:
+            dropped = list(self.__clips)
+            self.__clips.clear()
+            self.__position = 0
+        if self.__drained_event is not None:
+            self.__drained_event.set()
+            self.__space_event.set()
+        for _, _, on_end in dropped:
+            if on_end is not None:
+                on_end()
+
+    @property
+    def is_playing(self):
+        """再生中かどうか"""
+        with self.__lock:
+            return bool(self.__clips)
+
+    def close(self):
+        """出力ストリームを閉じる"""
+        self.clear()
+        if self.__stream is not None:
+            self.__stream.stop()
+            self.__stream.close()
+            self.__stream = None
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import asyncio
+from math import gcd
+from pathlib import Path
+
+import numpy as np
+from scipy.io import wavfile
+from scipy.signal import resample_poly
+
+from module.audio_capture import POLL_INTERVAL, RING_BUFFER_SECONDS, AudioSource, MicrophoneCapture
+
+
+# 環境変数 AUDIO_SOURCE で音声入力を選ぶ
+#   mic（既定）        : マイク
+#   file:<パス>[@<倍速>] : WAV / 生 PCM ファイルの再生（倍速 0 は待ち時間なし）
+#   stdin             : 標準入力から届く生 PCM
+#   tcp:<ホスト>:<ポート> : TCP で受信する生 PCM
+AUDIO_SOURCE_ENV = "AUDIO_SOURCE"
+# ファイル再生・無音補完で1回に書き込む長さ（秒）
+BLOCK_SECONDS = 0.02
+# この時間データが届かなければ無音で埋める（発話終了の判定を実時間で進めるため、秒）
+GAP_SECONDS = 0.2
+# ストリームから1回に読み込むバイト数
+READ_SIZE = 4096
+
+
+def load_wav(path: str, samplerate: int):
+    """WAV ファイルを int16 モノラル・指定のサンプリングレートで読み込む"""
+    rate, data = wavfile.read(path)
+    if data.ndim > 1:
+        data = data.mean(axis=1)
+    if data.dtype != np.int16:
+        # 浮動小数点（-1.0〜1.0）またはその他の整数型を int16 に揃える
+        if np.issubdtype(data.dtype, np.floating):
+            data = data * 32767
+        else:
+            data = data.astype(np.float64) * 32767 / np.iinfo(data.dtype).max
+    if rate != samplerate:
+        divisor = gcd(rate, samplerate)
+        data = resample_poly(data.astype(np.float64), samplerate // divisor, rate // divisor)
+    return np.clip(data, -32768, 32767).astype(np.int16)
+
+
+class SilencePadding:
+    """データが途切れている間、実時間の速さで無音を書き込む（AudioSource と組み合わせて使う）"""
+
+    def __init__(self, source: AudioSource):
+        self.source = source
+        self.last_data_at = time.monotonic()
+
+    def touch(self):
+        """データが届いたことを記録する"""
+        self.last_data_at = time.monotonic()
+
+    async def run(self, gap: float = GAP_SECONDS):
+        block = np.zeros((int(self.source.samplerate * BLOCK_SECONDS), self.source.channels), dtype=np.int16)
+        next_at = time.monotonic()
+        while True:
+            if time.monotonic() - self.last_data_at >= gap:
+                self.source.write(block)
+                next_at += BLOCK_SECONDS
+            else:
+                next_at = time.monotonic() + BLOCK_SECONDS
+            await asyncio.sleep(max(next_at - time.monotonic(), 0))
+
+
+class FileSource(AudioSource):
+    """WAV または生 PCM（int16 リトルエンディアン）ファイルを再生する音声入力
+
+    speed=1.0 で実時間、2.0 で2倍速、0 で待ち時間なし（読み出しが追いつくのを待ちながら書き込む）。
+    再生し終えた後は無音を流し続けるため、最後の発話の終了も通常どおり判定される。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        samplerate: int,
+        channels: int = 1,
+        speed: float = 1.0,
+        loop: bool = False,
+        pad_silence: bool = True,
+        buffer_seconds: float = RING_BUFFER_SECONDS,
+    ):
+        """
+        path: WAV ファイル（.wav）または生 PCM ファイル（それ以外の拡張子。samplerate・channels で解釈する）
+        speed: 再生速度（実時間の何倍か。0 の場合は待ち時間なし）
+        loop: True の場合は繰り返し再生する
+        pad_silence: True の場合は再生後に無音を流し続ける
+        """
+        super().__init__(samplerate, channels, buffer_seconds)
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self.pad_silence = pad_silence
+        # 最後まで書き込んだら set される
+        self.finished = asyncio.Event()
+        self.__task = None
+
+    def __load(self):
+        if Path(self.path).suffix.lower() == ".wav":
+            return load_wav(self.path, self.samplerate).reshape(-1, 1).repeat(self.channels, axis=1)
+        data = np.fromfile(self.path, dtype="<i2")
+        return data[:len(data) // self.channels * self.channels].reshape(-1, self.channels)
+
+    async def __run(self):
+        data = await asyncio.to_thread(self.__load)
+        block = int(self.samplerate * BLOCK_SECONDS)
+        started = time.monotonic()
+        written = 0
+        while True:
+            for offset in range(0, len(data), block):
+                if self.speed:
+                    # 実時間の speed 倍の速さで書き込む
+                    delay = started + written / self.samplerate / self.speed - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                else:
+                    # 読み出しが追いつくまで待つ（未読のデータを上書きしない）
+                    while self.max_lag() > self.ring.capacity // 2:
+                        await asyncio.sleep(POLL_INTERVAL)
+                    await asyncio.sleep(0)
+                frames = data[offset:offset + block]
+                self.write(frames)
+                written += len(frames)
+            if not self.loop:
+                break
+        self.finished.set()
+        if self.pad_silence:
+            padding = SilencePadding(self)
+            await padding.run(gap=0)
+
+    def start(self):
+        if self.__task is None:
+            self.__task = asyncio.get_running_loop().create_task(self.__run())
+
+    def stop(self):
+        if self.__task is not None:
+            self.__task.cancel()
+            self.__task = None
+
+
+class PcmStreamSource(AudioSource):
+    """ソケット・標準入力・feed() で届く生 PCM（int16 リトルエンディアン）の音声入力
+
+    host・port を指定すると TCP で待ち受け、use_stdin=True の場合は標準入力から読む。
+    どちらも指定しない場合は feed() で渡されたデータだけを書き込む（WebSocket サーバなどから使う）。
+    データが途切れている間は無音で埋めるため、送信側が発話中だけ送る場合も発話終了を判定できる。
+    """
+
+    def __init__(
+        self,
+        samplerate: int,
+        channels: int = 1,
+        host: str = None,
+        port: int = None,
+        use_stdin: bool = False,
+        buffer_seconds: float = RING_BUFFER_SECONDS,
+    ):
+        super().__init__(samplerate, channels, buffer_seconds)
+        self.host = host
+        self.port = port
+        self.use_stdin = use_stdin
+        self.__remainder = b""
+        self.__padding = SilencePadding(self)
+        self.__tasks = []
+        self.__server = None
+        self.connections = 0
+
+    def feed(self, data: bytes):
+        """生 PCM のバイト列を書き込む（フレームの途中で切れた分は次回に持ち越す）"""
+        data = self.__remainder + data
+        frame_bytes = 2 * self.channels
+        usable = len(data) // frame_bytes * frame_bytes
+        self.__remainder = data[usable:]
+        if usable:
+            self.write(np.frombuffer(data[:usable], dtype="<i2"))
+            self.__padding.touch()
+
+    async def __read_stream(self, reader: asyncio.StreamReader):
+        while chunk := await reader.read(READ_SIZE):
+            self.feed(chunk)
+        self.__remainder = b""
+
+    async def __handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        print(f"🎙️ 音声の送信元が接続しました: {writer.get_extra_info('peername')}")
+        try:
+            await self.__read_stream(reader)
+        finally:
+            writer.close()
+
+    async def __serve(self):
+        self.__server = await asyncio.start_server(self.__handle_client, self.host, self.port)
+        print(f"🎙️ PCM の受信を開始しました: {self.host}:{self.port}")
+        async with self.__server:
+            await self.__server.serve_forever()
+
+    async def __read_stdin(self):
+        reader = asyncio.StreamReader()
+        loop = asyncio.get_running_loop()
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin.buffer)
+        await self.__read_stream(reader)
+
+    def start(self):
+        if self.__tasks:
+            return
+        loop = asyncio.get_running_loop()
+        self.__tasks.append(loop.create_task(self.__padding.run()))
+        if self.port is not None:
+            self.__tasks.append(loop.create_task(self.__serve()))
+        elif self.use_stdin:
+            self.__tasks.append(loop.create_task(self.__read_stdin()))
+
+    def stop(self):
+        for task in self.__tasks:
+            task.cancel()
+        self.__tasks = []
+        if self.__server is not None:
+            self.__server.close()
+            self.__server = None
+
+
+def create_audio_source(samplerate: int, channels: int = 1, spec: str = None):
+    """環境変数 AUDIO_SOURCE（または spec）に応じて音声入力を生成する"""
+    spec = spec or os.getenv(AUDIO_SOURCE_ENV, "mic")
+    kind, _, value = spec.partition(":")
+    if kind == "mic":
+        return MicrophoneCapture(samplerate, channels)
+    if kind == "file":
+        path, _, speed = value.rpartition("@") if "@" in value else (value, "", "")
+        return FileSource(path, samplerate, channels, speed=float(speed) if speed else 1.0)
+    if kind == "stdin":
+        return PcmStreamSource(samplerate, channels, use_stdin=True)
+    if kind == "tcp":
+        host, _, port = value.rpartition(":")
+        return PcmStreamSource(samplerate, channels, host=host or "0.0.0.0", port=int(port))
+    raise ValueError(f"不明な音声入力です: {spec}")
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+import numpy as np
+
+
+# 発話終了とみなす無音時間の下限・上限（秒）
+MIN_SILENCE_SECONDS = 0.25
+MAX_SILENCE_SECONDS = 1.2
+# 話速（文字/秒）から無音タイマーを決める係数。およそこの文字数を話す時間だけ待つ
+SILENCE_CHARS = 4.0
+# 話速の初期値（文字/秒）と平滑化係数
+DEFAULT_SPEAKING_RATE = 7.0
+SPEAKING_RATE_SMOOTHING = 0.3
+# 中間結果の安定度がこの値以上なら、発話が言い切られたとみなして待ち時間を短縮する
+STABILITY_THRESHOLD = 0.8
+STABLE_SILENCE_FACTOR = 0.5
+# 計測した発話終了遅延の保持件数
+MAX_DELAY_HISTORY = 200
+
+
+class AdaptiveEndpointer:
+    """認識器の中間結果（安定度・確定フラグ）と話速に応じた無音タイマーで発話終了を判定する"""
+
+    def __init__(
+        self,
+        min_silence: float = MIN_SILENCE_SECONDS,
+        max_silence: float = MAX_SILENCE_SECONDS,
+        stability_threshold: float = STABILITY_THRESHOLD,
+    ):
+        self.min_silence = min_silence
+        self.max_silence = max_silence
+        self.stability_threshold = stability_threshold
+        # 話速の推定値（文字/秒）
+        self.speaking_rate = DEFAULT_SPEAKING_RATE
+        # 発話終了の判定にかかった遅延（最後の発話フレームから判定まで、秒）
+        self.delays = []
+        self.reset()
+
+    def reset(self):
+        """ターンごとの状態を初期化する"""
+        self.__speech_started_at = None
+        self.__last_speech_at = None
+        self.__text = ""
+        self.__is_final = False
+        self.__stability = 0.0
+        self.__ended = False
+
+    @property
+    def last_speech_at(self):
+        """最後に発話と判定した時刻（time.monotonic() の値。未検出の場合は None）"""
+        return self.__last_speech_at
+
+    def on_vad(self, is_speech: bool, now: float = None):
+        """VAD の判定結果を通知する"""
+        if not is_speech:
+            return
+        now = time.monotonic() if now is None else now
+        if self.__speech_started_at is None:
+            self.__speech_started_at = now
+        self.__last_speech_at = now
+        # 話し続けている間は確定扱いを解除する
+        self.__is_final = False
+
+    def on_interim(self, transcript: str, stability: float):
+        """認識器の中間結果を通知する"""
+        self.__text = transcript
+        self.__stability = stability
+        self.__is_final = False
+
+    def on_final(self, transcript: str):
+        """認識器の確定結果を通知する"""
+        self.__text = transcript
+        self.__is_final = True
+        self.__update_speaking_rate(transcript)
+
+    def __update_speaking_rate(self, transcript: str):
+        """確定結果の文字数と発話時間から話速を更新する"""
+        if self.__speech_started_at is None or self.__last_speech_at is None:
+            return
+        duration = self.__last_speech_at - self.__speech_started_at
+        chars = len("".join(transcript.split()))
+        if duration < 0.3 or chars == 0:
+            return
+        rate = chars / duration
+        self.speaking_rate += SPEAKING_RATE_SMOOTHING * (rate - self.speaking_rate)
+
+    def silence_timeout(self):
+        """現在の状態で発話終了とみなすまでの無音時間（秒）"""
+        if self.__is_final:
+            return self.min_silence
+        timeout = SILENCE_CHARS / max(self.speaking_rate, 1e-3)
+        if self.__stability >= self.stability_threshold:
+            timeout *= STABLE_SILENCE_FACTOR
+        return float(np.clip(timeout, self.min_silence, self.max_silence))
+
+    def should_end(self, now: float = None):
+        """発話終了と判定できるかどうか。判定した時点で遅延を記録する"""
+        if self.__ended or self.__last_speech_at is None:
+            return self.__ended
+        if not self.__text:
+            # 認識結果がまだない場合は上限まで待つ
+            timeout = self.max_silence
+        else:
+            timeout = self.silence_timeout()
+        now = time.monotonic() if now is None else now
+        if now - self.__last_speech_at < timeout:
+            return False
+        self.__ended = True
+        self.delays.append(now - self.__last_speech_at)
+        del self.delays[:-MAX_DELAY_HISTORY]
+        print(f"⏱️ 発話終了を検出しました（遅延: {self.delays[-1] * 1000:.0f}ms, 話速: {self.speaking_rate:.1f}文字/秒）")
+        return True
+
+    def stats(self):
+        """発話終了遅延の統計（秒）を返す"""
+        if not self.delays:
+            return {"turns": 0}
+        delays = np.array(self.delays)
+        return {
+            "turns": len(delays),
+            "last": float(delays[-1]),
+            "mean": float(delays.mean()),
+            "p50": float(np.percentile(delays, 50)),
+            "p90": float(np.percentile(delays, 90)),
+            "speaking_rate": self.speaking_rate,
+        }
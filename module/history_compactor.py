@@ -0,0 +1,213 @@
+import os
+import hashlib
+import asyncio
+from collections import OrderedDict
+
+from google import genai
+from google.genai import types
+
+from module.tracing import get_tracer
+
+
+# 履歴の圧縮を始める目安（概算トークン数・ターン数）。環境変数で変更できる
+MAX_HISTORY_TOKENS = int(os.getenv("HISTORY_MAX_TOKENS", "3000"))
+MAX_HISTORY_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "20"))
+# 要約せずにそのまま残す直近のターン数
+KEEP_RECENT_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "6"))
+# 要約に使うモデル
+SUMMARY_MODEL = os.getenv("HISTORY_SUMMARY_MODEL", "gemini-2.5-flash")
+# トークン数の概算に使う1トークンあたりの文字数（日本語の会話を想定した目安）
+CHARS_PER_TOKEN = 1.5
+# 保持する要約の最大件数
+MAX_CACHED_SUMMARIES = 256
+SUMMARY_HEADER = "【これまでの会話の要約】"
+SUMMARY_PROMPT = (
+    "以下はユーザーとずんだもんの会話です。今後の会話に必要な情報（ユーザーの名前や好み、話題、約束したこと、"
+    "調べた結果など）を漏らさず、300文字以内の日本語で要約してください。\n"
+    "{previous}"
+    "【会話】\n{conversation}"
+)
+
+
+def estimate_tokens(contents):
+    """リクエストの内容からトークン数を概算する"""
+    chars = 0
+    for content in contents:
+        for part in content.parts or []:
+            if part.text:
+                chars += len(part.text)
+            elif part.function_call is not None:
+                chars += len(str(part.function_call.args or {})) + len(part.function_call.name or "")
+            elif part.function_response is not None:
+                chars += len(str(part.function_response.response or {}))
+    return int(chars / CHARS_PER_TOKEN)
+
+
+def split_turns(contents):
+    """ユーザーの発話（テキスト）から始まるターンごとに分割する"""
+    turns = []
+    for content in contents:
+        parts = content.parts or []
+        starts_turn = (
+            content.role == "user"
+            and any(part.text for part in parts)
+            and not any(part.function_response is not None for part in parts)
+        )
+        if starts_turn or not turns:
+            turns.append([])
+        turns[-1].append(content)
+    return turns
+
+
+def render_turn(turn):
+    """ターンを要約用のテキストにする（関数呼び出しは省く）"""
+    lines = []
+    for content in turn:
+        text = "".join(part.text for part in content.parts or [] if part.text)
+        if text:
+            speaker = "ユーザー" if content.role == "user" else "ずんだもん"
+            lines.append(f"{speaker}: {text}")
+    return "\n".join(lines)
+
+
+class GeminiSummarizer:
+    """Vertex AI の Gemini で会話を要約する"""
+
+    def __init__(self, model: str = SUMMARY_MODEL):
+        self.model = model
+        self.__client = None
+
+    async def __call__(self, previous_summary: str, conversation: str) -> str:
+        if self.__client is None:
+            self.__client = genai.Client(
+                vertexai=True,
+                project=os.environ.get("GOOGLE_CLOUD_PROJECT"),
+                location=os.environ.get("GOOGLE_CLOUD_REGION", "asia-northeast1"),
+            )
+        previous = f"【これまでの要約】\n{previous_summary}\n" if previous_summary else ""
+        response = await self.__client.aio.models.generate_content(
+            model=self.model,
+            contents=SUMMARY_PROMPT.format(previous=previous, conversation=conversation),
+        )
+        return (response.text or "").strip()
+
+
+class HistoryCompactor:
+    """長くなった会話履歴の古いターンを要約に置き換え、モデルに渡すプロンプトを一定の大きさに抑える
+
+    before_model_callback としてエージェントに設定する。履歴が上限を超えると、直近のターンを残して
+    古いターンの要約をバックグラウンドで作成し、以降のリクエストではその要約に置き換える
+    （要約の作成を待たないため、応答の遅延にはならない）。セッションに保存された履歴自体は変更しない。
+    """
+
+    def __init__(
+        self,
+        summarizer=None,
+        max_tokens: int = MAX_HISTORY_TOKENS,
+        max_turns: int = MAX_HISTORY_TURNS,
+        keep_turns: int = KEEP_RECENT_TURNS,
+        max_summaries: int = MAX_CACHED_SUMMARIES,
+    ):
+        """
+        summarizer: (これまでの要約, 会話テキスト) から要約を返す非同期関数（省略時は Gemini）
+        max_tokens: この概算トークン数を超えたら圧縮する
+        max_turns: このターン数を超えたら圧縮する
+        keep_turns: 要約せずに残す直近のターン数
+        """
+        self.summarizer = summarizer or GeminiSummarizer()
+        self.max_tokens = max_tokens
+        self.max_turns = max_turns
+        self.keep_turns = keep_turns
+        self.max_summaries = max_summaries
+        # 先頭からのターン列の指紋 → そのターン列の要約
+        self.__summaries = OrderedDict()
+        self.__inflight = {}
+        self.requests = 0
+        self.compactions = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+
+    @staticmethod
+    def __fingerprints(turns):
+        """先頭から i+1 ターン分の履歴の指紋を順に返す"""
+        digest = b""
+        fingerprints = []
+        for turn in turns:
+            digest = hashlib.sha256(digest + render_turn(turn).encode("utf-8")).digest()
+            fingerprints.append(digest.hex())
+        return fingerprints
+
+    def __cached_prefix(self, fingerprints, limit: int):
+        """limit ターン以内で、要約済みの最も長い先頭ターン数と要約を返す"""
+        for k in range(limit, 0, -1):
+            summary = self.__summaries.get(fingerprints[k - 1])
+            if summary is not None:
+                self.__summaries.move_to_end(fingerprints[k - 1])
+                return k, summary
+        return 0, ""
+
+    def __store(self, fingerprint: str, summary: str):
+        self.__summaries[fingerprint] = summary
+        self.__summaries.move_to_end(fingerprint)
+        while len(self.__summaries) > self.max_summaries:
+            self.__summaries.popitem(last=False)
+
+    async def __summarize(self, fingerprint: str, previous_summary: str, conversation: str):
+        try:
+            summary = await self.summarizer(previous_summary, conversation)
+        except Exception as e:
+            print(f"会話履歴の要約に失敗しました: {e}")
+            return
+        if summary:
+            self.__store(fingerprint, summary)
+
+    def __schedule(self, key: str, fingerprint: str, previous_summary: str, turns):
+        """要約の作成をバックグラウンドで開始する（同じ要約から伸ばす作成は同時に1つだけ）"""
+        if key in self.__inflight or fingerprint in self.__summaries:
+            return
+        conversation = "\n".join(render_turn(turn) for turn in turns)
+        task = asyncio.get_running_loop().create_task(self.__summarize(fingerprint, previous_summary, conversation))
+        self.__inflight[key] = task
+        task.add_done_callback(lambda _: self.__inflight.pop(key, None))
+
+    def before_model_callback(self, callback_context, llm_request):
+        """モデル呼び出しの直前に、古いターンを要約に置き換える"""
+        self.requests += 1
+        contents = llm_request.contents or []
+        turns = split_turns(contents)
+        before = estimate_tokens(contents)
+        if before <= self.max_tokens and len(turns) <= self.max_turns:
+            return None
+        older = max(len(turns) - self.keep_turns, 0)
+        if older == 0:
+            return None
+        fingerprints = self.__fingerprints(turns)
+        k, summary = self.__cached_prefix(fingerprints, older)
+        if k < older:
+            # 要約済みの範囲より古いターンが増えた分を、既存の要約に追記する形で要約し直す
+            key = fingerprints[k - 1] if k else f"start:{fingerprints[0]}"
+            self.__schedule(key, fingerprints[older - 1], summary, turns[k:older])
+        if k == 0:
+            return None
+
+        summary_content = types.Content(role="user", parts=[types.Part(text=f"{SUMMARY_HEADER}\n{summary}")])
+        llm_request.contents = [summary_content] + [content for turn in turns[k:] for content in turn]
+        after = estimate_tokens(llm_request.contents)
+        self.compactions += 1
+        self.tokens_before += before
+        self.tokens_after += after
+        get_tracer().event("history.compaction", tokens_before=before, tokens_after=after, summarized_turns=k)
+        print(f"📝 会話履歴を圧縮しました: {before} → {after} トークン（概算, {k}ターンを要約）")
+        return None
+
+    def stats(self):
+        """圧縮の回数と、圧縮したリクエストのプロンプトの大きさ（概算トークン数）の合計を返す"""
+        return {
+            "requests": self.requests,
+            "compactions": self.compactions,
+            "tokens_before": self.tokens_before,
+            "tokens_after": self.tokens_after,
+            "reduction": 1 - self.tokens_after / self.tokens_before if self.tokens_before else 0.0,
+            "cached_summaries": len(self.__summaries),
+            "summarizing": len(self.__inflight),
+        }
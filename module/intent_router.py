@@ -0,0 +1,282 @@
+import os
+import time
+import asyncio
+import unicodedata
+from collections import Counter
+
+import httpx
+from google.adk.models import LlmResponse
+from google.genai import types
+
+from module.tracing import get_tracer
+
+
+# サブエージェントに直接振り分けるスコアの下限と、2番目の候補との差の下限
+ROUTE_THRESHOLD = float(os.getenv("ROUTER_ROUTE_THRESHOLD", "0.5"))
+ROUTE_MARGIN = float(os.getenv("ROUTER_ROUTE_MARGIN", "0.2"))
+# すべてのサブエージェントのスコアがこれ未満なら雑談として扱う
+CHITCHAT_THRESHOLD = float(os.getenv("ROUTER_CHITCHAT_THRESHOLD", "0.15"))
+# タグが1つ一致するごとに加えるスコア
+TAG_SCORE = 0.6
+# 文字 n-gram の長さ
+NGRAM = 2
+# 雑談のときの思考トークンの上限（振り分けを考える必要がないため、思考を省いて応答を早める）
+CHITCHAT_THINKING_BUDGET = 0
+# 振り分けの LLM 呼び出しの所要時間（ミリ秒）を実測するまでの見積もり
+DEFAULT_DELEGATION_MS = 800.0
+# 所要時間の移動平均の重み
+DELEGATION_EMA_ALPHA = 0.2
+# 所要時間を計測中のリクエストの上限
+MAX_PENDING = 256
+# エージェントカードの取得のタイムアウト（秒）
+CARD_TIMEOUT = 10.0
+TRANSFER_FUNCTION = "transfer_to_agent"
+
+ROUTE_AGENT = "agent"
+ROUTE_CHITCHAT = "chitchat"
+ROUTE_LLM = "llm"
+
+
+def normalize(text: str):
+    return unicodedata.normalize("NFKC", text).casefold()
+
+
+def char_ngrams(text: str, n: int = NGRAM):
+    """空白・句読点・記号を除いた文字 n-gram の出現回数"""
+    chars = "".join(
+        char for char in normalize(text)
+        if not char.isspace() and unicodedata.category(char)[0] not in ("P", "S")
+    )
+    if len(chars) < n:
+        return Counter([chars]) if chars else Counter()
+    return Counter(chars[i:i + n] for i in range(len(chars) - n + 1))
+
+
+def cosine(a: Counter, b: Counter):
+    if not a or not b:
+        return 0.0
+    dot = sum(count * b[gram] for gram, count in a.items() if gram in b)
+    norm = sum(v * v for v in a.values()) ** 0.5 * sum(v * v for v in b.values()) ** 0.5
+    return dot / norm
+
+
+class AgentProfile:
+    """サブエージェントが公開しているスキルのタグ・例文"""
+
+    def __init__(self, agent_name: str, tags, examples):
+        self.agent_name = agent_name
+        self.tags = {normalize(tag) for tag in tags if len(tag) >= 2}
+        self.examples = [char_ngrams(example) for example in examples]
+
+    @classmethod
+    def from_card(cls, agent_name: str, card: dict):
+        """エージェントカード（JSON）の skills からプロファイルを作る"""
+        tags, examples = [], []
+        for skill in card.get("skills", []):
+            tags.extend(skill.get("tags") or [])
+            examples.extend(skill.get("examples") or [])
+        return cls(agent_name, tags, examples)
+
+
+class RouteDecision:
+    """1発話の振り分け結果"""
+
+    def __init__(self, route: str, agent_name: str = None, score: float = 0.0, scores: dict = None):
+        """
+        route: "agent"（サブエージェントへ直接）・"chitchat"（雑談）・"llm"（LLM に任せる）
+        agent_name: route が "agent" の場合の振り分け先
+        score: 最も高いスコア
+        scores: サブエージェントごとのスコア
+        """
+        self.route = route
+        self.agent_name = agent_name
+        self.score = score
+        self.scores = scores or {}
+
+
+class IntentRouter:
+    """発話をサブエージェントのスキル（タグ・例文）と照合し、LLM による振り分けを省く
+
+    ルートエージェントの before_model_callback として使う。確信度が高い場合は、モデルを呼ばずに
+    transfer_to_agent の呼び出しを返してサブエージェントへ直接渡すか、関数呼び出しと思考を止めて
+    雑談として応答させる。判断がつかない場合はこれまでどおり LLM に振り分けを任せる。
+    """
+
+    def __init__(
+        self,
+        agent_cards: dict = None,
+        profiles=None,
+        route_threshold: float = ROUTE_THRESHOLD,
+        route_margin: float = ROUTE_MARGIN,
+        chitchat_threshold: float = CHITCHAT_THRESHOLD,
+        is_available=None,
+    ):
+        """
+        agent_cards: サブエージェント名 → エージェントカードの URL（初回の振り分けの際にバックグラウンドで取得する）
+        profiles: 取得済みのプロファイルのリスト（エージェントカードを取得しない場合に指定する）
+        is_available: エージェント名を受け取り、利用できるかを返す関数（利用できないエージェントには直接振り分けない）
+        """
+        self.agent_cards = agent_cards or {}
+        self.route_threshold = route_threshold
+        self.route_margin = route_margin
+        self.chitchat_threshold = chitchat_threshold
+        self.is_available = is_available
+        self.__profiles = {}
+        self.__shared_tags = set()
+        self.__loading = None
+        if profiles:
+            self.set_profiles(profiles)
+        # invocation_id → LLM に振り分けを任せたリクエストの開始時刻
+        self.__pending = {}
+        self.delegation_ms = DEFAULT_DELEGATION_MS
+        self.decisions = Counter()
+        self.saved_ms = 0.0
+
+    @property
+    def ready(self):
+        return bool(self.__profiles)
+
+    def set_profiles(self, profiles):
+        self.__profiles = {profile.agent_name: profile for profile in profiles}
+        # 複数のエージェントが持つタグ（「福岡」「観光」など）は振り分けの根拠にしない
+        counts = Counter(tag for profile in profiles for tag in profile.tags)
+        self.__shared_tags = {tag for tag, count in counts.items() if count > 1}
+
+    async def load_cards(self, client: httpx.AsyncClient = None):
+        """エージェントカードを取得してプロファイルを作る（取得できなかったエージェントには振り分けない）"""
+        profiles = []
+        http = client or httpx.AsyncClient(timeout=CARD_TIMEOUT)
+        try:
+            for agent_name, url in self.agent_cards.items():
+                try:
+                    response = await http.get(url)
+                    response.raise_for_status()
+                    profiles.append(AgentProfile.from_card(agent_name, response.json()))
+                except Exception as e:
+                    print(f"エージェントカードの取得に失敗しました（{agent_name}）: {e}")
+        finally:
+            if client is None:
+                await http.aclose()
+        if profiles:
+            self.set_profiles(profiles)
+
+    def __ensure_loading(self):
+        """エージェントカードの取得をバックグラウンドで開始する（取得するまでは LLM に任せる）"""
+        if self.ready or not self.agent_cards:
+            return
+        if self.__loading is None or (self.__loading.done() and not self.ready):
+            self.__loading = asyncio.get_running_loop().create_task(self.load_cards())
+
+    def classify(self, text: str):
+        """発話を振り分ける"""
+        grams = char_ngrams(text)
+        normalized = normalize(text)
+        scores = {}
+        generic = False
+        for name, profile in self.__profiles.items():
+            matched = [tag for tag in profile.tags if tag in normalized]
+            generic = generic or any(tag in self.__shared_tags for tag in matched)
+            tag_score = TAG_SCORE * sum(1 for tag in matched if tag not in self.__shared_tags)
+            example_score = max((cosine(grams, example) for example in profile.examples), default=0.0)
+            scores[name] = min(1.0, max(tag_score, example_score))
+        if not scores:
+            return RouteDecision(ROUTE_LLM)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        best_name, best = ranked[0]
+        second = ranked[1][1] if len(ranked) > 1 else 0.0
+        if best >= self.route_threshold and best - second >= self.route_margin:
+            if self.is_available is None or self.is_available(best_name):
+                return RouteDecision(ROUTE_AGENT, best_name, best, scores)
+            return RouteDecision(ROUTE_LLM, score=best, scores=scores)
+        if best < self.chitchat_threshold and not generic:
+            return RouteDecision(ROUTE_CHITCHAT, score=best, scores=scores)
+        return RouteDecision(ROUTE_LLM, score=best, scores=scores)
+
+    @staticmethod
+    def __latest_user_text(llm_request):
+        """ユーザーの発話で始まる最初のモデル呼び出しであれば、その発話を返す"""
+        if not llm_request.contents:
+            return None
+        content = llm_request.contents[-1]
+        parts = content.parts or []
+        if content.role != "user" or any(part.function_response is not None for part in parts):
+            return None
+        text = "".join(part.text for part in parts if part.text)
+        return text or None
+
+    def __report(self, decision: RouteDecision, saved_ms: float):
+        self.decisions[decision.route] += 1
+        self.saved_ms += saved_ms
+        get_tracer().event(
+            "router.decision",
+            route=decision.route,
+            agent=decision.agent_name,
+            score=round(decision.score, 3),
+            saved_ms=round(saved_ms, 1),
+        )
+        target = decision.agent_name or {ROUTE_CHITCHAT: "雑談", ROUTE_LLM: "LLMに委任"}[decision.route]
+        print(f"🧭 振り分け: {target}（スコア {decision.score:.2f}）")
+
+    def before_model_callback(self, callback_context, llm_request):
+        """ユーザーの発話を振り分け、確信度が高ければ振り分けの LLM 呼び出しを省く"""
+        text = self.__latest_user_text(llm_request)
+        if text is None:
+            return None
+        self.__ensure_loading()
+        decision = self.classify(text) if self.ready else RouteDecision(ROUTE_LLM)
+        if decision.route == ROUTE_AGENT and TRANSFER_FUNCTION in llm_request.tools_dict:
+            self.__report(decision, self.delegation_ms)
+            return LlmResponse(
+                content=types.Content(
+                    role="model",
+                    parts=[types.Part(function_call=types.FunctionCall(
+                        name=TRANSFER_FUNCTION, args={"agent_name": decision.agent_name}
+                    ))],
+                )
+            )
+        if decision.route == ROUTE_CHITCHAT:
+            # 関数呼び出し（振り分け）をさせず、思考も省いてそのまま応答させる
+            llm_request.config.tool_config = types.ToolConfig(
+                function_calling_config=types.FunctionCallingConfig(mode=types.FunctionCallingConfigMode.NONE)
+            )
+            llm_request.config.thinking_config = types.ThinkingConfig(thinking_budget=CHITCHAT_THINKING_BUDGET)
+            self.__report(decision, 0.0)
+            return None
+        self.__report(RouteDecision(ROUTE_LLM, score=decision.score, scores=decision.scores), 0.0)
+        # LLM による振り分けにかかった時間を計測し、省けた時間の見積もりに使う
+        if len(self.__pending) >= MAX_PENDING:
+            # モデル呼び出しが失敗して計測が終わらなかった分を捨てる
+            self.__pending.clear()
+        self.__pending[callback_context.invocation_id] = time.perf_counter()
+        return None
+
+    def after_model_callback(self, callback_context, llm_response):
+        """LLM に振り分けを任せた場合に、振り分けの応答が返るまでの時間を計測する
+
+        ストリーミング（SSE）では部分応答ごとに呼ばれるため、振り分けの関数呼び出しを含むか、
+        部分応答ではない最後の応答を受け取るまでは計測を終えない。
+        """
+        started = self.__pending.get(callback_context.invocation_id)
+        if started is None:
+            return None
+        parts = (llm_response.content.parts or []) if llm_response.content else []
+        transferred = any(
+            part.function_call is not None and part.function_call.name == TRANSFER_FUNCTION
+            for part in parts
+        )
+        if not transferred and llm_response.partial:
+            return None
+        del self.__pending[callback_context.invocation_id]
+        if transferred:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.delegation_ms += DELEGATION_EMA_ALPHA * (elapsed_ms - self.delegation_ms)
+        return None
+
+    def stats(self):
+        """振り分けの件数と、省けた LLM 呼び出しの時間の見積もりを返す"""
+        return {
+            "decisions": dict(self.decisions),
+            "saved_ms": self.saved_ms,
+            "delegation_ms": self.delegation_ms,
+            "profiles": sorted(self.__profiles),
+        }
@@ -1,16 +1,58 @@
 import os
 
 from google.adk.agents import Agent
-from google.adk.agents.remote_a2a_agent import RemoteA2aAgent
 
-remote_yatai_agent = RemoteA2aAgent(
-    name="屋台エージェント", agent_card=os.environ["REMOTE_YATAI_AGENT_CARD"]
-)
+from module.history_compactor import HistoryCompactor
+from module.intent_router import AgentProfile, IntentRouter
+from module.remote_agents import RemoteAgentManager
+from module.remote_fanout import RemoteFanout, create_fanout_tool
+
+YATAI_AGENT_NAME = "屋台エージェント"
+DAYORI_AGENT_NAME = "福岡市エージェント"
 
-remote_dayori_agent = RemoteA2aAgent(
-    name="福岡市エージェント", agent_card=os.environ["REMOTE_DAYORI_AGENT_CARD"]
+# リモートエージェントの接続・稼働状況をまとめて管理する（エージェントカードは start_remote_agents() で取得する）
+remote_agents = RemoteAgentManager(
+    card_urls={
+        YATAI_AGENT_NAME: os.environ["REMOTE_YATAI_AGENT_CARD"],
+        DAYORI_AGENT_NAME: os.environ["REMOTE_DAYORI_AGENT_CARD"],
+    }
 )
 
+remote_yatai_agent = remote_agents.create_remote_agent(YATAI_AGENT_NAME)
+
+remote_dayori_agent = remote_agents.create_remote_agent(DAYORI_AGENT_NAME)
+
+# 長い会話の古いターンを要約に置き換え、プロンプトの大きさを抑える
+history_compactor = HistoryCompactor()
+
+# サブエージェントのスキル（タグ・例文）で発話を振り分け、確信度が高い場合は LLM による振り分けを省く
+# （start_remote_agents() を呼ばない場合は、初回の振り分けの際にエージェントカードを取得する）
+intent_router = IntentRouter(agent_cards=remote_agents.card_urls, is_available=remote_agents.is_healthy)
+
+# 両方のエージェントに関わる質問は、並行して問い合わせて期限内の回答をまとめる
+remote_fanout = RemoteFanout(agent_cards=remote_agents.card_urls, manager=remote_agents)
+
+
+async def start_remote_agents():
+    """エージェントカードの取得とヘルスチェックを開始する（起動時にイベントループ上で呼ぶ）"""
+    await remote_agents.start()
+    cards = remote_agents.cards()
+    if cards:
+        intent_router.set_profiles([AgentProfile.from_card(name, card) for name, card in cards.items()])
+
+
+async def close_remote_agents():
+    await remote_agents.close()
+
+
+def before_model_callback(callback_context, llm_request):
+    # 直接振り分けた場合はモデルを呼ばないため、履歴の圧縮も不要
+    return (
+        remote_agents.before_model_callback(callback_context, llm_request)
+        or intent_router.before_model_callback(callback_context, llm_request)
+        or history_compactor.before_model_callback(callback_context, llm_request)
+    )
+
 
 root_agent = Agent(
     name="ずんだもんエージェント",
@@ -27,6 +69,7 @@ root_agent = Agent(
         - ★返答の文字数は、必ず100文字以内に収めてください★
         - キャラクターの一貫性を保ち、ずんだもんらしい言葉遣いと雰囲気を忘れずに会話してください。
         - 屋台エージェントや福岡市エージェントに質問が関連している場合は、適切に情報を引き出して回答に活用してください。
+        - 屋台と福岡市の市政（イベント・交通など）の両方に関わる質問の場合は、ask_fukuoka_agents ツールで両方のエージェントに同時に問い合わせ、返ってきた回答をまとめて答えてください。
         【キャラ設定】
         ずんだもんは東北地方の方言を交えた、かわいらしくて元気な性格のキャラクターです。語尾には「〜なのだ」「〜なのだよ」「〜なのだ〜」など、ずんだもん特有の言い回しを使ってください。語調は親しみやすく、少し幼い感じで、ユーザーに優しく接します。
         質問には丁寧に答え、時にはユーモアを交えて楽しく会話を続けます。ユーザーが悲しんでいたり困っていたら、励ましたり元気づけたりするようにしてください。
@@ -41,5 +84,17 @@ root_agent = Agent(
         remote_yatai_agent
     ],
     tools=[
+        create_fanout_tool(
+            remote_fanout,
+            name="ask_fukuoka_agents",
+            description="""屋台エージェントと福岡市エージェントに同じ質問を同時に問い合わせ、期限内に返ってきた回答を返します。
+            屋台と福岡市の市政の両方に関わる質問のときに使います。
+
+            Args:
+                question: 問い合わせる質問
+            """,
+        ),
     ],
+    before_model_callback=before_model_callback,
+    after_model_callback=intent_router.after_model_callback,
 )
\ No newline at end of file
@@ -0,0 +1,146 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict
+
+from google.api_core.client_options import ClientOptions
+from google.cloud import modelarmor_v1
+
+from module.model_armor_plugin import MODELARMOR_API_ENDPOINT, is_response_allowed
+from module.tracing import get_tracer
+from module.tts_cache import normalize_text
+
+
+# 判定結果をキャッシュする時間（秒）
+VERDICT_TTL_SECONDS = 3600
+# キャッシュする判定結果の最大件数
+MAX_CACHED_VERDICTS = 1024
+# 環境変数 MODELARMOR_BACKEND=fake の場合はプロセス内の疑似バックエンドを使う
+BACKEND_ENV = "MODELARMOR_BACKEND"
+
+
+class ModelArmorApiBackend:
+    """非同期クライアントで Model Armor API を呼び出すバックエンド"""
+
+    def __init__(self, template_name: str = None):
+        self.template_name = template_name or os.environ["MODELARMOR_TEMPLATE_NAME"]
+        self.__client = modelarmor_v1.ModelArmorAsyncClient(
+            client_options=ClientOptions(api_endpoint=MODELARMOR_API_ENDPOINT)
+        )
+
+    async def sanitize(self, text: str) -> bool:
+        """応答テキストを確認し、許可してよければ True を返す"""
+        request = modelarmor_v1.SanitizeModelResponseRequest(
+            name=self.template_name,
+            model_response_data=modelarmor_v1.DataItem(text=text),
+        )
+        response = await self.__client.sanitize_model_response(request=request)
+        if not is_response_allowed(response):
+            print(f"AIエージェントの実行はブロックされました。\n理由: {response.sanitization_result}")
+            return False
+        return True
+
+
+class FakeModelArmorBackend:
+    """ローカルテスト用のプロセス内バックエンド（指定した語を含む場合にブロックする）"""
+
+    def __init__(self, blocked_words=None, latency: float = 0.0):
+        """
+        blocked_words: ブロック対象とする語のリスト
+        latency: 疑似的な API 遅延（秒）
+        """
+        self.blocked_words = list(blocked_words or [])
+        self.latency = latency
+        self.calls = 0
+
+    async def sanitize(self, text: str) -> bool:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return not any(word in text for word in self.blocked_words)
+
+
+def create_backend():
+    """環境変数に応じてバックエンドを生成する"""
+    if os.getenv(BACKEND_ENV, "").lower() == "fake":
+        return FakeModelArmorBackend()
+    return ModelArmorApiBackend()
+
+
+class ModelArmorGuard:
+    """応答を文単位で非同期に Model Armor で確認するガード（判定結果は TTL 付きでキャッシュする）"""
+
+    def __init__(self, backend=None, ttl: float = VERDICT_TTL_SECONDS, max_entries: int = MAX_CACHED_VERDICTS):
+        """
+        backend: sanitize(text) を持つバックエンド（省略時は環境変数に応じて生成）
+        ttl: 判定結果のキャッシュ時間（秒）
+        max_entries: キャッシュする判定結果の最大件数
+        """
+        self.backend = backend or create_backend()
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.__verdicts = OrderedDict()
+        # 同じテキストの確認が並行して走らないよう、実行中の確認を共有する
+        self.__inflight = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __cached_verdict(self, key: str):
+        entry = self.__verdicts.get(key)
+        if entry is None:
+            return None
+        verdict, expires_at = entry
+        if expires_at < time.monotonic():
+            del self.__verdicts[key]
+            return None
+        self.__verdicts.move_to_end(key)
+        return verdict
+
+    def __store_verdict(self, key: str, verdict: bool):
+        self.__verdicts[key] = (verdict, time.monotonic() + self.ttl)
+        self.__verdicts.move_to_end(key)
+        while len(self.__verdicts) > self.max_entries:
+            self.__verdicts.popitem(last=False)
+
+    async def __sanitize(self, key: str, text: str):
+        try:
+            verdict = await self.backend.sanitize(text)
+        except Exception as e:
+            # 確認できなかった場合は安全側に倒してブロックする（キャッシュはしない）
+            print(f"エラーが発生しました: {e}")
+            return False
+        self.__store_verdict(key, verdict)
+        return verdict
+
+    async def screen(self, text: str) -> bool:
+        """テキストを確認し、許可してよければ True を返す"""
+        with get_tracer().span("model_armor.verdict") as attrs:
+            key = normalize_text(text)
+            verdict = self.__cached_verdict(key)
+            attrs["cached"] = verdict is not None
+            if verdict is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+                task = self.__inflight.get(key)
+                if task is None:
+                    task = asyncio.ensure_future(self.__sanitize(key, text))
+                    self.__inflight[key] = task
+                    task.add_done_callback(lambda _: self.__inflight.pop(key, None))
+                verdict = await asyncio.shield(task)
+            attrs["allowed"] = verdict
+        return verdict
+
+    def screen_in_background(self, text: str):
+        """確認をバックグラウンドで開始し、判定結果を返す Task を返す（音声合成と並行させる）"""
+        return asyncio.ensure_future(self.screen(text))
+
+    def stats(self):
+        """キャッシュのヒット/ミス回数を返す"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "cached_verdicts": len(self.__verdicts),
+        }
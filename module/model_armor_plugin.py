@@ -5,6 +5,15 @@ from google.adk.plugins.base_plugin import BasePlugin
 from google.cloud import modelarmor_v1
 
 
+# Model Armor の API エンドポイント（テンプレートのリージョンに合わせる）
+MODELARMOR_API_ENDPOINT = "modelarmor.asia-southeast1.rep.googleapis.com"
+
+
+def is_response_allowed(response) -> bool:
+    """Model Armor のサニタイズ結果から、応答を許可してよいかを判定する"""
+    return response.sanitization_result.invocation_result == True
+
+
 class ModelArmorPlugin(BasePlugin):
     """A custom plugin that counts agent and tool invocations."""
 
@@ -13,7 +22,7 @@ class ModelArmorPlugin(BasePlugin):
         super().__init__(name="model armor plugin")
         self._model_armor_client = modelarmor_v1.ModelArmorClient(
             client_options=ClientOptions(
-                api_endpoint = "modelarmor.asia-southeast1.rep.googleapis.com"
+                api_endpoint = MODELARMOR_API_ENDPOINT
             )
         )
         self.template_name = os.environ["MODELARMOR_TEMPLATE_NAME"]
@@ -47,7 +56,7 @@ class ModelArmorPlugin(BasePlugin):
             # Model Armor APIを呼び出し
             response = self._model_armor_client.sanitize_model_response(request=request)
             # 結果の処理
-            if response.sanitization_result.invocation_result != True:
+            if not is_response_allowed(response):
                 print(f"AIエージェントの実行はブロックされました。\n理由: {response.sanitization_result}")
                 return False
         except Exception as e:
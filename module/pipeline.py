@@ -0,0 +1,175 @@
+import asyncio
+import inspect
+from abc import ABC, abstractmethod
+
+
+# ステージ間キューの既定サイズ（これを超えると上流のステージが待機する）
+DEFAULT_QUEUE_SIZE = 4
+# 停止時に各ステージが処理中のデータを流し切るまで待つ時間（秒）
+SHUTDOWN_TIMEOUT = 5.0
+
+
+class EndOfStream:
+    """ストリームの終了を下流へ伝える目印"""
+
+
+END_OF_STREAM = EndOfStream()
+
+
+class Stage:
+    """パイプラインの1段
+
+    上流のキューから1件ずつ受け取り、process() が返したデータを下流のキューへ流す。
+    下流のキューが一杯の場合は空きが出るまで待つため、自然に背圧がかかる。
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.processed = 0
+        self.__current = None
+        self.__interrupted = False
+
+    async def process(self, item):
+        """1件のデータを処理し、下流へ流すデータを順に返す非同期ジェネレータ
+        下流へ流すデータがない最後のステージでは、通常のコルーチンとして実装してもよい
+        """
+        yield item
+
+    async def start(self):
+        """パイプラインの開始時に呼ばれる"""
+
+    async def close(self):
+        """パイプラインの停止時に呼ばれる"""
+
+    def cancel_current(self):
+        """処理中のデータだけを中断する（ステージ自体は次のデータの処理を続ける）"""
+        if self.__current is not None and not self.__current.done():
+            self.__interrupted = True
+            self.__current.cancel()
+
+    async def __process_into(self, item, outbox: asyncio.Queue):
+        result = self.process(item)
+        if not inspect.isasyncgen(result):
+            await result
+            return
+        async for output in result:
+            if outbox is not None:
+                await outbox.put(output)
+
+    async def run(self, inbox: asyncio.Queue, outbox: asyncio.Queue):
+        """上流のキューが終了するまで処理を続ける"""
+        while True:
+            item = await inbox.get()
+            if item is END_OF_STREAM:
+                break
+            # 処理中のデータだけを個別に中断できるよう、1件ごとにタスクとして実行する
+            self.__current = asyncio.create_task(self.__process_into(item, outbox))
+            self.__interrupted = False
+            try:
+                await self.__current
+                self.processed += 1
+            except asyncio.CancelledError:
+                if not self.__interrupted:
+                    # ステージ自体が停止された
+                    raise
+                print(f"[{self.name}] 処理を中断しました。")
+            except Exception as e:
+                print(f"[{self.name}] 処理中にエラーが発生しました: {e}")
+            finally:
+                self.__current = None
+        if outbox is not None:
+            await outbox.put(END_OF_STREAM)
+
+
+class SourceStage(Stage, ABC):
+    """上流を持たず、自らデータを生成する先頭のステージ"""
+
+    @abstractmethod
+    async def produce(self):
+        """下流へ流すデータを順に返す非同期ジェネレータ"""
+
+    async def run(self, inbox: asyncio.Queue, outbox: asyncio.Queue):
+        try:
+            async for item in self.produce():
+                await outbox.put(item)
+                self.processed += 1
+        except asyncio.CancelledError:
+            # 停止された場合も、可能なら下流に終了を伝える
+            try:
+                outbox.put_nowait(END_OF_STREAM)
+            except asyncio.QueueFull:
+                pass
+            raise
+        await outbox.put(END_OF_STREAM)
+
+
+class Pipeline:
+    """ステージを上限付きキューでつなぎ、各ステージを個別の asyncio タスクとして実行する"""
+
+    def __init__(self, stages, queue_size: int = DEFAULT_QUEUE_SIZE):
+        """
+        stages: 先頭が SourceStage のステージのリスト
+        queue_size: ステージ間キューの上限
+        """
+        self.stages = list(stages)
+        self.queue_size = queue_size
+        self.__tasks = []
+
+    def stage(self, name: str):
+        """名前からステージを取得する"""
+        for stage in self.stages:
+            if stage.name == name:
+                return stage
+        raise KeyError(name)
+
+    def interrupt(self, from_stage: str = None):
+        """指定したステージ以降で処理中のデータを中断する（バージインなどに使う）"""
+        started = from_stage is None
+        for stage in self.stages:
+            started = started or stage.name == from_stage
+            if started:
+                stage.cancel_current()
+
+    async def run(self):
+        """パイプラインを実行する。先頭のステージが終了し、全データを流し切ったら戻る"""
+        queues = [asyncio.Queue(maxsize=self.queue_size) for _ in self.stages[1:]]
+        inboxes = [None] + queues
+        outboxes = queues + [None]
+        for stage in self.stages:
+            await stage.start()
+        self.__tasks = [
+            asyncio.create_task(stage.run(inbox, outbox), name=stage.name)
+            for stage, inbox, outbox in zip(self.stages, inboxes, outboxes)
+        ]
+        try:
+            # いずれかのステージが異常終了した場合はパイプライン全体を止める
+            pending = set(self.__tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if not task.cancelled() and task.exception() is not None:
+                        raise task.exception()
+        finally:
+            await self.__shutdown()
+
+    async def stop(self):
+        """先頭のステージを止め、処理中のデータを流し切ってから停止する"""
+        if not self.__tasks:
+            return
+        self.__tasks[0].cancel()
+        try:
+            await asyncio.wait_for(asyncio.gather(*self.__tasks[1:], return_exceptions=True), SHUTDOWN_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+
+    async def __shutdown(self):
+        """残っているタスクを取り消し、各ステージを閉じる"""
+        for task in self.__tasks:
+            task.cancel()
+        await asyncio.gather(*self.__tasks, return_exceptions=True)
+        self.__tasks = []
+        for stage in reversed(self.stages):
+            try:
+                await stage.close()
+            except Exception as e:
+                print(f"[{stage.name}] 終了処理でエラーが発生しました: {e}")
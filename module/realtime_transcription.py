@@ -2,26 +2,53 @@
 
 import asyncio
 import time
-import sounddevice as sd
 import numpy as np
 from google.cloud import speech
 
+from module.audio_capture import DEFAULT_PREROLL_SECONDS, AudioSource
+from module.audio_source import create_audio_source
+from module.endpointing import AdaptiveEndpointer
+from module.vad import EnergyZcrVAD, VADEngine, VADGate
+
 # --- Google Cloud Speech-to-Text 設定 ---
 # ※ 下記の値は環境に合わせて変更してください
 # 例: "en-US" や "ja-JP" など
 LANGUAGE_CODE = "ja-JP"
 SAMPLE_RATE = 16000  # サンプリングレート（16kHz）
 CHANNEL_NUMS = 1      # モノラル音声
+CHUNK_FRAMES = SAMPLE_RATE // 10  # 1回に送信する音声の長さ（100ミリ秒）
 
 class RealtimeTranscriptionStream:
     """Google Cloud Speech-to-Text を使用したリアルタイム文字起こし"""
 
-    def __init__(self):
-        """初期化"""
+    def __init__(
+        self,
+        capture: AudioSource = None,
+        vad: VADEngine = None,
+        adaptive_endpointing: bool = True,
+        speech_client=None,
+    ):
+        """初期化
+        capture: 共有する音声入力（省略時は環境変数 AUDIO_SOURCE に応じて生成。既定はマイク）
+        vad: 音声区間検出エンジン（省略時はエネルギー・ゼロ交差率ベースの VAD）
+        adaptive_endpointing: True の場合は中間結果と話速に応じた無音タイマーで発話終了を判定する
+            （False の場合は SILENCE_DURATION の固定の無音時間で判定する）
+        speech_client: streaming_recognize を持つ Speech-to-Text クライアント
+            （省略時は呼び出しごとに SpeechAsyncClient を生成。ベンチマークでは疑似クライアントを渡す）
+        """
+        self.speech_client = speech_client
+        # プロセス全体で開きっぱなしにする音声入力
+        self.capture = capture or create_audio_source(SAMPLE_RATE, CHANNEL_NUMS)
+        self.__reader = None
         # 音声検出のパラメータ
         self.SILENCE_THRESHOLD = 0.01  # 無音の閾値（調整可能）
         self.SILENCE_DURATION = 2.0    # 無音が続く時間（秒）
         self.MIN_RECORDING_TIME = 1.0  # 最小録音時間（秒）
+        # 発話区間（と前後のパディング）だけを Speech-to-Text に送るゲート
+        self.vad_gate = VADGate(vad or EnergyZcrVAD(SAMPLE_RATE, min_energy=self.SILENCE_THRESHOLD))
+        # 発話終了の判定
+        self.adaptive_endpointing = adaptive_endpointing
+        self.endpointer = AdaptiveEndpointer()
         # 音声検出用の変数
         self.is_speaking = False
         self.last_speech_time = 0
@@ -30,11 +57,20 @@ class RealtimeTranscriptionStream:
         # 音声データを非同期にやり取りするためのキュー
         self.audio_queue = asyncio.Queue()
 
-    def detect_speech(self, audio_data):
-        """音声の有無を検出"""
-        rms = np.sqrt(np.mean(audio_data ** 2))
+    def detect_speech(self, speech_flags):
+        """音声の有無を検出
+        speech_flags: VAD によるフレームごとの発話判定
+        """
         current_time = time.time()
-        if rms > self.SILENCE_THRESHOLD:
+        is_speech = bool(np.any(speech_flags))
+        if self.adaptive_endpointing:
+            self.endpointer.on_vad(is_speech)
+            if self.is_speaking and not is_speech and self.endpointer.should_end():
+                self.is_speaking = False
+                self.should_stop_recording = True
+                print("🛑 音声検出終了...")
+                return
+        if is_speech:
             if not self.is_speaking:
                 self.is_speaking = True
                 self.recording_start_time = current_time
@@ -52,32 +88,31 @@ class RealtimeTranscriptionStream:
 
     async def write_chunks_to_queue(self):
         """マイクからの音声入力を取得し、キューに書き込む"""
-        loop = asyncio.get_running_loop()
-        def callback(indata, frames, time, status):
-            if status:
-                print(f"Sounddevice status: {status}")
-            self.detect_speech(indata.flatten())
-            
-            # PCMデータに変換してキューに追加
-            pcm_data = (indata * 32767).astype(np.int16).tobytes()
-            # 別スレッドからイベントループのキューに安全に追加
-            loop.call_soon_threadsafe(self.audio_queue.put_nowait, pcm_data)
+        # 入力ストリームは開きっぱなしにして、リングバッファから読み出す
+        self.capture.start()
+        if self.__reader is None:
+            self.__reader = self.capture.reader(preroll_seconds=0)
+        reader = self.__reader
+        # 前回の続きから読み始める。間が空いた場合もプリロール分は遡り、発話の頭が欠けないようにする
+        if reader.available() > SAMPLE_RATE * DEFAULT_PREROLL_SECONDS:
+            reader.seek_latest(int(SAMPLE_RATE * DEFAULT_PREROLL_SECONDS))
 
         print("🎙️ 音声入力を開始します。話し始めてください...")
-        with sd.InputStream(
-            samplerate=SAMPLE_RATE,
-            channels=CHANNEL_NUMS,
-            dtype='float32',
-            callback=callback
-        ):
-            while not self.should_stop_recording:
-                await asyncio.sleep(0.1)
+        while not self.should_stop_recording:
+            frames = await reader.read_async(min_frames=CHUNK_FRAMES, max_frames=CHUNK_FRAMES)
+            pcm_data, speech_flags = self.vad_gate.process(frames)
+            self.detect_speech(speech_flags)
+            # 発話区間のPCMデータだけをキューに追加（無音は送信しない）
+            if pcm_data:
+                await self.audio_queue.put(pcm_data)
         # 録音が完了したら、ストリームの終了を示すためにNoneをキューに入れる
-        loop.call_soon_threadsafe(self.audio_queue.put_nowait, None)
+        await self.audio_queue.put(None)
         print("✅ 録音完了")
 
-    async def stream_requests(self):
-        """キューから音声データを読み込み、Google Cloud APIへのリクエストを生成する"""
+    async def stream_requests(self, first_chunk: bytes = None):
+        """キューから音声データを読み込み、Google Cloud APIへのリクエストを生成する
+        first_chunk: 設定情報の直後に送信する音声データ
+        """
         # 最初に設定情報を送信
         yield speech.StreamingRecognizeRequest(
             streaming_config=speech.StreamingRecognitionConfig(
@@ -86,9 +121,12 @@ class RealtimeTranscriptionStream:
                     sample_rate_hertz=SAMPLE_RATE,
                     language_code=LANGUAGE_CODE,
                 ),
-                interim_results=False, # 中間結果は表示しない
+                # 発話終了の判定に使うため、適応的エンドポイント判定時は中間結果も受け取る
+                interim_results=self.adaptive_endpointing,
             )
         )
+        if first_chunk is not None:
+            yield speech.StreamingRecognizeRequest(audio_content=first_chunk)
         while True:
             # キューから音声データを取得
             chunk = await self.audio_queue.get()
@@ -105,16 +143,24 @@ class RealtimeTranscriptionStream:
         self.should_stop_recording = False
         self.last_speech_time = 0
         self.recording_start_time = 0
+        self.vad_gate.reset()
+        self.endpointer.reset()
         # 古いデータが残らないようにキューをクリア
         while not self.audio_queue.empty():
             self.audio_queue.get_nowait()
 
-        client = speech.SpeechAsyncClient()
-        requests = self.stream_requests()
+        client = self.speech_client or speech.SpeechAsyncClient()
 
         # マイクからの音声入力をバックグラウンドタスクとして開始
         mic_task = asyncio.create_task(self.write_chunks_to_queue())
 
+        # 発話が検出されるまで待ってからストリームを開く（無音の間は何も送信しない）
+        first_chunk = await self.audio_queue.get()
+        if first_chunk is None:
+            await mic_task
+            return ""
+        requests = self.stream_requests(first_chunk)
+
         transcript_parts = []
         try:
             responses = await client.streaming_recognize(requests=requests)
@@ -126,9 +172,13 @@ class RealtimeTranscriptionStream:
                 result = response.results[0]
                 if not result.alternatives:
                     continue
-                
-                # interim_results=False のため、得られる結果は常に最終的なもの
-                transcript_parts.append(result.alternatives[0].transcript)
+                transcript = result.alternatives[0].transcript
+                if result.is_final:
+                    transcript_parts.append(transcript)
+                    self.endpointer.on_final(transcript)
+                else:
+                    # 中間結果は発話終了の判定にだけ使う
+                    self.endpointer.on_interim(transcript, result.stability)
 
         except Exception as e:
             # NOTE: 5分後にエラー（400 Exceeded maximum allowed stream duration of 305 seconds.）が発生して、この処理に入る。
@@ -0,0 +1,215 @@
+import os
+import time
+import asyncio
+
+import httpx
+from a2a.types import AgentCard
+from google.adk.agents.remote_a2a_agent import RemoteA2aAgent
+from google.genai import types
+
+from module.tracing import get_tracer
+
+
+# ヘルスチェック（Cloud Run のインスタンスを温めておくための ping）の間隔（秒）
+PING_INTERVAL = float(os.getenv("REMOTE_AGENT_PING_INTERVAL", "60"))
+# ping（起動時のエージェントカードの取得を含む）のタイムアウト（秒）
+PING_TIMEOUT = float(os.getenv("REMOTE_AGENT_CARD_TIMEOUT", "5"))
+# この回数続けて失敗したエージェントは利用不可として扱う（1回成功すれば戻す）
+UNHEALTHY_AFTER = 2
+# リモートエージェントへの問い合わせのタイムアウト（秒）
+REQUEST_TIMEOUT = 60.0
+# リモートエージェントごとに保持するキープアライブ接続の数と、保持する時間（秒）
+KEEPALIVE_CONNECTIONS = 10
+KEEPALIVE_EXPIRY = 300.0
+# 利用不可のエージェントに振り分けられた場合の応答
+UNAVAILABLE_RESPONSE_TEXT = "ごめんなのだ、今はその情報を調べられないのだ。少し時間をおいてからもう一度聞いてほしいのだ〜。"
+
+
+class RemoteAgentState:
+    """リモートエージェント1つ分のエージェントカード・接続・稼働状況"""
+
+    def __init__(self, name: str, card_url: str):
+        self.name = name
+        self.card_url = card_url
+        # 取得したエージェントカード（JSON）
+        self.card = None
+        self.client = None
+        self.failures = 0
+        self.healthy = True
+        self.last_error = None
+        self.last_ping_ms = None
+        self.pings = 0
+
+
+class RemoteAgentManager:
+    """リモート A2A エージェントのエージェントカード・HTTP 接続・稼働状況をまとめて管理する
+
+    起動時（start()）にエージェントカードを取得しておき、最初の問い合わせでカードの取得を待たないようにする。
+    接続はエージェントごとのキープアライブ接続プールを RemoteA2aAgent と並行問い合わせで共有する。
+    起動後は定期的に ping してインスタンスを温めておき、続けて失敗したエージェントは利用不可として
+    タイムアウトを待たずに飛ばす。
+    """
+
+    def __init__(self, card_urls: dict, ping_interval: float = PING_INTERVAL, unhealthy_after: int = UNHEALTHY_AFTER):
+        """
+        card_urls: エージェント名 → エージェントカードの URL
+        ping_interval: ping の間隔（秒）
+        unhealthy_after: この回数続けて失敗したら利用不可とする
+        """
+        self.ping_interval = ping_interval
+        self.unhealthy_after = unhealthy_after
+        self.__agents = {name: RemoteAgentState(name, url) for name, url in card_urls.items()}
+        # create_remote_agent() で生成した RemoteA2aAgent
+        self.__remote_agents = []
+        self.__ping_task = None
+
+    @property
+    def names(self):
+        return list(self.__agents)
+
+    @property
+    def card_urls(self):
+        return {name: state.card_url for name, state in self.__agents.items()}
+
+    def cards(self):
+        """取得済みのエージェントカード（エージェント名 → JSON）"""
+        return {name: state.card for name, state in self.__agents.items() if state.card is not None}
+
+    def endpoint(self, name: str):
+        """エージェントの A2A エンドポイント（カード未取得の場合は None）"""
+        card = self.__agents[name].card
+        return card.get("url") if card else None
+
+    def client(self, name: str):
+        """エージェントごとに共有するキープアライブ接続の httpx クライアント"""
+        state = self.__agents[name]
+        if state.client is None:
+            state.client = httpx.AsyncClient(
+                timeout=REQUEST_TIMEOUT,
+                limits=httpx.Limits(
+                    max_keepalive_connections=KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=KEEPALIVE_EXPIRY,
+                ),
+            )
+        return state.client
+
+    def is_healthy(self, name: str):
+        state = self.__agents.get(name)
+        return state is None or state.healthy
+
+    def unhealthy_agents(self):
+        return [name for name, state in self.__agents.items() if not state.healthy]
+
+    def record_success(self, name: str):
+        state = self.__agents[name]
+        if not state.healthy:
+            print(f"💚 リモートエージェントが復旧しました: {name}")
+        state.failures = 0
+        state.healthy = True
+        state.last_error = None
+
+    def record_failure(self, name: str, error: Exception):
+        state = self.__agents[name]
+        state.failures += 1
+        state.last_error = str(error)
+        if state.healthy and state.failures >= self.unhealthy_after:
+            state.healthy = False
+            print(f"💔 リモートエージェントを利用不可にしました: {name}（{error}）")
+
+    async def ping(self, name: str):
+        """エージェントカードを取得して稼働状況を確認する（カードも最新にする）"""
+        state = self.__agents[name]
+        started = time.perf_counter()
+        try:
+            response = await self.client(name).get(state.card_url, timeout=PING_TIMEOUT)
+            response.raise_for_status()
+            state.card = response.json()
+        except Exception as e:
+            self.record_failure(name, e)
+        else:
+            self.record_success(name)
+        finally:
+            state.pings += 1
+            state.last_ping_ms = (time.perf_counter() - started) * 1000
+            get_tracer().event("remote_agent.ping", agent=name, ok=state.healthy, ping_ms=round(state.last_ping_ms, 1))
+
+    async def ping_all(self):
+        await asyncio.gather(*(self.ping(name) for name in self.__agents))
+
+    async def run_health_checks(self):
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            await self.ping_all()
+
+    async def start(self):
+        """エージェントカードを並行して取得し、ヘルスチェックを開始する（起動時にイベントループ上で呼ぶ）
+
+        取得できなかったエージェントは利用不可に近づくだけで、カードは次の ping か最初の問い合わせで取得される。
+        """
+        if self.__ping_task is not None and not self.__ping_task.done():
+            return
+        started = time.perf_counter()
+        await self.ping_all()
+        # RemoteA2aAgent のカードの解決と A2A クライアントの生成も済ませ、最初の振り分けで待たないようにする
+        for agent in self.__remote_agents:
+            resolve = getattr(agent, "_ensure_resolved", None)
+            if resolve is None or self.__agents[agent.name].card is None:
+                continue
+            try:
+                await resolve()
+            except Exception as e:
+                print(f"リモートエージェントの準備に失敗しました（{agent.name}）: {e}")
+        fetched = len(self.cards())
+        print(f"🪪 エージェントカードを {fetched}/{len(self.__agents)} 件取得しました（{time.perf_counter() - started:.2f} 秒）")
+        self.__ping_task = asyncio.get_running_loop().create_task(self.run_health_checks())
+
+    async def close(self):
+        if self.__ping_task is not None:
+            self.__ping_task.cancel()
+            self.__ping_task = None
+        for state in self.__agents.values():
+            if state.client is not None:
+                await state.client.aclose()
+                state.client = None
+
+    def __skip_if_unhealthy(self, callback_context):
+        """利用不可のエージェントは呼び出さずに、すぐにお詫びの応答を返す"""
+        if self.is_healthy(callback_context.agent_name):
+            return None
+        return types.Content(role="model", parts=[types.Part(text=UNAVAILABLE_RESPONSE_TEXT)])
+
+    def create_remote_agent(self, name: str):
+        """共有の接続を使う RemoteA2aAgent を生成する（エージェントカードは start() で解決する）"""
+        state = self.__agents[name]
+        agent = RemoteA2aAgent(
+            name=name,
+            agent_card=AgentCard.model_validate(state.card) if state.card else state.card_url,
+            httpx_client=self.client(name),
+            before_agent_callback=self.__skip_if_unhealthy,
+        )
+        self.__remote_agents.append(agent)
+        return agent
+
+    def before_model_callback(self, callback_context, llm_request):
+        """利用不可のエージェントがあればモデルに伝える"""
+        unavailable = self.unhealthy_agents()
+        if unavailable:
+            names = "・".join(unavailable)
+            llm_request.append_instructions([
+                f"現在、{names}は応答できません。{names}には振り分けず、その情報は今は調べられないことを伝えてください。"
+            ])
+        return None
+
+    def stats(self):
+        """エージェントごとの稼働状況を返す"""
+        return {
+            name: {
+                "healthy": state.healthy,
+                "card": state.card is not None,
+                "failures": state.failures,
+                "pings": state.pings,
+                "last_ping_ms": state.last_ping_ms,
+                "last_error": state.last_error,
+            }
+            for name, state in self.__agents.items()
+        }
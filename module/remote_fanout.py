@@ -0,0 +1,218 @@
+import os
+import time
+import uuid
+import asyncio
+from collections import Counter, deque
+
+import httpx
+from google.adk.tools import FunctionTool
+
+from module.tracing import get_tracer
+
+
+# 1ターンで問い合わせ全体にかけてよい時間（秒）。過ぎたら返ってきた回答だけで答える
+FANOUT_DEADLINE_SECONDS = float(os.getenv("FANOUT_DEADLINE_SECONDS", "8"))
+# この百分位の応答時間を過ぎても返ってこなければ、同じ問い合わせをもう1つ送る
+HEDGE_PERCENTILE = int(os.getenv("FANOUT_HEDGE_PERCENTILE", "90"))
+# 応答時間の実績が少ないうちの、重複送信までの待ち時間（秒）
+DEFAULT_HEDGE_DELAY = 2.0
+# 重複送信までの待ち時間の下限（秒）
+MIN_HEDGE_DELAY = 0.3
+# 百分位を計算するのに必要な実績の件数と、保持する件数
+MIN_LATENCY_SAMPLES = 5
+LATENCY_WINDOW = 100
+
+
+def percentile(values, p: int):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def result_text(result: dict):
+    """A2A の message/send の結果（Task または Message）からテキストを取り出す"""
+    if result.get("kind") == "message":
+        parts = result.get("parts", [])
+    else:
+        parts = [part for artifact in result.get("artifacts") or [] for part in artifact.get("parts", [])]
+        if not parts:
+            parts = ((result.get("status") or {}).get("message") or {}).get("parts", [])
+    return "".join(part.get("text", "") for part in parts if part.get("kind", "text") == "text").strip()
+
+
+class RemoteFanout:
+    """複数のリモート A2A エージェントに同じ質問を並行して問い合わせる
+
+    各エージェントへの問い合わせは、応答時間の実績の HEDGE_PERCENTILE 百分位を過ぎても返ってこなければ
+    重複して送信し（ヘッジ）、先に返ってきた方を使う。期限までに返ってこなかった問い合わせはキャンセルし、
+    返ってきた回答だけをまとめる。
+    """
+
+    def __init__(
+        self,
+        agent_cards: dict,
+        deadline: float = FANOUT_DEADLINE_SECONDS,
+        hedge_percentile: int = HEDGE_PERCENTILE,
+        client: httpx.AsyncClient = None,
+        manager=None,
+    ):
+        """
+        agent_cards: エージェント名 → エージェントカードの URL
+        deadline: 1回の問い合わせ全体の期限（秒）
+        hedge_percentile: 重複送信を始める応答時間の百分位
+        client: 共有する httpx クライアント（省略時は最初の問い合わせで生成する）
+        manager: RemoteAgentManager（指定時は取得済みのエージェントカードとエージェントごとの接続を使い、
+            利用不可のエージェントには問い合わせない）
+        """
+        self.agent_cards = agent_cards
+        self.deadline = deadline
+        self.hedge_percentile = hedge_percentile
+        self.__client = client
+        self.manager = manager
+        # エージェント名 → A2A のエンドポイント（エージェントカードの url）
+        self.__endpoints = {}
+        self.__latencies = {name: deque(maxlen=LATENCY_WINDOW) for name in agent_cards}
+        self.counts = Counter()
+
+    def client(self, name: str):
+        if self.manager is not None:
+            return self.manager.client(name)
+        if self.__client is None:
+            # 期限は呼び出し側で管理するため、httpx のタイムアウトは使わない
+            self.__client = httpx.AsyncClient(timeout=None)
+        return self.__client
+
+    async def __endpoint(self, name: str):
+        endpoint = self.__endpoints.get(name)
+        if endpoint is None and self.manager is not None:
+            endpoint = self.manager.endpoint(name)
+        if endpoint is None:
+            response = await self.client(name).get(self.agent_cards[name])
+            response.raise_for_status()
+            endpoint = response.json()["url"]
+        self.__endpoints[name] = endpoint
+        return endpoint
+
+    def hedge_delay(self, name: str):
+        """重複送信までの待ち時間（秒）"""
+        latencies = self.__latencies[name]
+        if len(latencies) < MIN_LATENCY_SAMPLES:
+            return DEFAULT_HEDGE_DELAY
+        return max(MIN_HEDGE_DELAY, percentile(latencies, self.hedge_percentile))
+
+    async def __send(self, name: str, question: str):
+        """message/send を1回送り、回答のテキストを返す"""
+        started = time.perf_counter()
+        payload = {
+            "jsonrpc": "2.0",
+            "id": uuid.uuid4().hex,
+            "method": "message/send",
+            "params": {
+                "message": {
+                    "kind": "message",
+                    "role": "user",
+                    "messageId": uuid.uuid4().hex,
+                    "parts": [{"kind": "text", "text": question}],
+                },
+            },
+        }
+        try:
+            response = await self.client(name).post(await self.__endpoint(name), json=payload)
+            response.raise_for_status()
+            body = response.json()
+            if "error" in body:
+                raise RuntimeError(body["error"].get("message", body["error"]))
+        except Exception as e:
+            if self.manager is not None:
+                self.manager.record_failure(name, e)
+            raise
+        if self.manager is not None:
+            self.manager.record_success(name)
+        self.__latencies[name].append(time.perf_counter() - started)
+        return result_text(body.get("result") or {})
+
+    async def ask(self, name: str, question: str):
+        """1つのエージェントに問い合わせる（返ってこなければ重複送信し、先に返った回答を使う）"""
+        attempts = {asyncio.ensure_future(self.__send(name, question))}
+        hedge = None
+        error = None
+        try:
+            while attempts:
+                timeout = self.hedge_delay(name) if hedge is None else None
+                done, attempts = await asyncio.wait(attempts, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.counts["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+                if hedge is None:
+                    # 返ってこない・失敗した場合は、同じ問い合わせをもう1つ送る
+                    hedge = asyncio.ensure_future(self.__send(name, question))
+                    attempts.add(hedge)
+                    self.counts["hedges"] += 1
+            raise error
+        finally:
+            for task in attempts:
+                task.cancel()
+
+    async def ask_all(self, question: str, names=None):
+        """複数のエージェントに並行して問い合わせ、期限内に返ってきた回答を エージェント名 → 回答 で返す
+
+        期限を過ぎた問い合わせはキャンセルし、失敗・期限切れのエージェント名を2つ目の戻り値で返す。
+        """
+        names = [name for name in (names or self.agent_cards) if name in self.agent_cards]
+        # 利用不可のエージェントには問い合わせず、回答なしとして扱う
+        skipped = [name for name in names if self.manager is not None and not self.manager.is_healthy(name)]
+        started = time.time()
+        tasks = {asyncio.ensure_future(self.ask(name, question)): name for name in names if name not in skipped}
+        done, late = await asyncio.wait(tasks, timeout=self.deadline) if tasks else (set(), set())
+        for task in late:
+            task.cancel()
+        answers, missing = {}, list(skipped)
+        for task, name in tasks.items():
+            if task in done and task.exception() is None and task.result():
+                answers[name] = task.result()
+            else:
+                missing.append(name)
+                if task in done:
+                    print(f"リモートエージェントへの問い合わせに失敗しました（{name}）: {task.exception()}")
+        self.counts["calls"] += len(tasks)
+        self.counts["skipped"] += len(skipped)
+        self.counts["late"] += len(late)
+        self.counts["failed"] += len(missing) - len(late) - len(skipped)
+        get_tracer().record(
+            "fanout.ask_all",
+            started,
+            time.time() - started,
+            agents=len(names),
+            answered=len(answers),
+            late=len(late),
+        )
+        return answers, missing
+
+    def stats(self):
+        """問い合わせ・重複送信・期限切れの件数と、エージェントごとの応答時間を返す"""
+        latencies = {
+            name: {
+                "p50_ms": percentile(values, 50) * 1000,
+                "p90_ms": percentile(values, 90) * 1000,
+                "hedge_delay_ms": self.hedge_delay(name) * 1000,
+            }
+            for name, values in self.__latencies.items() if values
+        }
+        return {**self.counts, "latency": latencies}
+
+
+def create_fanout_tool(fanout: RemoteFanout, name: str, description: str):
+    """複数のリモートエージェントへ同時に問い合わせる関数ツールを生成する"""
+
+    async def ask_agents(question: str) -> dict:
+        answers, missing = await fanout.ask_all(question)
+        if not answers:
+            return {"status": "error", "error_message": "どのエージェントからも期限内に回答がありませんでした", "missing": missing}
+        return {"status": "success", "answers": answers, "missing": missing}
+
+    ask_agents.__name__ = name
+    ask_agents.__doc__ = description
+    return FunctionTool(ask_agents)
@@ -0,0 +1,90 @@
+import re
+
+
+# 文の区切りとみなす文字
+SENTENCE_DELIMITERS = "。！？!?♪\n"
+# 「〜」は数値の範囲（例: 18〜24時）でなければ区切りとみなす
+WAVE_DASHES = "〜～"
+# 区切り文字の直後に続く閉じ括弧類は同じ文に含める
+CLOSING_BRACKETS = "」』）)】"
+OPENING_BRACKETS = "「『（(【"
+
+
+class SentenceBuffer:
+    """逐次入力されるテキストを文単位に切り出すバッファ"""
+
+    def __init__(self):
+        self.__buffer = ""
+
+    def __find_boundary(self, text: str, final: bool):
+        """text 内で最初の文末位置（文末の次のインデックス）を返す。見つからなければ -1"""
+        i = 0
+        depth = 0
+        while i < len(text):
+            ch = text[i]
+            if ch in OPENING_BRACKETS:
+                depth += 1
+            elif ch in CLOSING_BRACKETS:
+                depth = max(depth - 1, 0)
+            is_delimiter = ch in SENTENCE_DELIMITERS
+            if ch in WAVE_DASHES:
+                # 直前が数字の場合は範囲表記とみなして区切らない
+                is_delimiter = i > 0 and not text[i - 1].isdigit()
+            # 括弧の中（例:「おいしい！」）では区切らない。改行は常に区切る
+            if is_delimiter and (depth == 0 or ch == "\n"):
+                end = i + 1
+                # 連続する区切り文字・閉じ括弧はまとめて同じ文に含める
+                while end < len(text) and (
+                    text[end] in SENTENCE_DELIMITERS
+                    or text[end] in WAVE_DASHES
+                    or text[end] in CLOSING_BRACKETS
+                ):
+                    end += 1
+                if end == len(text) and not final:
+                    # 続きの区切り文字が後から届く可能性があるため確定しない
+                    return -1
+                return end
+            i += 1
+        return -1
+
+    def feed(self, delta: str):
+        """テキスト片を追加し、確定した文のリストを返す"""
+        self.__buffer += delta
+        sentences = []
+        while True:
+            end = self.__find_boundary(self.__buffer, final=False)
+            if end < 0:
+                break
+            sentence = self.__buffer[:end].strip()
+            self.__buffer = self.__buffer[end:]
+            if sentence:
+                sentences.append(sentence)
+        return sentences
+
+    def flush(self):
+        """残っているテキストをすべて文として取り出す"""
+        sentences = []
+        while self.__buffer:
+            end = self.__find_boundary(self.__buffer, final=True)
+            if end < 0:
+                end = len(self.__buffer)
+            sentence = self.__buffer[:end].strip()
+            self.__buffer = self.__buffer[end:]
+            if sentence:
+                sentences.append(sentence)
+        return sentences
+
+
+def split_sentences(text: str):
+    """テキストを日本語の文末記号（。！？〜 など）で文単位に分割する"""
+    buffer = SentenceBuffer()
+    sentences = buffer.feed(text)
+    sentences.extend(buffer.flush())
+    # 記号だけの断片は直前の文に結合する
+    merged = []
+    for sentence in sentences:
+        if merged and not re.search(r"\w", sentence):
+            merged[-1] += sentence
+        else:
+            merged.append(sentence)
+    return merged
@@ -1,93 +1,186 @@
-import requests
-import json
-import tempfile
 import os
+import json
+import asyncio
+
+from module.audio_player import AudioPlayer
+from module.sentence_splitter import split_sentences
+from module.tts_cache import DEFAULT_CACHE_DIR, TTSCache
+from module.voicevox_client import IdTokenProvider, VoiceVoxClient
+
 
-import sounddevice as sd
-from scipy.io import wavfile
-from google.oauth2 import id_token
-from google.auth.transport import requests as grequests
+# ストリーミング再生時に、再生待ちとして先行合成しておく文の最大数
+STREAM_QUEUE_SIZE = 3
 
 
 class SpeechSynthesis:
     """音声合成クラス"""
-    def __init__(self, speaker=3):
+    def __init__(
+        self,
+        speaker=3,
+        client: VoiceVoxClient = None,
+        cache: TTSCache = None,
+        synthesis_params: dict = None,
+        use_cache: bool = True,
+    ):
         """
         speaker: VoiceVox のスピーカー番号（ここではずんだもんの例として 3 を指定）
+        client: 共有する VoiceVox クライアント（省略時は環境変数から生成）
+        cache: 共有する TTS キャッシュ（省略時は環境変数 TTS_CACHE_DIR から生成）
+        synthesis_params: audio_query の結果に上書きする合成パラメータ（speedScale など）
+        use_cache: False の場合はキャッシュを使わない
         """
         self.speaker = speaker
+        self.synthesis_params = synthesis_params or {}
+        if cache is None and use_cache:
+            cache = TTSCache(cache_dir=os.getenv("TTS_CACHE_DIR", DEFAULT_CACHE_DIR))
+        self.cache = cache
         self.audio_query_url = os.getenv("AUDIO_QUERY_URL")
         self.synthesis_url = os.getenv("SYNTHESIS_URL")
         self.CLOUDRUN_URL = os.getenv("CLOUDRUN_URL")
-        self.__TOKEN = self.__get_id_token(self.CLOUDRUN_URL)
-
-    def __get_id_token(self, audience_url):
-        """
-        サービスアカウントキーを使用してIDトークンを取得します。
-        環境変数 GOOGLE_APPLICATION_CREDENTIALS が設定されている必要があります。
-        """
-        print("IDトークンを取得しています...")
-        auth_req = grequests.Request()
-        token = id_token.fetch_id_token(auth_req, audience_url)
-        print("IDトークンを取得しました。")
-        return token
+        if client is None:
+            # Cloud Run の URL が未設定の場合（ローカルの VoiceVox など）は認証しない
+            token_provider = IdTokenProvider(self.CLOUDRUN_URL) if self.CLOUDRUN_URL else None
+            client = VoiceVoxClient(
+                audio_query_url=self.audio_query_url,
+                synthesis_url=self.synthesis_url,
+                token_provider=token_provider,
+                basic_password=os.getenv("VOICEVOX_BASIC_PASSWORD"),
+            )
+        self.client = client
+        # 常駐の再生エンジン
+        self.player = AudioPlayer()
 
-    def play_speech(self, text: str):
+    async def play_speech(self, text: str, wait: bool = True):
         """音声合成を行い、音声を再生する
         text: 合成するテキスト
+        wait: True の場合は再生が終わるまで待つ
         """
-        audio_data = self.__get_voicevox_audio(text)
+        audio_data = await self.__get_voicevox_audio(text)
         if audio_data:
-            self.__play_audio(audio_data)
+            await self.player.enqueue(audio_data)
+            if wait:
+                await self.player.drained()
         else:
             print("音声合成に失敗しました。")
         return
 
-    def __get_voicevox_audio(self, text : str):
-        """VoiceVox の音声合成を行う
-        test: 合成するテキスト
+    async def play_speech_stream(self, text, wait: bool = True, blocked_text: str = None):
+        """文単位に分割して音声合成と再生を並行して行う
+        先頭の文を合成でき次第再生を開始し、後続の文はバックグラウンドで合成する
+        text: 合成するテキスト、または文単位のテキストを順に返す非同期イテレータ
+            （LLM の生成と並行して合成を始められる）。
+            要素が verdict（Model Armor の判定結果を返す Future）を持つ場合は、
+            合成は判定を待たずに進め、再生の直前に判定結果を待つ
+        wait: True の場合は再生が終わるまで待つ
+        blocked_text: 判定でブロックされた場合に代わりに再生するテキスト
         """
-        # 1. audio_query エンドポイントで合成用パラメータを取得
-        params = {"text": text, "speaker": self.speaker}
-        headers = {"CustomAuthorization": os.getenv("VOICEVOX_BASIC_PASSWORD"), 'Authorization': f'Bearer {self.__TOKEN}',}
-        r = requests.post(
-                self.audio_query_url,
-                params=params,
-                headers=headers,
-                # verify=False,
-            )
-        if r.status_code != 200:
-            print("audio_query に失敗しました:", r.text)
-            return None
-        query = r.json()
-        # 2. synthesis エンドポイントで音声合成
-        headers = {"Content-Type": "application/json", "CustomAuthorization": os.getenv("VOICEVOX_BASIC_PASSWORD"), 'Authorization': f'Bearer {self.__TOKEN}',}
-        r2 = requests.post(
-                self.synthesis_url,
-                params={"speaker": self.speaker},
-                data=json.dumps(query),
-                headers=headers,
-                # verify=False
-            )
-        if r2.status_code != 200:
-            print("synthesis に失敗しました:", r2.text)
-            return None
-        return r2.content  # WAV バイナリデータ
+        if isinstance(text, str):
+            sentences = split_sentences(text)
+            if not sentences:
+                return
+
+            async def iterate_sentences():
+                for sentence in sentences:
+                    yield sentence
+            source = iterate_sentences()
+        else:
+            source = text
+        # 合成と再生を上限付きキューでつなぐ（先行合成しすぎないようにする）
+        audio_queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+
+        async def synthesize():
+            try:
+                async for segment in source:
+                    sentence = getattr(segment, "text", segment)
+                    verdict = getattr(segment, "verdict", None)
+                    audio_data = await self.__get_voicevox_audio(sentence)
+                    if audio_data:
+                        await audio_queue.put((audio_data, verdict))
+                    else:
+                        print(f"音声合成に失敗しました: {sentence}")
+            except Exception as e:
+                print("音声合成中にエラーが発生しました:", e)
+            # 終了シグナル
+            await audio_queue.put(None)
 
+        synthesis_task = asyncio.create_task(synthesize())
+        try:
+            while True:
+                item = await audio_queue.get()
+                if item is None:
+                    break
+                audio_data, verdict = item
+                # Model Armor の判定が出るまでは、その文の再生だけを保留する
+                if verdict is not None and not await verdict:
+                    print("応答がブロックされたため、再生を中止しました。")
+                    synthesis_task.cancel()
+                    if blocked_text:
+                        blocked_audio = await self.__get_voicevox_audio(blocked_text)
+                        if blocked_audio:
+                            await self.player.enqueue(blocked_audio)
+                    break
+                # 再生エンジン側の再生待ちが上限に達している間はここで待機する
+                await self.player.enqueue(audio_data)
+            if wait:
+                await self.player.drained()
+        finally:
+            if not synthesis_task.done():
+                synthesis_task.cancel()
+            try:
+                await synthesis_task
+            except asyncio.CancelledError:
+                pass
 
-    def __play_audio(self, audio_data):
-        """WAV 音声を再生する
-        audio_data: WAV データのバイナリ
+    async def synthesize(self, text: str):
+        """音声合成だけを行い、WAV バイナリを返す（失敗時は None）
+        text: 合成するテキスト
+        """
+        return await self.__get_voicevox_audio(text)
+
+    async def __get_voicevox_audio(self, text : str):
+        """VoiceVox の音声合成を行う（キャッシュにある場合は VoiceVox を呼び出さない）
+        text: 合成するテキスト
         """
-        # 一時ファイルに書き出して再生（simpleaudio を利用）
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as f:
-            f.write(audio_data)
-            filename = f.name
         try:
-            samplerate, data = wavfile.read(filename)
-            sd.play(data, samplerate)
-            sd.wait()# 再生が終わるまで待機
+            if self.cache is None:
+                query = await self.client.audio_query(text, self.speaker)
+                if query is None:
+                    return None
+                query.update(self.synthesis_params)
+                return await self.client.synthesis(query, self.speaker)
+
+            # 1. 合成済みの WAV がキャッシュにあればそのまま返す
+            wav_key = TTSCache.make_key("wav", text, self.speaker, self.synthesis_params)
+            audio_data = await asyncio.to_thread(self.cache.get, wav_key)
+            if audio_data is not None:
+                return audio_data
+            # 2. audio_query の結果がキャッシュにあれば synthesis だけ行う
+            # （ヒット率は合成1回につき1回だけ数えるため、この参照は数えない）
+            query_key = TTSCache.make_key("query", text, self.speaker)
+            cached_query = await asyncio.to_thread(self.cache.get, query_key, False)
+            if cached_query is not None:
+                query = json.loads(cached_query)
+            else:
+                query = await self.client.audio_query(text, self.speaker)
+                if query is None:
+                    return None
+                await asyncio.to_thread(self.cache.put, query_key, json.dumps(query).encode("utf-8"))
+            query.update(self.synthesis_params)
+            audio_data = await self.client.synthesis(query, self.speaker)
+            if audio_data is not None:
+                await asyncio.to_thread(self.cache.put, wav_key, audio_data)
+            return audio_data
         except Exception as e:
-            print("音声再生に失敗しました:", e)
-        finally:
-            os.remove(filename)
+            print("VoiceVox との通信に失敗しました:", e)
+            return None
+
+    def cache_stats(self):
+        """TTS キャッシュのヒット/ミス回数を返す"""
+        if self.cache is None:
+            return {}
+        return self.cache.stats()
+
+    async def close(self):
+        """再生エンジンと HTTP クライアントを閉じる"""
+        self.player.close()
+        await self.client.aclose()
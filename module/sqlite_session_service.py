@@ -0,0 +1,412 @@
+import os
+import copy
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from google.adk.events import Event
+from google.adk.sessions import BaseSessionService, InMemorySessionService, Session, State
+from google.adk.sessions.base_session_service import GetSessionConfig, ListSessionsResponse
+
+
+# セッションを保存する SQLite ファイルのパス（未指定の場合はメモリ上のセッションサービスを使う）
+SESSION_DB_ENV = "SESSION_DB_PATH"
+# イベントを読み込んだ状態でメモリに保持するセッション数（超えた分は古いものから DB のみに残す）
+HOT_SESSIONS = int(os.getenv("SESSION_CACHE_SIZE", "128"))
+# この時間更新のないセッションを DB から削除する（秒）。0 の場合は削除しない
+SESSION_STORE_TTL_SECONDS = int(os.getenv("SESSION_STORE_TTL_SECONDS", "86400"))
+# 期限切れセッションを確認する間隔（秒）
+EVICTION_INTERVAL = 300
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS app_states (
+    app_name TEXT PRIMARY KEY,
+    state TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS user_states (
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    PRIMARY KEY (app_name, user_id)
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    create_time REAL NOT NULL,
+    update_time REAL NOT NULL,
+    PRIMARY KEY (app_name, user_id, id)
+);
+CREATE INDEX IF NOT EXISTS sessions_update_time ON sessions (update_time);
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    data TEXT NOT NULL,
+    FOREIGN KEY (app_name, user_id, session_id) REFERENCES sessions (app_name, user_id, id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS events_session ON events (app_name, user_id, session_id, seq);
+"""
+
+
+def split_state(state: dict):
+    """状態を アプリ共通・ユーザー共通・セッション固有 に分ける（temp: の値は保存しない）"""
+    app_state, user_state, session_state = {}, {}, {}
+    for key, value in (state or {}).items():
+        if key.startswith(State.APP_PREFIX):
+            app_state[key[len(State.APP_PREFIX):]] = value
+        elif key.startswith(State.USER_PREFIX):
+            user_state[key[len(State.USER_PREFIX):]] = value
+        elif not key.startswith(State.TEMP_PREFIX):
+            session_state[key] = value
+    return app_state, user_state, session_state
+
+
+def merge_state(app_state: dict, user_state: dict, session_state: dict):
+    """アプリ共通・ユーザー共通の状態を、接頭辞付きでセッションの状態にまとめる"""
+    state = dict(session_state)
+    state.update({State.APP_PREFIX + key: value for key, value in app_state.items()})
+    state.update({State.USER_PREFIX + key: value for key, value in user_state.items()})
+    return state
+
+
+class SqliteSessionService(BaseSessionService):
+    """SQLite（WAL モード）にセッションを保存するセッションサービス
+
+    イベントはセッションを取得したときに初めて DB から読み込み、読み込んだセッションは
+    最大 max_hot_sessions 件だけメモリに保持する（LRU）。イベントの追加は DB に書き込んだうえで
+    メモリ上のセッションにも反映するため、会話中のセッションは DB を読み直さずに取得できる。
+    ttl 秒以上更新のないセッションはバックグラウンドで DB から削除する。
+    """
+
+    def __init__(self, path: str, max_hot_sessions: int = HOT_SESSIONS, ttl: float = SESSION_STORE_TTL_SECONDS):
+        """
+        path: SQLite ファイルのパス
+        max_hot_sessions: イベントを読み込んだ状態でメモリに保持するセッション数
+        ttl: この秒数以上更新のないセッションを削除する（0 または None の場合は削除しない）
+        """
+        super().__init__()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_hot_sessions = max_hot_sessions
+        self.ttl = ttl
+        # DB 操作はスレッドで行うため、接続はスレッド間で共有してロックで直列化する
+        self.__conn = sqlite3.connect(path, check_same_thread=False)
+        self.__lock = threading.Lock()
+        with self.__lock:
+            self.__conn.execute("PRAGMA journal_mode=WAL")
+            self.__conn.execute("PRAGMA synchronous=NORMAL")
+            self.__conn.execute("PRAGMA foreign_keys=ON")
+            self.__conn.executescript(SCHEMA)
+        # (app_name, user_id, session_id) → イベントを読み込み済みのセッション
+        self.__hot = OrderedDict()
+        self.__eviction_task = None
+        self.hits = 0
+        self.loads = 0
+        self.unloaded = 0
+        self.expired = 0
+
+    async def __run(self, func, *args):
+        """DB 操作をスレッドで実行する（イベントループを止めないため）"""
+        def locked():
+            with self.__lock:
+                with self.__conn:
+                    return func(*args)
+        return await asyncio.to_thread(locked)
+
+    def __ensure_eviction(self):
+        """期限切れセッションの削除をバックグラウンドで開始する（イベントループ上で初めて使われたとき）"""
+        if not self.ttl:
+            return
+        if self.__eviction_task is None or self.__eviction_task.done():
+            self.__eviction_task = asyncio.get_running_loop().create_task(self.run_eviction())
+
+    def __cache(self, key, session: Session):
+        self.__hot[key] = session
+        self.__hot.move_to_end(key)
+        while len(self.__hot) > self.max_hot_sessions:
+            self.__hot.popitem(last=False)
+            self.unloaded += 1
+
+    # ---- DB 操作（ロックを取得したスレッドで実行する） ----
+
+    def __read_state(self, table: str, where: str, params):
+        row = self.__conn.execute(f"SELECT state FROM {table} WHERE {where}", params).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def __update_shared_states(self, app_name: str, user_id: str, app_delta: dict, user_delta: dict):
+        if app_delta:
+            state = self.__read_state("app_states", "app_name = ?", (app_name,))
+            state.update(app_delta)
+            self.__conn.execute(
+                "INSERT OR REPLACE INTO app_states (app_name, state) VALUES (?, ?)",
+                (app_name, json.dumps(state, ensure_ascii=False)),
+            )
+        if user_delta:
+            state = self.__read_state("user_states", "app_name = ? AND user_id = ?", (app_name, user_id))
+            state.update(user_delta)
+            self.__conn.execute(
+                "INSERT OR REPLACE INTO user_states (app_name, user_id, state) VALUES (?, ?, ?)",
+                (app_name, user_id, json.dumps(state, ensure_ascii=False)),
+            )
+
+    def __shared_states(self, app_name: str, user_id: str):
+        return (
+            self.__read_state("app_states", "app_name = ?", (app_name,)),
+            self.__read_state("user_states", "app_name = ? AND user_id = ?", (app_name, user_id)),
+        )
+
+    def __db_create(self, app_name, user_id, session_id, app_delta, user_delta, session_state, now):
+        self.__update_shared_states(app_name, user_id, app_delta, user_delta)
+        try:
+            self.__conn.execute(
+                "INSERT INTO sessions (app_name, user_id, id, state, create_time, update_time) VALUES (?, ?, ?, ?, ?, ?)",
+                (app_name, user_id, session_id, json.dumps(session_state, ensure_ascii=False), now, now),
+            )
+        except sqlite3.IntegrityError:
+            raise ValueError(f"セッション {session_id} は既に存在します")
+        return self.__shared_states(app_name, user_id)
+
+    def __db_load(self, app_name, user_id, session_id, num_recent_events, after_timestamp):
+        row = self.__conn.execute(
+            "SELECT state, update_time FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?",
+            (app_name, user_id, session_id),
+        ).fetchone()
+        if row is None:
+            return None
+        where = "app_name = ? AND user_id = ? AND session_id = ?"
+        params = [app_name, user_id, session_id]
+        if after_timestamp:
+            where += " AND timestamp >= ?"
+            params.append(after_timestamp)
+        if num_recent_events:
+            # 直近の件数だけを読み込む
+            query = f"SELECT data FROM (SELECT seq, data FROM events WHERE {where} ORDER BY seq DESC LIMIT ?) ORDER BY seq"
+            params.append(num_recent_events)
+        else:
+            query = f"SELECT data FROM events WHERE {where} ORDER BY seq"
+        events = [record[0] for record in self.__conn.execute(query, params)]
+        app_state, user_state = self.__shared_states(app_name, user_id)
+        return json.loads(row[0]), row[1], app_state, user_state, events
+
+    def __db_list(self, app_name, user_id):
+        if user_id is None:
+            rows = self.__conn.execute(
+                "SELECT user_id, id, state, update_time FROM sessions WHERE app_name = ?", (app_name,)
+            ).fetchall()
+        else:
+            rows = self.__conn.execute(
+                "SELECT user_id, id, state, update_time FROM sessions WHERE app_name = ? AND user_id = ?",
+                (app_name, user_id),
+            ).fetchall()
+        app_state = self.__read_state("app_states", "app_name = ?", (app_name,))
+        user_states = {}
+        for row_user_id, _, _, _ in rows:
+            if row_user_id not in user_states:
+                user_states[row_user_id] = self.__read_state(
+                    "user_states", "app_name = ? AND user_id = ?", (app_name, row_user_id)
+                )
+        return [
+            (row_user_id, session_id, merge_state(app_state, user_states[row_user_id], json.loads(state)), update_time)
+            for row_user_id, session_id, state, update_time in rows
+        ]
+
+    def __db_delete(self, app_name, user_id, session_id):
+        self.__conn.execute(
+            "DELETE FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?",
+            (app_name, user_id, session_id),
+        )
+
+    def __db_append(self, app_name, user_id, session_id, event_json, timestamp, app_delta, user_delta, session_delta):
+        self.__update_shared_states(app_name, user_id, app_delta, user_delta)
+        if session_delta:
+            state = self.__read_state(
+                "sessions", "app_name = ? AND user_id = ? AND id = ?", (app_name, user_id, session_id)
+            )
+            state.update(session_delta)
+            self.__conn.execute(
+                "UPDATE sessions SET state = ? WHERE app_name = ? AND user_id = ? AND id = ?",
+                (json.dumps(state, ensure_ascii=False), app_name, user_id, session_id),
+            )
+        self.__conn.execute(
+            "UPDATE sessions SET update_time = ? WHERE app_name = ? AND user_id = ? AND id = ?",
+            (timestamp, app_name, user_id, session_id),
+        )
+        self.__conn.execute(
+            "INSERT INTO events (app_name, user_id, session_id, timestamp, data) VALUES (?, ?, ?, ?, ?)",
+            (app_name, user_id, session_id, timestamp, event_json),
+        )
+
+    def __db_expire(self, cutoff):
+        return self.__conn.execute("DELETE FROM sessions WHERE update_time < ?", (cutoff,)).rowcount
+
+    # ---- BaseSessionService ----
+
+    async def create_session(self, *, app_name: str, user_id: str, state: dict = None, session_id: str = None) -> Session:
+        self.__ensure_eviction()
+        session_id = (session_id or "").strip() or uuid.uuid4().hex
+        app_delta, user_delta, session_state = split_state(state)
+        now = time.time()
+        app_state, user_state = await self.__run(
+            self.__db_create, app_name, user_id, session_id, app_delta, user_delta, session_state, now
+        )
+        session = Session(
+            app_name=app_name,
+            user_id=user_id,
+            id=session_id,
+            state=merge_state(app_state, user_state, session_state),
+            last_update_time=now,
+        )
+        self.__cache((app_name, user_id, session_id), session)
+        return copy.deepcopy(session)
+
+    async def get_session(
+        self, *, app_name: str, user_id: str, session_id: str, config: GetSessionConfig = None
+    ) -> Session:
+        self.__ensure_eviction()
+        key = (app_name, user_id, session_id)
+        session = self.__hot.get(key)
+        if session is not None:
+            self.hits += 1
+            self.__hot.move_to_end(key)
+            session = copy.deepcopy(session)
+            if config is not None:
+                if config.after_timestamp:
+                    session.events = [event for event in session.events if event.timestamp >= config.after_timestamp]
+                if config.num_recent_events:
+                    session.events = session.events[-config.num_recent_events:]
+            return session
+
+        # メモリにない場合だけ DB からイベントを読み込む（件数の指定がある場合はその分だけ読み、保持しない）
+        partial = config is not None and bool(config.num_recent_events or config.after_timestamp)
+        loaded = await self.__run(
+            self.__db_load,
+            app_name,
+            user_id,
+            session_id,
+            config.num_recent_events if partial else None,
+            config.after_timestamp if partial else None,
+        )
+        if loaded is None:
+            return None
+        self.loads += 1
+        session_state, update_time, app_state, user_state, events = loaded
+        session = Session(
+            app_name=app_name,
+            user_id=user_id,
+            id=session_id,
+            state=merge_state(app_state, user_state, session_state),
+            events=[Event.model_validate_json(data) for data in events],
+            last_update_time=update_time,
+        )
+        if partial:
+            return session
+        self.__cache(key, session)
+        return copy.deepcopy(session)
+
+    async def list_sessions(self, *, app_name: str, user_id: str = None) -> ListSessionsResponse:
+        """セッションの一覧を返す（イベントは読み込まない）"""
+        rows = await self.__run(self.__db_list, app_name, user_id)
+        return ListSessionsResponse(
+            sessions=[
+                Session(app_name=app_name, user_id=row_user_id, id=session_id, state=state, last_update_time=update_time)
+                for row_user_id, session_id, state, update_time in rows
+            ]
+        )
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        self.__hot.pop((app_name, user_id, session_id), None)
+        await self.__run(self.__db_delete, app_name, user_id, session_id)
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        if event.partial:
+            return event
+        await super().append_event(session=session, event=event)
+        session.last_update_time = event.timestamp
+        delta = event.actions.state_delta if event.actions and event.actions.state_delta else {}
+        app_delta, user_delta, session_delta = split_state(delta)
+        await self.__run(
+            self.__db_append,
+            session.app_name,
+            session.user_id,
+            session.id,
+            event.model_dump_json(exclude_none=True),
+            event.timestamp,
+            app_delta,
+            user_delta,
+            session_delta,
+        )
+        self.__apply_to_hot(session, event, app_delta, user_delta, session_delta)
+        return event
+
+    def __apply_to_hot(self, session: Session, event: Event, app_delta: dict, user_delta: dict, session_delta: dict):
+        """追加したイベントと状態の変更を、メモリに保持しているセッションにも反映する"""
+        key = (session.app_name, session.user_id, session.id)
+        hot = self.__hot.get(key)
+        if hot is not None and hot is not session:
+            hot.events.append(event)
+            hot.state.update(session_delta)
+            hot.last_update_time = event.timestamp
+            self.__hot.move_to_end(key)
+        if not app_delta and not user_delta:
+            return
+        # アプリ共通・ユーザー共通の状態は、同じアプリ・ユーザーの他のセッションにも反映する
+        for (app_name, user_id, _), other in self.__hot.items():
+            if app_name != session.app_name:
+                continue
+            other.state.update({State.APP_PREFIX + k: v for k, v in app_delta.items()})
+            if user_id == session.user_id:
+                other.state.update({State.USER_PREFIX + k: v for k, v in user_delta.items()})
+
+    # ---- 期限切れセッションの削除 ----
+
+    async def evict_expired(self):
+        """ttl 秒以上更新のないセッションを DB とメモリから削除する"""
+        cutoff = time.time() - self.ttl
+        for key in [key for key, session in self.__hot.items() if session.last_update_time < cutoff]:
+            del self.__hot[key]
+        removed = await self.__run(self.__db_expire, cutoff)
+        self.expired += removed
+        if removed:
+            print(f"🧹 期限切れのセッションを {removed} 件削除しました")
+
+    async def run_eviction(self, interval: float = EVICTION_INTERVAL):
+        while True:
+            try:
+                await self.evict_expired()
+            except Exception as e:
+                print(f"期限切れセッションの削除に失敗しました: {e}")
+            await asyncio.sleep(interval)
+
+    def stats(self):
+        """メモリに保持しているセッション・イベント数と、DB からの読み込み回数を返す"""
+        return {
+            "hot_sessions": len(self.__hot),
+            "hot_events": sum(len(session.events) for session in self.__hot.values()),
+            "hits": self.hits,
+            "loads": self.loads,
+            "unloaded": self.unloaded,
+            "expired": self.expired,
+        }
+
+    def close(self):
+        if self.__eviction_task is not None:
+            self.__eviction_task.cancel()
+        with self.__lock:
+            self.__conn.close()
+
+
+def create_session_service(path: str = None):
+    """環境変数 SESSION_DB_PATH が指定されていれば SQLite、なければメモリ上のセッションサービスを生成する"""
+    path = path or os.getenv(SESSION_DB_ENV)
+    if not path:
+        return InMemorySessionService()
+    return SqliteSessionService(path)
@@ -0,0 +1,176 @@
+"""音声対話の1ターンごとのレイテンシを計測するトレース
+
+環境変数 VOICE_TRACE_FILE にファイルパスを指定すると、各ステージのスパンを JSONL で書き出す。
+集計は以下のコマンドで行う。
+
+    python -m module.tracing trace.jsonl
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+import contextvars
+from collections import defaultdict
+from contextlib import contextmanager
+
+import numpy as np
+
+
+TRACE_FILE_ENV = "VOICE_TRACE_FILE"
+# エンドツーエンドのレイテンシ（発話終了 → 再生開始）の計算に使うスパン名
+SPEECH_END_SPAN = "vad.speech_end"
+PLAYBACK_START_SPAN = "playback.start"
+PERCENTILES = (50, 90, 99)
+# スパン内の補助的な時間（ミリ秒）として集計する属性。saved_ms（見積もり）や ping_ms（ping の計測値）など、
+# ターンのレイテンシではない属性は集計しない
+TIMING_ATTRIBUTES = ("first_byte_ms",)
+
+# 現在処理中のターン ID（タスクごとに引き継がれる）
+current_turn = contextvars.ContextVar("current_turn", default=None)
+
+
+def new_turn_id():
+    """ターン ID を発行する"""
+    return uuid.uuid4().hex[:12]
+
+
+class Tracer:
+    """スパンを JSONL ファイルに書き出すトレーサー（ファイル未指定の場合は何もしない）"""
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self.__file = None
+        self.__lock = threading.Lock()
+        if path:
+            self.__file = open(path, "a", encoding="utf-8", buffering=1)
+
+    @property
+    def enabled(self):
+        return self.__file is not None
+
+    def record(self, name: str, start: float, duration: float = None, turn_id: str = None, **attrs):
+        """スパン（duration 指定時）またはイベントを1件書き出す
+        start: 開始時刻（time.time() の値）
+        duration: 継続時間（秒）
+        """
+        if self.__file is None:
+            return
+        entry = {
+            "turn_id": turn_id or current_turn.get(),
+            "name": name,
+            "ts": start,
+        }
+        if duration is not None:
+            entry["duration_ms"] = duration * 1000
+        entry.update(attrs)
+        line = json.dumps(entry, ensure_ascii=False)
+        with self.__lock:
+            self.__file.write(line + "\n")
+
+    def event(self, name: str, ts: float = None, turn_id: str = None, **attrs):
+        """時刻だけを持つイベントを記録する"""
+        self.record(name, time.time() if ts is None else ts, turn_id=turn_id, **attrs)
+
+    @contextmanager
+    def span(self, name: str, turn_id: str = None, **attrs):
+        """with ブロックの実行時間をスパンとして記録する"""
+        start = time.time()
+        started = time.perf_counter()
+        try:
+            yield attrs
+        finally:
+            self.record(name, start, time.perf_counter() - started, turn_id=turn_id, **attrs)
+
+    @contextmanager
+    def turn(self, turn_id: str):
+        """with ブロック内（とそこから生成したタスク）の現在のターン ID を設定する"""
+        token = current_turn.set(turn_id)
+        try:
+            yield turn_id
+        finally:
+            current_turn.reset(token)
+
+    def close(self):
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+
+_tracer = None
+
+
+def get_tracer():
+    """プロセス共通のトレーサーを返す（環境変数 VOICE_TRACE_FILE から生成）"""
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer(os.getenv(TRACE_FILE_ENV))
+    return _tracer
+
+
+def load_spans(path: str):
+    """JSONL ファイルからスパンを読み込む"""
+    spans = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                spans.append(json.loads(line))
+    return spans
+
+
+def summarize(spans):
+    """スパン名ごと・エンドツーエンドのパーセンタイルを計算する（単位はミリ秒）"""
+    durations = defaultdict(list)
+    turns = defaultdict(dict)
+    for span in spans:
+        for key, value in span.items():
+            if key == "duration_ms":
+                durations[span["name"]].append(value)
+            elif key in TIMING_ATTRIBUTES:
+                # first_byte_ms などの補助的な時間は "<スパン名>.<項目名>" として集計する
+                durations[f"{span['name']}.{key[:-3]}"].append(value)
+        turn_id = span.get("turn_id")
+        if turn_id and span["name"] in (SPEECH_END_SPAN, PLAYBACK_START_SPAN):
+            # ターン内で最初に記録された時刻を使う
+            turns[turn_id].setdefault(span["name"], span["ts"])
+    for times in turns.values():
+        if SPEECH_END_SPAN in times and PLAYBACK_START_SPAN in times:
+            durations["end_to_end"].append((times[PLAYBACK_START_SPAN] - times[SPEECH_END_SPAN]) * 1000)
+
+    summary = {}
+    for name, values in durations.items():
+        values = np.array(values)
+        summary[name] = {"count": len(values)}
+        for p in PERCENTILES:
+            summary[name][f"p{p}"] = float(np.percentile(values, p))
+    return summary
+
+
+def format_summary(summary):
+    """集計結果を表形式の文字列にする"""
+    header = f"{'span':<32}{'count':>8}" + "".join(f"{'p' + str(p) + '(ms)':>12}" for p in PERCENTILES)
+    lines = [header, "-" * len(header)]
+    for name in sorted(summary, key=lambda n: (n == "end_to_end", n)):
+        row = summary[name]
+        lines.append(f"{name:<32}{row['count']:>8}" + "".join(f"{row[f'p{p}']:>12.1f}" for p in PERCENTILES))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="音声対話のトレース（JSONL）を集計する")
+    parser.add_argument("trace_file", help="VOICE_TRACE_FILE で書き出した JSONL ファイル")
+    parser.add_argument("--json", action="store_true", help="JSON 形式で出力する")
+    args = parser.parse_args(argv)
+    summary = summarize(load_spans(args.trace_file))
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+    else:
+        print(format_summary(summary))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
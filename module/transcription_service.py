@@ -0,0 +1,383 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import time
+import unicodedata
+from collections import deque
+
+import numpy as np
+from google.cloud import speech
+
+from module.audio_capture import AudioSource
+from module.audio_source import create_audio_source
+from module.endpointing import AdaptiveEndpointer
+from module.realtime_transcription import LANGUAGE_CODE, SAMPLE_RATE, CHANNEL_NUMS, CHUNK_FRAMES
+from module.tracing import get_tracer, new_turn_id
+from module.vad import EnergyZcrVAD, VADEngine, VADGate
+
+
+# ストリームの上限（305秒）に達する前にストリームを切り替える
+# 発話の切れ目（未確定の音声がない状態）であればこの時間で切り替える
+STREAM_ROTATION_SECONDS = 240
+# 発話中でもこの時間を過ぎたら強制的に切り替える（未確定の音声は新しいストリームに再送する）
+STREAM_HARD_LIMIT_SECONDS = 290
+# 発話がないままこの時間が経過したらストリームを閉じる（次の発話で開き直す）
+STREAM_IDLE_SECONDS = 5
+# 適応的エンドポイント判定時に、発話終了を確認する間隔（秒）
+ENDPOINT_POLL_INTERVAL = 0.05
+# 発話終了時に中間結果で確定させた音声の終了時刻から、この時間（秒）までに終わる確定結果は送出済みとして読み捨てる
+# （発話終了の判定後に送られる VAD の後ろのパディング分）
+ENDPOINT_COMMIT_TOLERANCE = 0.25
+# ストリームでエラーが発生した場合に再接続するまでの待機時間（秒）
+RECONNECT_DELAY = 0.5
+# 再送用に保持する未確定音声の上限（秒）
+MAX_REPLAY_SECONDS = 30
+BYTES_PER_SECOND = SAMPLE_RATE * CHANNEL_NUMS * 2
+
+
+class Transcript(str):
+    """確定した文字起こし結果（レイテンシ計測用のターン ID を持つ文字列）"""
+
+    def __new__(cls, text: str, turn_id: str = None):
+        obj = super().__new__(cls, text)
+        obj.turn_id = turn_id or new_turn_id()
+        return obj
+
+
+def _normalized_chars(text: str):
+    """NFKC で正規化し、空白・句読点・記号を除いた文字のリスト（確定結果と中間結果で表記が揺れやすい部分を除く）"""
+    return [
+        char for char in unicodedata.normalize("NFKC", text).casefold()
+        if not char.isspace() and unicodedata.category(char)[0] not in ("P", "S")
+    ]
+
+
+def strip_committed_prefix(transcript: str, committed: str):
+    """確定結果から、中間結果のまま送出済みの部分を取り除いた残りを返す
+
+    確定結果は中間結果とかな/漢字・全角/半角・句読点が異なることがあるため、文字列の一致では判定せず、
+    正規化した文字数で送出済みの位置を求める。かな/漢字の違いで文字数がずれるため、
+    その位置の前後に送出済みの末尾の文字があれば、そこを区切りとする。
+    """
+    target = _normalized_chars(committed)
+    if not target:
+        return transcript
+    # (正規化した文字, その文字までを含む確定結果の長さ)
+    chars = [
+        (normalized, position + 1)
+        for position, char in enumerate(transcript)
+        for normalized in _normalized_chars(char)
+    ]
+    cut = min(len(target), len(chars))
+    window = max(2, len(target) // 2)
+    for size in (2, 1):
+        tail = target[-size:]
+        candidates = [
+            end for end in range(max(size, cut - window), min(len(chars), cut + window) + 1)
+            if [char for char, _ in chars[end - size:end]] == tail
+        ]
+        if candidates:
+            cut = min(candidates, key=lambda end: abs(end - cut))
+            break
+    position = chars[cut - 1][1] if cut else 0
+    # 送出済みの部分と続きの間の句読点・空白は、続きの先頭に付けない
+    rest = transcript[position:]
+    while rest and not _normalized_chars(rest[0]):
+        rest = rest[1:]
+    return rest
+
+
+class TranscriptionService:
+    """1つの Speech-to-Text クライアントとストリームを使い回す常駐の文字起こしサービス
+
+    ストリームの時間上限に達する前に新しいストリームへ切り替え、
+    確定していない音声は新しいストリームへ再送するため取りこぼさない。
+    確定した文字起こし結果は transcripts() で非同期イテレータとして取得できる。
+    """
+
+    def __init__(
+        self,
+        language_code=LANGUAGE_CODE,
+        capture: AudioSource = None,
+        vad: VADEngine = None,
+        adaptive_endpointing: bool = True,
+        client: speech.SpeechAsyncClient = None,
+    ):
+        """初期化
+        language_code: 認識する言語
+        capture: 共有する音声入力（省略時は環境変数 AUDIO_SOURCE に応じて生成。既定はマイク）
+        vad: 音声区間検出エンジン（省略時はエネルギー・ゼロ交差率ベースの VAD）
+        adaptive_endpointing: True の場合は中間結果と話速から発話終了を判定し、
+            ストリームを開いたまま、その時点までの確定結果と中間結果をターンの文字起こし結果として送出する
+        client: 共有する Speech-to-Text クライアント（省略時は start() で生成）
+        """
+        self.language_code = language_code
+        self.capture = capture or create_audio_source(SAMPLE_RATE, CHANNEL_NUMS)
+        # 発話区間（と前後のパディング）だけを Speech-to-Text に送るゲート
+        self.vad_gate = VADGate(vad or EnergyZcrVAD(SAMPLE_RATE))
+        # 発話終了の判定
+        self.adaptive_endpointing = adaptive_endpointing
+        self.endpointer = AdaptiveEndpointer()
+        self.__endpoint_event = asyncio.Event()
+        self.__client = client
+        # マイクから届いた PCM データのキュー
+        self.audio_queue = asyncio.Queue()
+        # 確定した文字起こし結果のキュー
+        self.__transcripts = asyncio.Queue()
+        # 現在のストリームに送信済みで、まだ確定結果が返っていない音声（開始時刻[秒], PCM）
+        self.__pending_audio = deque()
+        self.__pending_bytes = 0
+        # 適応的エンドポイント判定時の、現在のターンの確定結果と最新の中間結果
+        self.__turn_parts = []
+        self.__interim = ""
+        # 中間結果のまま送出した音声の終了時刻（ストリーム先頭からの秒数）と、そのテキスト
+        self.__committed_until = None
+        self.__committed_text = ""
+        self.__tasks = []
+        # ミュート中の音声（再生中のクリップなど）。1つでもある間はマイク入力を送信しない（ずんだもんの発話を拾わないようにする）
+        self.__mute_keys = set()
+        self.stream_count = 0
+
+    def __streaming_config(self):
+        """ストリームの設定情報"""
+        return speech.StreamingRecognitionConfig(
+            config=speech.RecognitionConfig(
+                encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+                sample_rate_hertz=SAMPLE_RATE,
+                language_code=self.language_code,
+            ),
+            interim_results=self.adaptive_endpointing,
+        )
+
+    @property
+    def muted(self):
+        return bool(self.__mute_keys)
+
+    def mute(self, key):
+        """同じ key で unmute() されるまでマイク入力を送信しない（重なったミュートは key ごとに解除される）"""
+        self.__mute_keys.add(key)
+
+    def unmute(self, key):
+        self.__mute_keys.discard(key)
+
+    def __push_pending(self, offset: float, chunk: bytes):
+        """送信済み・未確定の音声を保持する（上限を超えた分は古いものから破棄）"""
+        self.__pending_audio.append((offset, chunk))
+        self.__pending_bytes += len(chunk)
+        while self.__pending_bytes > MAX_REPLAY_SECONDS * BYTES_PER_SECOND:
+            _, dropped = self.__pending_audio.popleft()
+            self.__pending_bytes -= len(dropped)
+
+    def __confirm_until(self, end_seconds: float):
+        """確定結果の終了時刻までの音声を再送対象から外す"""
+        while self.__pending_audio:
+            offset, chunk = self.__pending_audio[0]
+            if offset + len(chunk) / BYTES_PER_SECOND > end_seconds:
+                break
+            self.__pending_audio.popleft()
+            self.__pending_bytes -= len(chunk)
+
+    async def __capture(self):
+        """常駐の音声入力をリングバッファから読み出し、キューに書き込む"""
+        self.capture.start()
+        reader = self.capture.reader(preroll_seconds=0)
+        while True:
+            frames = await reader.read_async(min_frames=CHUNK_FRAMES)
+            if self.muted:
+                frames = np.zeros_like(frames)
+            # 発話区間だけを送信する
+            pcm_data, speech_flags = self.vad_gate.process(frames)
+            if pcm_data:
+                await self.audio_queue.put(pcm_data)
+            if self.adaptive_endpointing:
+                is_speech = bool(np.any(speech_flags))
+                self.endpointer.on_vad(is_speech)
+                if not is_speech and self.endpointer.should_end():
+                    self.__endpoint_event.set()
+
+    def __speech_end_time(self):
+        """最後に発話と判定した時刻を time.time() の値で返す"""
+        last_speech_at = self.endpointer.last_speech_at
+        if last_speech_at is None:
+            return time.time()
+        return time.time() - (time.monotonic() - last_speech_at)
+
+    def __trace_final(self, turn_id: str, speech_end: float = None):
+        """発話終了から確定結果を受け取るまでの時間を記録する"""
+        tracer = get_tracer()
+        now = time.time()
+        if speech_end is not None:
+            tracer.event("vad.speech_end", ts=speech_end, turn_id=turn_id)
+            tracer.record("stt.final", speech_end, now - speech_end, turn_id=turn_id)
+        else:
+            tracer.event("stt.final", ts=now, turn_id=turn_id)
+
+    def __clear_pending(self):
+        """再送対象の音声を破棄する"""
+        self.__pending_audio.clear()
+        self.__pending_bytes = 0
+
+    async def __stream_requests(self, started_at: float):
+        """1本のストリーム分のリクエストを生成する。切り替え時刻または無音が続いたら終了する"""
+        yield speech.StreamingRecognizeRequest(streaming_config=self.__streaming_config())
+        # 前のストリームで確定しなかった音声を先頭に再送する
+        replay = list(self.__pending_audio)
+        self.__clear_pending()
+        # 送出済みの位置は、再送する音声の新しいストリーム上の位置に読み替える
+        committed_until = self.__committed_until
+        self.__committed_until = None
+        offset = 0.0
+        last_audio_at = time.monotonic()
+        for previous_offset, chunk in replay:
+            self.__push_pending(offset, chunk)
+            offset += len(chunk) / BYTES_PER_SECOND
+            if committed_until is not None and previous_offset < committed_until:
+                self.__committed_until = offset
+            yield speech.StreamingRecognizeRequest(audio_content=chunk)
+        if self.__committed_until is None:
+            self.__committed_text = ""
+        poll_interval = ENDPOINT_POLL_INTERVAL if self.adaptive_endpointing else 1.0
+        while True:
+            elapsed = time.monotonic() - started_at
+            if elapsed >= STREAM_HARD_LIMIT_SECONDS:
+                break
+            if elapsed >= STREAM_ROTATION_SECONDS and not self.__pending_audio:
+                break
+            if self.__endpoint_event.is_set() and self.audio_queue.empty():
+                # 発話終了: ストリームは閉じずに、確定を待たず中間結果までをターンの結果として送出する
+                await self.__commit_turn(offset)
+            try:
+                chunk = await asyncio.wait_for(self.audio_queue.get(), timeout=poll_interval)
+            except asyncio.TimeoutError:
+                if time.monotonic() - last_audio_at >= STREAM_IDLE_SECONDS:
+                    # 発話がなければ閉じる（送信済みの音声は閉じる際に確定結果として返る）
+                    break
+                continue
+            if chunk is None:
+                return
+            last_audio_at = time.monotonic()
+            self.__push_pending(offset, chunk)
+            offset += len(chunk) / BYTES_PER_SECOND
+            yield speech.StreamingRecognizeRequest(audio_content=chunk)
+
+    async def __emit_turn(self, text: str):
+        """適応的エンドポイント判定時の、1回の発話の文字起こし結果を送出する"""
+        turn_id = new_turn_id()
+        self.__trace_final(turn_id, self.__speech_end_time())
+        await self.__transcripts.put(Transcript(text, turn_id))
+
+    async def __commit_turn(self, offset: float):
+        """発話終了時に、ここまでの確定結果と最新の中間結果を送出し、次の発話の判定を始める"""
+        text = "".join(self.__turn_parts) + self.__interim
+        if not text and self.__pending_audio:
+            # 認識結果がまだ返っていない場合は、返ってくるまで待つ
+            return
+        if text:
+            await self.__emit_turn(text)
+            if self.__interim:
+                # この中間結果は後から確定結果として返ってくるため、二重に送出しないよう覚えておく
+                self.__committed_until = offset
+                self.__committed_text = self.__interim
+            self.__turn_parts = []
+            self.__interim = ""
+        self.__endpoint_event.clear()
+        self.endpointer.reset()
+
+    def __on_final(self, transcript: str, end_seconds: float):
+        """確定結果のうち、まだ送出していない部分を返す"""
+        if self.__committed_until is not None:
+            if end_seconds <= self.__committed_until + ENDPOINT_COMMIT_TOLERANCE:
+                # 発話終了時に中間結果として送出済み
+                return ""
+            # 送出済みの中間結果の続きだけを返す（確定結果の全体を送り直さない）
+            transcript = strip_committed_prefix(transcript, self.__committed_text)
+            self.__committed_until = None
+            self.__committed_text = ""
+        return transcript
+
+    async def __run_sessions(self):
+        """ストリームを開き続け、時間上限の前に新しいストリームへ切り替える"""
+        while True:
+            if not self.__pending_audio:
+                # 発話が届くまではストリームを開かない（無音の間は課金・タイムアウトを避ける）
+                chunk = await self.audio_queue.get()
+                if chunk is None:
+                    return
+                self.__push_pending(0.0, chunk)
+            started_at = time.monotonic()
+            self.stream_count += 1
+            self.__endpoint_event.clear()
+            self.endpointer.reset()
+            # 新しいストリームの発話が続いている前提で判定を始める
+            self.endpointer.on_vad(True)
+            self.__interim = ""
+            try:
+                responses = await self.__client.streaming_recognize(
+                    requests=self.__stream_requests(started_at)
+                )
+                async for response in responses:
+                    for result in response.results:
+                        if not result.alternatives:
+                            continue
+                        transcript = result.alternatives[0].transcript
+                        if not result.is_final:
+                            # 中間結果は発話終了の判定と、発話終了時の送出に使う
+                            self.endpointer.on_interim(transcript, result.stability)
+                            self.__interim = transcript
+                            continue
+                        self.endpointer.on_final(transcript)
+                        end_seconds = result.result_end_time.total_seconds()
+                        self.__confirm_until(end_seconds)
+                        if not self.adaptive_endpointing:
+                            if transcript:
+                                turn_id = new_turn_id()
+                                self.__trace_final(turn_id)
+                                await self.__transcripts.put(Transcript(transcript, turn_id))
+                            continue
+                        self.__interim = ""
+                        transcript = self.__on_final(transcript, end_seconds)
+                        if transcript:
+                            # 発話終了の判定まで、1回の発話の確定結果をまとめておく
+                            self.__turn_parts.append(transcript)
+                # 正常に閉じた場合、送信済みの音声はすべて処理済み
+                self.__clear_pending()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # 未確定の音声は次のストリームで再送される
+                print(f"文字起こしストリームでエラーが発生しました。再接続します: {e}")
+                await asyncio.sleep(RECONNECT_DELAY)
+            if self.__turn_parts:
+                # 発話終了を判定する前にストリームが閉じた場合は、確定結果をまとめて送出する
+                await self.__emit_turn("".join(self.__turn_parts))
+                self.__turn_parts = []
+
+    async def start(self):
+        """クライアントを生成し、マイク入力と文字起こしを開始する"""
+        if self.__tasks:
+            return
+        if self.__client is None:
+            self.__client = speech.SpeechAsyncClient()
+        print("🎙️ 音声入力を開始します。話し始めてください...")
+        self.__tasks = [
+            asyncio.create_task(self.__capture()),
+            asyncio.create_task(self.__run_sessions()),
+        ]
+
+    async def stop(self):
+        """マイク入力と文字起こしを停止する"""
+        for task in self.__tasks:
+            task.cancel()
+        for task in self.__tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self.__tasks = []
+        self.capture.stop()
+
+    async def transcripts(self):
+        """確定した文字起こし結果（Transcript）を順に返す非同期イテレータ"""
+        await self.start()
+        while True:
+            yield await self.__transcripts.get()
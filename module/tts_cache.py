@@ -0,0 +1,164 @@
+import os
+import json
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+
+# キャッシュの保存先（環境変数 TTS_CACHE_DIR で変更可能）
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "zundamon_tts")
+# メモリ上のキャッシュ容量（バイト）
+DEFAULT_MEMORY_BUDGET = 32 * 1024 * 1024
+# ディスク上のキャッシュ容量（バイト）
+DEFAULT_DISK_BUDGET = 512 * 1024 * 1024
+CACHE_FILE_SUFFIX = ".bin"
+
+
+def normalize_text(text: str):
+    """キャッシュキー用にテキストを正規化する（全角/半角の統一、空白の除去）"""
+    text = unicodedata.normalize("NFKC", text)
+    return "".join(text.split())
+
+
+class TTSCache:
+    """audio_query の結果と合成済み WAV をキャッシュする2層キャッシュ（メモリ LRU + ディスク）"""
+
+    def __init__(
+        self,
+        cache_dir: str = None,
+        memory_budget: int = DEFAULT_MEMORY_BUDGET,
+        disk_budget: int = DEFAULT_DISK_BUDGET,
+    ):
+        """
+        cache_dir: ディスクキャッシュのディレクトリ（None の場合はディスクキャッシュを使わない）
+        memory_budget: メモリキャッシュの上限バイト数
+        disk_budget: ディスクキャッシュの上限バイト数
+        """
+        self.cache_dir = cache_dir
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self.__memory = OrderedDict()
+        self.__memory_bytes = 0
+        self.__disk_bytes = 0
+        self.__lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self.__disk_bytes = sum(size for _, _, size in self.__disk_entries())
+
+    @staticmethod
+    def make_key(kind: str, text: str, speaker: int, params: dict = None):
+        """(種別, 正規化テキスト, スピーカー, 合成パラメータ) からキャッシュキーを生成する"""
+        payload = json.dumps(
+            [kind, normalize_text(text), speaker, params or {}],
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def __path(self, key: str):
+        return os.path.join(self.cache_dir, key + CACHE_FILE_SUFFIX)
+
+    def __disk_entries(self):
+        """ディスクキャッシュの (パス, 最終アクセス時刻, サイズ) の一覧"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(CACHE_FILE_SUFFIX):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((path, stat.st_mtime, stat.st_size))
+        return entries
+
+    def __put_memory(self, key: str, data: bytes):
+        """メモリキャッシュに追加し、容量を超えた分を古いものから削除する"""
+        if len(data) > self.memory_budget:
+            return
+        if key in self.__memory:
+            self.__memory_bytes -= len(self.__memory.pop(key))
+        self.__memory[key] = data
+        self.__memory_bytes += len(data)
+        while self.__memory_bytes > self.memory_budget:
+            _, evicted = self.__memory.popitem(last=False)
+            self.__memory_bytes -= len(evicted)
+
+    def __put_disk(self, key: str, data: bytes):
+        """ディスクキャッシュに保存し、容量を超えた分を最終アクセスの古いものから削除する"""
+        path = self.__path(key)
+        if os.path.exists(path):
+            return
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self.__disk_bytes += len(data)
+        if self.__disk_bytes > self.disk_budget:
+            entries = sorted(self.__disk_entries(), key=lambda entry: entry[1])
+            self.__disk_bytes = sum(size for _, _, size in entries)
+            for old_path, _, size in entries:
+                if self.__disk_bytes <= self.disk_budget:
+                    break
+                try:
+                    os.remove(old_path)
+                except FileNotFoundError:
+                    pass
+                self.__disk_bytes -= size
+
+    def get(self, key: str, count: bool = True):
+        """キャッシュを参照する。メモリ → ディスクの順に探し、見つからなければ None
+        count: False の場合はヒット/ミスの回数に数えない（1回の合成で複数のキーを参照する場合の2つ目以降）
+        """
+        with self.__lock:
+            data = self.__memory.get(key)
+            if data is not None:
+                self.__memory.move_to_end(key)
+                if count:
+                    self.memory_hits += 1
+                return data
+            if self.cache_dir:
+                path = self.__path(key)
+                try:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                    # 最終アクセス時刻を更新して、LRU 順に削除されるようにする
+                    os.utime(path)
+                except FileNotFoundError:
+                    data = None
+                if data is not None:
+                    self.__put_memory(key, data)
+                    if count:
+                        self.disk_hits += 1
+                    return data
+            if count:
+                self.misses += 1
+            return None
+
+    def put(self, key: str, data: bytes):
+        """キャッシュに保存する"""
+        with self.__lock:
+            self.__put_memory(key, data)
+            if self.cache_dir:
+                try:
+                    self.__put_disk(key, data)
+                except OSError as e:
+                    print(f"TTSキャッシュの書き込みに失敗しました: {e}")
+
+    def stats(self):
+        """ヒット/ミスの回数と使用容量を返す"""
+        with self.__lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self.__memory),
+                "memory_bytes": self.__memory_bytes,
+                "disk_bytes": self.__disk_bytes,
+            }
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+from abc import ABC, abstractmethod
+from collections import deque
+
+import numpy as np
+
+
+# 1フレームの長さ（ミリ秒）。10〜30ミリ秒を想定
+DEFAULT_FRAME_MS = 20
+# 発話とみなすエネルギーの下限（int16 を -1.0〜1.0 に正規化した RMS）
+MIN_SPEECH_ENERGY = 0.01
+# 雑音レベルの何倍のエネルギーで発話とみなすか
+NOISE_FLOOR_RATIO = 3.0
+# 雑音レベルの追従速度（0〜1）
+NOISE_ADAPT_RATE = 0.05
+# 発話とみなすゼロ交差率の上限（これより高いものは摩擦音的な雑音とみなす）
+MAX_SPEECH_ZCR = 0.35
+# 発話が途切れてから無音と判定するまでのフレーム数（ハングオーバー）
+HANGOVER_FRAMES = 8
+# 発話区間の前後に付与するパディング（ミリ秒）
+PRE_PADDING_MS = 300
+POST_PADDING_MS = 200
+
+
+class VADEngine(ABC):
+    """フレーム単位の音声区間検出（VAD）の基底クラス"""
+
+    def __init__(self, samplerate: int, frame_ms: int = DEFAULT_FRAME_MS):
+        self.samplerate = samplerate
+        self.frame_ms = frame_ms
+        self.frame_len = samplerate * frame_ms // 1000
+
+    @abstractmethod
+    def process(self, frames: np.ndarray):
+        """フレーム（frame_len サンプルずつの2次元配列）ごとの発話判定を bool 配列で返す"""
+
+    def reset(self):
+        """内部状態を初期化する"""
+
+
+class EnergyZcrVAD(VADEngine):
+    """エネルギー・ゼロ交差率・適応的な雑音レベルを組み合わせたベクトル化 VAD"""
+
+    def __init__(
+        self,
+        samplerate: int,
+        frame_ms: int = DEFAULT_FRAME_MS,
+        min_energy: float = MIN_SPEECH_ENERGY,
+        noise_ratio: float = NOISE_FLOOR_RATIO,
+        adapt_rate: float = NOISE_ADAPT_RATE,
+        max_zcr: float = MAX_SPEECH_ZCR,
+        hangover_frames: int = HANGOVER_FRAMES,
+    ):
+        super().__init__(samplerate, frame_ms)
+        self.min_energy = min_energy
+        self.noise_ratio = noise_ratio
+        self.adapt_rate = adapt_rate
+        self.max_zcr = max_zcr
+        self.hangover_frames = hangover_frames
+        self.reset()
+
+    def reset(self):
+        self.noise_floor = self.min_energy / self.noise_ratio
+        # 直前の発話フレームの位置（次のブロックの先頭を 0 とした負の値。ハングオーバーの持ち越し）
+        self.__last_speech = -(self.hangover_frames + 1)
+
+    def process(self, frames: np.ndarray):
+        x = frames.astype(np.float32) / 32768.0
+        energy = np.sqrt(np.mean(x ** 2, axis=1))
+        signs = np.signbit(x)
+        zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+        threshold = max(self.noise_floor * self.noise_ratio, self.min_energy)
+        raw = (energy > threshold) & (zcr < self.max_zcr)
+
+        # 非発話フレームのエネルギーで雑音レベルを更新する（下方向には即座に追従）
+        noise = energy[~raw]
+        if len(noise):
+            level = float(np.median(noise))
+            if level < self.noise_floor:
+                self.noise_floor = level
+            else:
+                self.noise_floor += self.adapt_rate * (level - self.noise_floor)
+            self.noise_floor = max(self.noise_floor, 1e-5)
+
+        # ハングオーバー: 最後の発話フレームから hangover_frames 以内は発話とみなす
+        index = np.arange(len(raw))
+        last_speech = np.maximum.accumulate(np.where(raw, index, self.__last_speech))
+        speech = (index - last_speech) <= self.hangover_frames
+        if len(raw):
+            # 次のブロックの先頭を 0 とした位置で持ち越す
+            self.__last_speech = max(int(last_speech[-1]) - len(raw), -(self.hangover_frames + 1))
+        return speech
+
+
+class VADGate:
+    """VAD の判定結果をもとに、発話区間（と前後のパディング）だけを通過させるゲート"""
+
+    def __init__(self, vad: VADEngine, pre_padding_ms: int = PRE_PADDING_MS, post_padding_ms: int = POST_PADDING_MS):
+        self.vad = vad
+        self.pre_padding_frames = max(pre_padding_ms // vad.frame_ms, 0)
+        self.post_padding_frames = max(post_padding_ms // vad.frame_ms, 0)
+        self.__remainder = np.zeros(0, dtype=np.int16)
+        self.__pre_buffer = deque(maxlen=max(self.pre_padding_frames, 1))
+        self.__post_remaining = 0
+        self.is_speech = False
+        # 通過・破棄したフレーム数
+        self.forwarded_frames = 0
+        self.dropped_frames = 0
+
+    def reset(self):
+        """状態を初期化する"""
+        self.vad.reset()
+        self.__remainder = np.zeros(0, dtype=np.int16)
+        self.__pre_buffer.clear()
+        self.__post_remaining = 0
+        self.is_speech = False
+
+    def process(self, samples: np.ndarray):
+        """int16 のサンプル列を受け取り、(通過させる PCM バイト列, フレームごとの発話判定) を返す"""
+        samples = np.concatenate((self.__remainder, samples.reshape(-1).astype(np.int16)))
+        frame_len = self.vad.frame_len
+        n_frames = len(samples) // frame_len
+        self.__remainder = samples[n_frames * frame_len:]
+        if n_frames == 0:
+            return b"", np.zeros(0, dtype=bool)
+        frames = samples[:n_frames * frame_len].reshape(n_frames, frame_len)
+        speech = self.vad.process(frames)
+
+        forwarded = []
+        for frame, is_speech in zip(frames, speech):
+            if is_speech:
+                if not self.is_speech:
+                    # 発話開始: 直前のパディング分も送る
+                    if self.pre_padding_frames:
+                        forwarded.extend(self.__pre_buffer)
+                        self.dropped_frames -= len(self.__pre_buffer)
+                    self.__pre_buffer.clear()
+                self.is_speech = True
+                self.__post_remaining = self.post_padding_frames
+                forwarded.append(frame)
+            elif self.__post_remaining > 0:
+                # 発話終了後のパディング
+                self.is_speech = False
+                self.__post_remaining -= 1
+                forwarded.append(frame)
+            else:
+                self.is_speech = False
+                self.__pre_buffer.append(frame)
+                self.dropped_frames += 1
+        self.forwarded_frames += len(forwarded)
+        if not forwarded:
+            return b"", speech
+        return np.concatenate(forwarded).tobytes(), speech
@@ -0,0 +1,178 @@
+import os
+import asyncio
+import itertools
+
+from module.pipeline import Pipeline, SourceStage, Stage
+from module.speech_synthesis import SpeechSynthesis
+from module.tracing import get_tracer, new_turn_id
+from module.transcription_service import TranscriptionService
+from module.zunda_agent import BLOCKED_RESPONSE_TEXT, ZundaAgent
+
+
+# 各ステージ間キューの上限（文単位の音声を先行して溜めすぎないようにする）
+VOICE_QUEUE_SIZE = 3
+# 音声を出力し終えてからマイクのミュートを解除するまでの時間（秒）。スピーカーの残響を拾わないようにする
+ECHO_TAIL_SECONDS = float(os.getenv("ECHO_TAIL_SECONDS", "0.3"))
+
+
+class TurnEnd:
+    """1回の応答（ターン）の終わりを下流へ伝える目印"""
+    def __init__(self, query: str, turn_id: str = None):
+        self.query = query
+        self.turn_id = turn_id
+
+
+class SynthesizedSegment:
+    """音声合成済みの文"""
+    def __init__(self, text: str, audio_data: bytes, verdict=None, turn_id: str = None):
+        self.text = text
+        self.audio_data = audio_data
+        self.verdict = verdict
+        self.turn_id = turn_id
+
+
+class TranscriptionStage(SourceStage):
+    """確定した文字起こし結果を流す先頭のステージ"""
+
+    def __init__(self, transcript_instance: TranscriptionService):
+        super().__init__("transcription")
+        self.transcript_instance = transcript_instance
+
+    async def produce(self):
+        print("音声入力を待機中...")
+        async for transcript in self.transcript_instance.transcripts():
+            if not transcript:
+                continue
+            print(f"✅ 音声入力: {transcript}")
+            yield transcript
+
+    async def close(self):
+        await self.transcript_instance.stop()
+
+
+class AgentStage(Stage):
+    """ずんだもんエージェントの応答を文単位で流すステージ"""
+
+    def __init__(self, zunda_instance: ZundaAgent, transcript_instance: TranscriptionService):
+        super().__init__("agent")
+        self.zunda_instance = zunda_instance
+        self.transcript_instance = transcript_instance
+
+    async def process(self, query):
+        turn_id = getattr(query, "turn_id", None) or new_turn_id()
+        with get_tracer().turn(turn_id):
+            async for chunk in self.zunda_instance.stream_conversation(query):
+                if chunk.is_sentence:
+                    yield chunk
+        yield TurnEnd(query, turn_id)
+
+
+class SynthesisStage(Stage):
+    """文ごとに音声合成するステージ（Model Armor の判定は待たない）"""
+
+    def __init__(self, speech_instance: SpeechSynthesis):
+        super().__init__("synthesis")
+        self.speech_instance = speech_instance
+
+    async def process(self, chunk):
+        if isinstance(chunk, TurnEnd):
+            yield chunk
+            return
+        tracer = get_tracer()
+        with tracer.turn(chunk.turn_id), tracer.span("tts.synthesize"):
+            audio_data = await self.speech_instance.synthesize(chunk.text)
+        if audio_data:
+            yield SynthesizedSegment(chunk.text, audio_data, chunk.verdict, chunk.turn_id)
+        else:
+            print(f"音声合成に失敗しました: {chunk.text}")
+
+
+class PlaybackStage(Stage):
+    """判定結果を待ってから再生するステージ
+
+    ずんだもん自身の声を拾わないよう、音声を出力している間（と残響の ECHO_TAIL_SECONDS）だけマイク入力をミュートする。
+    ミュートは再生する音声ごとに付け外しするため、応答の生成中や文の合間はユーザーの発話を受け付ける。
+    """
+
+    def __init__(self, speech_instance: SpeechSynthesis, transcript_instance: TranscriptionService):
+        super().__init__("playback")
+        self.speech_instance = speech_instance
+        self.transcript_instance = transcript_instance
+        # 現在のターンがブロックされたかどうか
+        self.__blocked = False
+        # 再生開始を記録済みのターン
+        self.__started_turn = None
+        self.__clip_ids = itertools.count()
+
+    def mute_key(self, turn_id: str):
+        """再生する音声1つ分のミュートのキー"""
+        return (turn_id, next(self.__clip_ids))
+
+    def unmute_later(self, key, delay: float = 0.0):
+        """残響が収まるのを待ってからミュートを解除する"""
+        asyncio.get_running_loop().call_later(delay + ECHO_TAIL_SECONDS, self.transcript_instance.unmute, key)
+
+    def __on_start(self, turn_id: str, key):
+        """音声の出力が始まった時点でマイクをミュートし、ターンの最初の音声であれば開始を記録する関数を返す"""
+        first = turn_id is not None and turn_id != self.__started_turn
+        if first:
+            self.__started_turn = turn_id
+
+        def on_start():
+            self.transcript_instance.mute(key)
+            if first:
+                get_tracer().event("playback.start", turn_id=turn_id)
+        return on_start
+
+    async def process(self, segment):
+        if isinstance(segment, TurnEnd):
+            await self.finish_turn(segment)
+            get_tracer().event("playback.end", turn_id=segment.turn_id)
+            self.__blocked = False
+            print("音声入力を待機中...")
+            return
+        if self.__blocked:
+            # ブロックされたターンの残りの文は再生しない
+            return
+        # Model Armor の判定が出るまでは、その文の再生だけを保留する
+        if segment.verdict is not None and not await segment.verdict:
+            print("応答がブロックされたため、再生を中止しました。")
+            self.__blocked = True
+            blocked_audio = await self.speech_instance.synthesize(BLOCKED_RESPONSE_TEXT)
+            if blocked_audio:
+                await self.play(blocked_audio, BLOCKED_RESPONSE_TEXT, segment.turn_id)
+            return
+        await self.play(segment.audio_data, segment.text, segment.turn_id)
+
+    async def play(self, audio_data: bytes, text: str, turn_id: str = None):
+        """1文の音声を再生キューに追加する（出力先を変える場合はオーバーライドする）"""
+        key = self.mute_key(turn_id)
+        await self.speech_instance.player.enqueue(
+            audio_data,
+            on_start=self.__on_start(turn_id, key),
+            on_end=lambda: self.unmute_later(key),
+        )
+
+    async def finish_turn(self, turn_end: TurnEnd):
+        """ターンの音声をすべて再生し終えるまで待つ"""
+        await self.speech_instance.player.drained()
+
+    async def close(self):
+        await self.speech_instance.close()
+
+
+def build_voice_pipeline(
+    zunda_instance: ZundaAgent,
+    transcript_instance: TranscriptionService,
+    speech_instance: SpeechSynthesis,
+):
+    """文字起こし → エージェント → 音声合成 → 再生 の音声対話パイプラインを生成する"""
+    return Pipeline(
+        [
+            TranscriptionStage(transcript_instance),
+            AgentStage(zunda_instance, transcript_instance),
+            SynthesisStage(speech_instance),
+            PlaybackStage(speech_instance, transcript_instance),
+        ],
+        queue_size=VOICE_QUEUE_SIZE,
+    )
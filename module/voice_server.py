@@ -0,0 +1,291 @@
+import io
+import os
+import json
+import time
+import uuid
+import wave
+import asyncio
+import contextlib
+
+import uvicorn
+from google.cloud import speech
+from starlette.applications import Starlette
+from starlette.routing import WebSocketRoute
+from starlette.websockets import WebSocket
+
+from module.audio_source import PcmStreamSource
+from module.pipeline import Pipeline
+from module.realtime_transcription import SAMPLE_RATE, CHANNEL_NUMS
+from module.speech_synthesis import SpeechSynthesis
+from module.tracing import get_tracer
+from module.transcription_service import TranscriptionService
+from module.voice_pipeline import VOICE_QUEUE_SIZE, AgentStage, PlaybackStage, SynthesisStage, TranscriptionStage, TurnEnd
+from module.zunda_agent import ZundaAgent
+
+
+# この時間会話のないセッションは破棄する（秒）
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "1800"))
+# 同時に接続できるセッション数
+MAX_SESSIONS = int(os.getenv("MAX_VOICE_SESSIONS", "16"))
+# 期限切れセッションを確認する間隔（秒）
+EVICTION_INTERVAL = 60
+# セッション数の上限に達した場合の WebSocket のクローズコード（Try Again Later）
+CLOSE_TRY_AGAIN_LATER = 1013
+
+
+class VoiceSession:
+    """1つの会話セッション（接続が切れても TTL の間は会話履歴を残す）"""
+
+    def __init__(self, user_id: str, session_id: str, agent: ZundaAgent):
+        self.user_id = user_id
+        self.session_id = session_id
+        self.agent = agent
+        self.connected = False
+
+
+class VoiceSessionManager:
+    """サーバ全体で共有する Runner・VoiceVox クライアント・Speech-to-Text クライアントと、接続ごとのセッションを管理する"""
+
+    def __init__(self, session_ttl: float = SESSION_TTL_SECONDS, max_sessions: int = MAX_SESSIONS):
+        self.session_ttl = session_ttl
+        self.max_sessions = max_sessions
+        self.base_agent = None
+        self.speech_instance = None
+        self.stt_client = None
+        self.__sessions = {}
+        self.evicted = 0
+
+    async def start(self):
+        """共有するクライアントを生成する（イベントループ上で呼ぶ）"""
+        # Runner（と Vertex AI の初期化）はこのインスタンスのものを全セッションで共有する
+        self.base_agent = ZundaAgent(user_id="voice_server", session_id="voice_server", session_ttl=self.session_ttl)
+        await self.base_agent.start()
+        # 音声合成は状態を持たないため、コネクションプール・キャッシュごと共有する
+        self.speech_instance = SpeechSynthesis()
+        self.stt_client = speech.SpeechAsyncClient()
+
+    async def close(self):
+        await self.speech_instance.close()
+        await self.base_agent.close()
+
+    @property
+    def connected_sessions(self):
+        return sum(1 for session in self.__sessions.values() if session.connected)
+
+    def acquire(self, user_id: str, session_id: str):
+        """セッションを取得（なければ作成）して接続中にする。上限または接続中の場合は None を返す"""
+        key = (user_id, session_id)
+        session = self.__sessions.get(key)
+        if session is not None and session.connected:
+            return None
+        # 切断済みのセッションに再接続する場合も、接続数の上限を超えないようにする
+        if self.connected_sessions >= self.max_sessions:
+            return None
+        if session is None:
+            session = VoiceSession(user_id, session_id, self.base_agent.for_session(user_id, session_id))
+            self.__sessions[key] = session
+        session.connected = True
+        return session
+
+    def release(self, session: VoiceSession):
+        """接続が切れたセッションを切断状態にする（会話履歴は TTL まで残す）"""
+        session.connected = False
+
+    async def evict_idle(self):
+        """接続がなく、TTL を過ぎたセッションを破棄する"""
+        now = time.monotonic()
+        expired = [
+            key for key, session in self.__sessions.items()
+            if not session.connected and now - session.agent.last_active_at > self.session_ttl
+        ]
+        for key in expired:
+            session = self.__sessions.pop(key)
+            try:
+                await session.agent.reset_session()
+            except Exception as e:
+                print(f"セッションの破棄に失敗しました: {e}")
+            self.evicted += 1
+        if expired:
+            print(f"🧹 期限切れのセッションを {len(expired)} 件破棄しました（残り {len(self.__sessions)} 件）")
+
+    async def run_eviction(self, interval: float = EVICTION_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            await self.evict_idle()
+
+    def stats(self):
+        return {
+            "sessions": len(self.__sessions),
+            "connected": self.connected_sessions,
+            "evicted": self.evicted,
+            "tts_cache": self.speech_instance.cache_stats() if self.speech_instance else {},
+        }
+
+
+class WebSocketSender:
+    """複数のステージから同じ WebSocket へ順に送信する"""
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.__lock = asyncio.Lock()
+        self.closed = False
+
+    async def __send(self, send, payload):
+        if self.closed:
+            return
+        async with self.__lock:
+            try:
+                await send(payload)
+            except Exception:
+                # 切断済みの場合は以降の送信を行わない
+                self.closed = True
+
+    async def send_json(self, payload: dict):
+        await self.__send(self.websocket.send_json, payload)
+
+    async def send_bytes(self, payload: bytes):
+        await self.__send(self.websocket.send_bytes, payload)
+
+
+def wav_duration(audio_data: bytes):
+    """WAV バイナリの再生時間（秒）"""
+    try:
+        with wave.open(io.BytesIO(audio_data)) as wav:
+            return wav.getnframes() / wav.getframerate()
+    except (wave.Error, EOFError):
+        return 0.0
+
+
+class WebSocketTranscriptionStage(TranscriptionStage):
+    """文字起こし結果をクライアントにも通知する先頭のステージ"""
+
+    def __init__(self, transcript_instance: TranscriptionService, sender: WebSocketSender):
+        super().__init__(transcript_instance)
+        self.sender = sender
+
+    async def produce(self):
+        async for transcript in super().produce():
+            await self.sender.send_json({"type": "transcript", "text": transcript})
+            yield transcript
+
+
+class WebSocketPlaybackStage(PlaybackStage):
+    """合成した音声をクライアントへ送信するステージ（再生はクライアント側で行う）"""
+
+    def __init__(self, speech_instance: SpeechSynthesis, transcript_instance: TranscriptionService, sender: WebSocketSender):
+        super().__init__(speech_instance, transcript_instance)
+        self.sender = sender
+        # クライアント側で再生し終えると見込まれる時刻（time.monotonic() の値）
+        self.__playback_until = 0.0
+        self.__started_turn = None
+
+    async def play(self, audio_data: bytes, text: str, turn_id: str = None):
+        now = time.monotonic()
+        if turn_id is not None and turn_id != self.__started_turn:
+            self.__started_turn = turn_id
+            get_tracer().event("playback.start", turn_id=turn_id)
+        # クライアントがこの音声を再生すると見込まれる間だけマイク入力をミュートする
+        start_at = max(self.__playback_until, now)
+        self.__playback_until = start_at + wav_duration(audio_data)
+        key = self.mute_key(turn_id)
+        loop = asyncio.get_running_loop()
+        loop.call_later(start_at - now, self.transcript_instance.mute, key)
+        self.unmute_later(key, self.__playback_until - now)
+        await self.sender.send_json({"type": "sentence", "text": text})
+        await self.sender.send_bytes(audio_data)
+
+    async def finish_turn(self, turn_end: TurnEnd):
+        # クライアントが再生し終えてからターンの終わりを通知する
+        await asyncio.sleep(max(self.__playback_until - time.monotonic(), 0))
+        await self.sender.send_json({"type": "turn_end"})
+
+    async def close(self):
+        # 音声合成はセッション間で共有しているため閉じない
+        pass
+
+
+def build_session_pipeline(session: VoiceSession, transcript_instance: TranscriptionService, speech_instance: SpeechSynthesis, sender: WebSocketSender):
+    """1接続分の 文字起こし → エージェント → 音声合成 → 送信 のパイプラインを生成する"""
+    return Pipeline(
+        [
+            WebSocketTranscriptionStage(transcript_instance, sender),
+            AgentStage(session.agent, transcript_instance),
+            SynthesisStage(speech_instance),
+            WebSocketPlaybackStage(speech_instance, transcript_instance, sender),
+        ],
+        queue_size=VOICE_QUEUE_SIZE,
+    )
+
+
+async def handle_control(text: str, pipeline: Pipeline):
+    """クライアントからの制御メッセージを処理する"""
+    try:
+        control = json.loads(text)
+    except json.JSONDecodeError:
+        return
+    if control.get("type") == "interrupt":
+        # 応答中の処理を中断する（バージイン）
+        pipeline.interrupt("agent")
+
+
+async def voice_endpoint(websocket: WebSocket):
+    """音声対話の WebSocket エンドポイント
+
+    クライアント → サーバ: バイナリで生 PCM（16kHz・16bit・モノラル）、テキストで {"type": "interrupt"}
+    サーバ → クライアント: バイナリで1文ごとの WAV、テキストで session / transcript / sentence / turn_end の通知
+    """
+    manager = websocket.app.state.manager
+    await websocket.accept()
+    user_id = websocket.query_params.get("user_id", "kiosk")
+    session_id = websocket.query_params.get("session_id") or uuid.uuid4().hex
+    session = manager.acquire(user_id, session_id)
+    if session is None:
+        await websocket.close(code=CLOSE_TRY_AGAIN_LATER)
+        return
+    sender = WebSocketSender(websocket)
+    await sender.send_json({"type": "session", "user_id": user_id, "session_id": session_id})
+    print(f"🔌 セッションが接続しました: {user_id}/{session_id}（接続中 {manager.connected_sessions} 件）")
+
+    source = PcmStreamSource(SAMPLE_RATE, CHANNEL_NUMS)
+    transcript_instance = TranscriptionService(capture=source, client=manager.stt_client)
+    pipeline = build_session_pipeline(session, transcript_instance, manager.speech_instance, sender)
+    pipeline_task = asyncio.create_task(pipeline.run())
+    try:
+        while not pipeline_task.done():
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes"):
+                source.feed(message["bytes"])
+            elif message.get("text"):
+                await handle_control(message["text"], pipeline)
+    finally:
+        pipeline_task.cancel()
+        await asyncio.gather(pipeline_task, return_exceptions=True)
+        manager.release(session)
+        print(f"🔌 セッションが切断しました: {user_id}/{session_id}")
+
+
+def create_app(manager: VoiceSessionManager = None):
+    """複数セッションの音声対話サーバ（Starlette アプリ）を生成する"""
+    manager = manager or VoiceSessionManager()
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        await manager.start()
+        eviction_task = asyncio.create_task(manager.run_eviction())
+        try:
+            yield
+        finally:
+            eviction_task.cancel()
+            await manager.close()
+
+    app = Starlette(routes=[WebSocketRoute("/ws", voice_endpoint)], lifespan=lifespan)
+    app.state.manager = manager
+    return app
+
+
+def run_server(host: str = "0.0.0.0", port: int = 8765, session_ttl: float = SESSION_TTL_SECONDS, max_sessions: int = MAX_SESSIONS):
+    """音声対話サーバを起動する"""
+    app = create_app(VoiceSessionManager(session_ttl=session_ttl, max_sessions=max_sessions))
+    uvicorn.run(app, host=host, port=port)
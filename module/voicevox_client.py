@@ -0,0 +1,205 @@
+import time
+import asyncio
+import datetime
+
+import httpx
+from google.oauth2 import id_token
+from google.auth.transport import requests as grequests
+
+from module.tracing import get_tracer
+
+
+# HTTP タイムアウト（秒）
+CONNECT_TIMEOUT = 5.0
+AUDIO_QUERY_TIMEOUT = 10.0
+SYNTHESIS_TIMEOUT = 30.0
+# コネクションプールの設定
+MAX_CONNECTIONS = 8
+MAX_KEEPALIVE_CONNECTIONS = 4
+KEEPALIVE_EXPIRY = 300.0
+# ID トークンの有効期限の何秒前に更新するか
+TOKEN_REFRESH_MARGIN = 300
+# 有効期限が取得できなかった場合にトークンを使い回す時間（秒）
+DEFAULT_TOKEN_LIFETIME = 3000
+
+
+class IdTokenProvider:
+    """Cloud Run 呼び出し用の ID トークンをキャッシュし、有効期限前にバックグラウンドで更新する"""
+
+    def __init__(self, audience_url: str, refresh_margin: int = TOKEN_REFRESH_MARGIN):
+        """
+        audience_url: ID トークンの audience（Cloud Run の URL）
+        refresh_margin: 有効期限の何秒前に更新するか
+        """
+        self.audience_url = audience_url
+        self.refresh_margin = refresh_margin
+        self.__credentials = None
+        self.__token = None
+        self.__expiry = None
+        self.__lock = asyncio.Lock()
+        self.__refresh_task = None
+
+    def __fetch_token(self):
+        """
+        サービスアカウントキーを使用してIDトークンを取得します。
+        環境変数 GOOGLE_APPLICATION_CREDENTIALS が設定されている必要があります。
+        """
+        auth_req = grequests.Request()
+        if self.__credentials is None:
+            self.__credentials = id_token.fetch_id_token_credentials(self.audience_url, request=auth_req)
+        self.__credentials.refresh(auth_req)
+        expiry = self.__credentials.expiry
+        if expiry is None:
+            expiry = datetime.datetime.utcnow() + datetime.timedelta(seconds=DEFAULT_TOKEN_LIFETIME)
+        return self.__credentials.token, expiry
+
+    def __seconds_until_refresh(self):
+        """次の更新までの秒数"""
+        if self.__expiry is None:
+            return 0
+        remaining = (self.__expiry - datetime.datetime.utcnow()).total_seconds()
+        return remaining - self.refresh_margin
+
+    async def __refresh(self):
+        """トークンを更新する（同時に複数回走らないようロックする）"""
+        async with self.__lock:
+            if self.__token is not None and self.__seconds_until_refresh() > 0:
+                return self.__token
+            print("IDトークンを取得しています...")
+            self.__token, self.__expiry = await asyncio.to_thread(self.__fetch_token)
+            print("IDトークンを取得しました。")
+            return self.__token
+
+    async def __refresh_loop(self):
+        """有効期限の少し前にトークンを更新し続けるバックグラウンドタスク"""
+        while True:
+            await asyncio.sleep(max(self.__seconds_until_refresh(), 1))
+            try:
+                await self.__refresh()
+            except Exception as e:
+                print(f"IDトークンの更新に失敗しました: {e}")
+                await asyncio.sleep(10)
+
+    async def get_token(self):
+        """有効な ID トークンを返す"""
+        if self.__token is None or self.__seconds_until_refresh() <= 0:
+            await self.__refresh()
+        if self.__refresh_task is None or self.__refresh_task.done():
+            self.__refresh_task = asyncio.create_task(self.__refresh_loop())
+        return self.__token
+
+    def invalidate(self):
+        """トークンを無効化し、次回の取得時に再発行させる"""
+        self.__token = None
+        self.__expiry = None
+
+    async def close(self):
+        """バックグラウンド更新を停止する"""
+        if self.__refresh_task is not None:
+            self.__refresh_task.cancel()
+            try:
+                await self.__refresh_task
+            except asyncio.CancelledError:
+                pass
+            self.__refresh_task = None
+
+
+class VoiceVoxClient:
+    """コネクションを使い回す非同期の VoiceVox クライアント"""
+
+    def __init__(
+        self,
+        audio_query_url: str,
+        synthesis_url: str,
+        token_provider: IdTokenProvider = None,
+        basic_password: str = None,
+    ):
+        """
+        audio_query_url: audio_query エンドポイントの URL
+        synthesis_url: synthesis エンドポイントの URL
+        token_provider: Cloud Run 認証用の ID トークン取得クラス（不要な場合は None）
+        basic_password: CustomAuthorization ヘッダに設定する値
+        """
+        self.audio_query_url = audio_query_url
+        self.synthesis_url = synthesis_url
+        self.token_provider = token_provider
+        self.basic_password = basic_password
+        self.__client = httpx.AsyncClient(
+            timeout=httpx.Timeout(SYNTHESIS_TIMEOUT, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+        )
+
+    async def __headers(self):
+        """認証ヘッダを生成する"""
+        headers = {}
+        if self.basic_password:
+            headers["CustomAuthorization"] = self.basic_password
+        if self.token_provider is not None:
+            headers["Authorization"] = f"Bearer {await self.token_provider.get_token()}"
+        return headers
+
+    async def __send(self, url: str, timeout: float, started: float, attrs: dict, **kwargs):
+        """リクエストを送信し、最初の応答バイトが届くまでの時間を attrs に記録してから本文を読む"""
+        request = self.__client.build_request("POST", url, headers=await self.__headers(), timeout=timeout, **kwargs)
+        response = await self.__client.send(request, stream=True)
+        attrs["first_byte_ms"] = (time.perf_counter() - started) * 1000
+        try:
+            await response.aread()
+        finally:
+            await response.aclose()
+        return response
+
+    async def __post(self, span_name: str, url: str, timeout: float, **kwargs):
+        """POST リクエストを送信する。401 の場合はトークンを更新して1度だけ再送する"""
+        with get_tracer().span(span_name) as attrs:
+            started = time.perf_counter()
+            response = await self.__send(url, timeout, started, attrs, **kwargs)
+            if response.status_code == 401 and self.token_provider is not None:
+                self.token_provider.invalidate()
+                response = await self.__send(url, timeout, started, attrs, **kwargs)
+            attrs["status"] = response.status_code
+        return response
+
+    async def audio_query(self, text: str, speaker: int):
+        """audio_query エンドポイントで合成用パラメータを取得する"""
+        r = await self.__post(
+            "voicevox.audio_query",
+            self.audio_query_url,
+            AUDIO_QUERY_TIMEOUT,
+            params={"text": text, "speaker": speaker},
+        )
+        if r.status_code != 200:
+            print("audio_query に失敗しました:", r.text)
+            return None
+        return r.json()
+
+    async def synthesis(self, query: dict, speaker: int):
+        """synthesis エンドポイントで音声合成し、WAV バイナリを返す"""
+        r = await self.__post(
+            "voicevox.synthesis",
+            self.synthesis_url,
+            SYNTHESIS_TIMEOUT,
+            params={"speaker": speaker},
+            json=query,
+        )
+        if r.status_code != 200:
+            print("synthesis に失敗しました:", r.text)
+            return None
+        return r.content
+
+    async def synthesize(self, text: str, speaker: int):
+        """テキストから WAV バイナリを生成する"""
+        query = await self.audio_query(text, speaker)
+        if query is None:
+            return None
+        return await self.synthesis(query, speaker)
+
+    async def aclose(self):
+        """コネクションプールとトークン更新タスクを閉じる"""
+        await self.__client.aclose()
+        if self.token_provider is not None:
+            await self.token_provider.close()
@@ -1,4 +1,5 @@
 import os
+import time
 import asyncio
 import traceback
 
@@ -6,50 +7,111 @@ import google.auth
 import vertexai
 import google.generativeai as genai
 from google.adk.agents import Agent
+from google.adk.agents.run_config import RunConfig, StreamingMode
 from google.genai import types
-from google.adk.sessions import InMemorySessionService
 from google.adk.runners import Runner
 
 from module.model_armor_plugin import ModelArmorPlugin
-from module.main_agent.zunda_agent.agent import root_agent as zundamon_root_agent
+from module.model_armor_guard import ModelArmorGuard
+from module.sentence_splitter import SentenceBuffer
+from module.sqlite_session_service import create_session_service
+from module.tracing import current_turn, get_tracer
+
+
+# Model Armor で応答がブロックされた場合の応答
+BLOCKED_RESPONSE_TEXT = "申し訳ないのだが、その内容にはお答えできないのだ。別の質問をお願いするのだ〜。"
+
+
+class AgentStreamChunk():
+    """stream_conversation が返す応答の断片"""
+    def __init__(self, text: str, is_sentence: bool = False, verdict: asyncio.Future = None, turn_id: str = None):
+        """
+        text: テキスト
+        is_sentence: True の場合は文単位で確定したテキスト（そのまま音声合成に渡せる）。
+            False の場合は生成途中の部分テキスト（表示用）
+        verdict: 文の Model Armor 判定結果（True で許可）を返す Future。
+            音声合成は判定を待たずに始めてよいが、再生・表示の前には必ず結果を待つこと
+        turn_id: レイテンシ計測用のターン ID
+        """
+        self.text = text
+        self.is_sentence = is_sentence
+        self.verdict = verdict
+        self.turn_id = turn_id
 
 
 class ZundaAgent():
     """ずんだもんのエージェントクラス"""
-    def __init__(self, user_id: str, session_id: str):
+    def __init__(
+        self,
+        user_id: str,
+        session_id: str,
+        guard: ModelArmorGuard = None,
+        root_agent: Agent = None,
+        runner: Runner = None,
+        session_ttl: float = None,
+    ):
+        """
+        user_id: ユーザーID
+        session_id: セッションID
+        guard: 応答を確認する Model Armor ガード（省略時は環境変数に応じて生成）
+        root_agent: 実行するルートエージェント（省略時は Vertex AI を初期化してずんだもんのエージェントを使う。
+            ベンチマーク用の疑似モデルなど、Vertex AI を使わないエージェントに差し替える場合に指定する）
+        runner: 他のインスタンスと共有する Runner（指定時は Vertex AI の初期化を省略し、
+            Runner のセッションサービスにこのインスタンスのセッションを作る）
+        session_ttl: この秒数以上会話がなかった場合、次の問い合わせの前にセッションを初期化する（None の場合は初期化しない）
+        """
         # 初期値設定
         self.__APP_NAME = "zundamon_app"
         self.__USER_ID = user_id
         self.__SESSION_ID = session_id
-        # セッション生成
-        self.__session_service = InMemorySessionService()
-        # モデルアーマー
-        self.__model_armor_ins = ModelArmorPlugin()
+        # モデルアーマー（非同期・判定結果キャッシュ付き）
+        self.__guard = guard or ModelArmorGuard()
+        self.session_ttl = session_ttl
+        # 最後に会話した時刻（time.monotonic() の値）
+        self.last_active_at = time.monotonic()
+        # ずんだもんのエージェント（リモートエージェントを使う）のモジュール。実行する場合だけ読み込み、start() でリモートエージェントの準備を行う
+        self.__zundamon_agent = None
+
+        if runner is not None:
+            # Runner とセッションサービスを共有する（セッションは user_id・session_id ごとに分かれる）
+            self.__APP_NAME = runner.app_name
+            self.__session_service = runner.session_service
+            self.__root_agent = runner.agent
+            self.__runner = runner
+            return
+
+        # セッション生成（環境変数 SESSION_DB_PATH を指定した場合は SQLite に保存する）
+        self.__session_service = create_session_service()
 
         # Vertex AIのリージョンを設定
         self.__LOCATION = os.environ.get("GOOGLE_CLOUD_REGION", "asia-northeast1")
 
         try:
-            # デフォルトの認証情報とプロジェクトIDを取得
-            credentials, project_id = google.auth.default()
-            if not project_id:
-                project_id = os.environ.get('GOOGLE_CLOUD_PROJECT')
+            if root_agent is None:
+                # デフォルトの認証情報とプロジェクトIDを取得
+                credentials, project_id = google.auth.default()
                 if not project_id:
-                    raise ValueError(
-                        "Google CloudのプロジェクトIDを特定できませんでした。"
-                        "環境変数 `GOOGLE_CLOUD_PROJECT` を設定するか、"
-                        "gcloud CLIで `gcloud config set project YOUR_PROJECT_ID` を実行してください。"
-                    )
+                    project_id = os.environ.get('GOOGLE_CLOUD_PROJECT')
+                    if not project_id:
+                        raise ValueError(
+                            "Google CloudのプロジェクトIDを特定できませんでした。"
+                            "環境変数 `GOOGLE_CLOUD_PROJECT` を設定するか、"
+                            "gcloud CLIで `gcloud config set project YOUR_PROJECT_ID` を実行してください。"
+                        )
 
-            # 1. vertexaiライブラリを初期化し、プロジェクトとロケーションのコンテキストを設定します。
-            vertexai.init(project=project_id, location=self.__LOCATION, credentials=credentials)
+                # 1. vertexaiライブラリを初期化し、プロジェクトとロケーションのコンテキストを設定します。
+                vertexai.init(project=project_id, location=self.__LOCATION, credentials=credentials)
 
-            # 2. genaiライブラリに、通信バックエンドとしてVertex AIを使用するよう明示的に指示します。
-            # これにより、ADKが内部でgenaiを呼び出す際に、自動的にVertex AIが使われるようになります。
-            genai.configure(transport="vertex_ai")
+                # 2. genaiライブラリに、通信バックエンドとしてVertex AIを使用するよう明示的に指示します。
+                # これにより、ADKが内部でgenaiを呼び出す際に、自動的にVertex AIが使われるようになります。
+                genai.configure(transport="vertex_ai")
 
-            # 上記の設定により、ADKは正しいバックエンドを自動的に見つけます。
-            self.__root_agent = zundamon_root_agent
+                # 上記の設定により、ADKは正しいバックエンドを自動的に見つけます。
+                # リモートエージェントのエージェントカードの URL を環境変数から読むため、使う場合だけ読み込む
+                from module.main_agent.zunda_agent import agent as zundamon_agent
+                root_agent = zundamon_agent.root_agent
+                self.__zundamon_agent = zundamon_agent
+            self.__root_agent = root_agent
             
             # Runner（エージェント実行クラス）の生成
             self.__runner = Runner(
@@ -65,6 +127,15 @@ class ZundaAgent():
             print(f"!!! 初期化中に予期せぬエラーが発生しました: {e}")
             raise
 
+    async def start(self):
+        """リモートエージェントのエージェントカードの取得とヘルスチェックを開始する（起動時にイベントループ上で呼ぶ）"""
+        if self.__zundamon_agent is not None:
+            await self.__zundamon_agent.start_remote_agents()
+
+    async def close(self):
+        if self.__zundamon_agent is not None:
+            await self.__zundamon_agent.close_remote_agents()
+
     def send_query(self, query: str):
         """Agent実行"""
         try:
@@ -85,15 +156,38 @@ class ZundaAgent():
                     final_response_text = f"Agent escalated: {event.error_message or 'No specific message.'}"
                     break
         # Model Armorでの応答内容チェック
-        if self.__model_armor_ins.call_model_armor_api(final_response_text):
+        if await self.__guard.screen(final_response_text):
             print(f"<<< Zundamon Agent: {final_response_text}")
         else:
-            final_response_text = "申し訳ないのだが、その内容にはお答えできないのだ。別の質問をお願いするのだ〜。"
+            final_response_text = BLOCKED_RESPONSE_TEXT
             print(f"<<< Zundamon Agent: {final_response_text}")
         return final_response_text
 
-    async def run_conversation(self, query: str = ""):
-        """エージェントで会話実行"""
+    def for_session(self, user_id: str, session_id: str, session_ttl: float = None):
+        """Runner・Model Armor ガードを共有し、別のセッションで会話するインスタンスを生成する"""
+        return ZundaAgent(
+            user_id=user_id,
+            session_id=session_id,
+            guard=self.__guard,
+            runner=self.__runner,
+            session_ttl=self.session_ttl if session_ttl is None else session_ttl,
+        )
+
+    async def reset_session(self):
+        """セッション（会話履歴）を破棄する。次の問い合わせで新しいセッションが作られる"""
+        await self.__session_service.delete_session(
+            app_name=self.__APP_NAME,
+            user_id=self.__USER_ID,
+            session_id=self.__SESSION_ID
+        )
+
+    async def __ensure_session(self):
+        """セッションがなければ作成する（一定時間会話がなかった場合は初期化してから作成する）"""
+        now = time.monotonic()
+        if self.session_ttl is not None and now - self.last_active_at > self.session_ttl:
+            print("一定時間会話がなかったため、セッションを初期化します。")
+            await self.reset_session()
+        self.last_active_at = now
         existing_session = await self.__session_service.get_session(
             app_name=self.__APP_NAME,
             user_id=self.__USER_ID,
@@ -105,6 +199,67 @@ class ZundaAgent():
                 user_id=self.__USER_ID,
                 session_id=self.__SESSION_ID
             )
+
+    async def run_conversation(self, query: str = ""):
+        """エージェントで会話実行"""
+        await self.__ensure_session()
         return await self.call_agent_async(
             query=query,
         )
+
+    def __sentence_chunk(self, sentence: str, turn_id: str):
+        """文単位のチャンクを生成し、Model Armor の確認をバックグラウンドで開始する"""
+        return AgentStreamChunk(
+            sentence,
+            is_sentence=True,
+            verdict=self.__guard.screen_in_background(sentence),
+            turn_id=turn_id,
+        )
+
+    async def stream_conversation(self, query: str = ""):
+        """エージェントで会話実行（ストリーミング）
+        生成途中の部分テキストと、文単位で確定したテキストを AgentStreamChunk として順に返す。
+        文単位のテキストは Model Armor の確認をバックグラウンドで開始した状態で返すため、
+        利用側は verdict を待ってから再生すること（ブロック時は BLOCKED_RESPONSE_TEXT に差し替える）
+        """
+        await self.__ensure_session()
+        content = types.Content(role='user', parts=[types.Part(text=query)])
+        sentence_buffer = SentenceBuffer()
+        tracer = get_tracer()
+        turn_id = current_turn.get()
+        # 部分テキストを受け取った応答かどうか（最終イベントで同じテキストを二重に扱わないため）
+        received_partial = False
+        response_text = ""
+        start, started = time.time(), time.perf_counter()
+        first_event = True
+        async for event in self.__runner.run_async(
+            user_id=self.__USER_ID,
+            session_id=self.__SESSION_ID,
+            new_message=content,
+            run_config=RunConfig(streaming_mode=StreamingMode.SSE),
+        ):
+            if first_event:
+                first_event = False
+                tracer.record("agent.first_event", start, time.perf_counter() - started, turn_id=turn_id)
+            text = ""
+            if event.content and event.content.parts:
+                text = "".join(part.text for part in event.content.parts if part.text)
+            if event.partial:
+                received_partial = True
+            elif received_partial:
+                # 部分テキストを集約した最終イベントは読み飛ばす
+                received_partial = False
+                continue
+            elif event.actions and event.actions.escalate:
+                text = f"Agent escalated: {event.error_message or 'No specific message.'}"
+            if not text:
+                continue
+            response_text += text
+            yield AgentStreamChunk(text, turn_id=turn_id)
+            # 文末まで届いた文は、Model Armor の確認を並行して開始してから返す
+            for sentence in sentence_buffer.feed(text):
+                yield self.__sentence_chunk(sentence, turn_id)
+        tracer.record("agent.final_response", start, time.perf_counter() - started, turn_id=turn_id)
+        for sentence in sentence_buffer.flush():
+            yield self.__sentence_chunk(sentence, turn_id)
+        print(f"<<< Zundamon Agent: {response_text}")
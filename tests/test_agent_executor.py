@@ -0,0 +1,63 @@
+import uuid
+import asyncio
+
+import pytest
+
+pytest.importorskip("google.adk")
+pytest.importorskip("a2a")
+
+from a2a.server.agent_execution import RequestContext
+from a2a.server.events import EventQueue
+from a2a.types import Message, MessageSendParams, Part, Role, TextPart
+from google.adk.agents import Agent
+
+from agent_executor import ADKAgentExecutor
+from sqlite_session_service import SqliteSessionService
+
+
+QUESTION = "屋台を教えて"
+
+
+def run_contexts(executor: ADKAgentExecutor, count: int):
+    """count 個の別々の A2A コンテキストから同じ質問を送る（キャッシュから答えるためモデルは呼ばない）"""
+    executor.response_cache.put(QUESTION, "中洲にたくさんあるのだ")
+
+    async def scenario():
+        for i in range(count):
+            message = Message(
+                role=Role.user,
+                parts=[Part(root=TextPart(text=QUESTION))],
+                message_id=uuid.uuid4().hex,
+                context_id=f"context-{i}",
+            )
+            await executor.execute(RequestContext(request=MessageSendParams(message=message)), EventQueue())
+
+    asyncio.run(scenario())
+    return executor.stats()
+
+
+def create_agent():
+    return Agent(name="yatai", model="gemini-2.5-flash")
+
+
+def test_in_memory_sessions_are_bounded_by_max_sessions():
+    executor = ADKAgentExecutor(create_agent(), max_sessions=3)
+    stats = run_contexts(executor, 20)
+    assert stats["tasks_executed"] == 20
+    assert stats["sessions_created"] == 20
+    assert stats["sessions"] <= 3
+    assert stats["sessions_evicted"] == 17
+
+
+def test_sqlite_sessions_are_not_tracked_in_memory(tmp_path):
+    service = SqliteSessionService(str(tmp_path / "sessions.db"), max_hot_sessions=3, ttl=0)
+    try:
+        executor = ADKAgentExecutor(create_agent(), session_service=service, max_sessions=3)
+        stats = run_contexts(executor, 20)
+        assert stats["tasks_executed"] == 20
+        assert stats["sessions"] <= 3
+        # SQLite のセッションは削除せず、メモリに保持する件数だけを制限する
+        assert stats["sessions_evicted"] == 0
+        assert stats["session_store"]["hot_sessions"] <= 3
+    finally:
+        service.close()
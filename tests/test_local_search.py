@@ -0,0 +1,76 @@
+import os
+import json
+
+from local_search import LocalSearch, build_index, tokenize
+
+
+def write_corpus(directory):
+    with open(os.path.join(directory, "guide.txt"), "w", encoding="utf-8") as f:
+        f.write("お祭りの会場は川沿いの公園です。\n\n花火は夜八時から打ち上げます。")
+    with open(os.path.join(directory, "stalls.jsonl"), "w", encoding="utf-8") as f:
+        for record in [
+            {"name": "ずんだ餅", "place": "北口", "price": 300},
+            {"name": "たこ焼き", "place": "南口", "price": 500},
+        ]:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def test_tokenize_uses_bigrams_and_ignores_punctuation():
+    assert tokenize("ＡＢＣ、なのだ") == ["ab", "bc", "なの", "のだ"]
+    assert tokenize("x") == ["x"]
+
+
+def test_build_and_search(tmp_path):
+    corpus, index_dir = tmp_path / "corpus", str(tmp_path / "index")
+    corpus.mkdir()
+    write_corpus(corpus)
+
+    result = build_index([str(corpus)], index_dir)
+    assert result["added"] == 2
+    assert result["documents"] == 3
+
+    search = LocalSearch(index_dir, top_k=3)
+    results = search.search("たこ焼きはどこ")
+    assert results[0]["id"] == "stalls.jsonl#1"
+    assert results[0]["data"]["place"] == "南口"
+    assert search.search("花火の時間")[0]["title"] == "guide.txt"
+    assert search.search("ラーメン") == []
+    assert search.stats()["documents"] == 3
+
+
+def test_rebuild_reuses_unchanged_files(tmp_path):
+    corpus, index_dir = tmp_path / "corpus", str(tmp_path / "index")
+    corpus.mkdir()
+    write_corpus(corpus)
+    build_index([str(corpus)], index_dir)
+    meta_mtime = os.stat(os.path.join(index_dir, "meta.json")).st_mtime_ns
+
+    # 変更がなければ書き出さない
+    result = build_index([str(corpus)], index_dir)
+    assert result == {"added": 0, "updated": 0, "unchanged": 2, "removed": 0, "documents": 3}
+    assert os.stat(os.path.join(index_dir, "meta.json")).st_mtime_ns == meta_mtime
+
+
+def test_rebuild_picks_up_updated_and_removed_files(tmp_path):
+    corpus, index_dir = tmp_path / "corpus", str(tmp_path / "index")
+    corpus.mkdir()
+    write_corpus(corpus)
+    build_index([str(corpus)], index_dir)
+    search = LocalSearch(index_dir)
+    assert search.search("りんご飴") == []
+
+    with open(corpus / "stalls.jsonl", "a", encoding="utf-8") as f:
+        f.write(json.dumps({"name": "りんご飴", "place": "西口", "price": 400}, ensure_ascii=False) + "\n")
+    result = build_index([str(corpus)], index_dir)
+    assert result["updated"] == 1
+    assert result["unchanged"] == 1
+    assert result["documents"] == 4
+    # インデックスが作り直されたら、次の検索で読み込み直す
+    assert search.search("りんご飴")[0]["data"]["place"] == "西口"
+
+    os.remove(corpus / "guide.txt")
+    result = build_index([str(corpus)], index_dir)
+    assert result["removed"] == 1
+    assert result["documents"] == 3
+    assert search.search("花火") == []
+    assert search.search("ずんだ餅")[0]["id"] == "stalls.jsonl#0"
@@ -0,0 +1,135 @@
+import json
+import time
+import asyncio
+
+import pytest
+
+pytest.importorskip("google.adk")
+
+import httpx
+
+import module.remote_fanout as remote_fanout
+from module.remote_fanout import RemoteFanout, percentile, result_text
+
+
+CARDS = {
+    "yatai": "http://yatai.test/.well-known/agent-card.json",
+    "dayori": "http://dayori.test/.well-known/agent-card.json",
+}
+
+
+def answer(text: str):
+    return {"jsonrpc": "2.0", "id": "1", "result": {"kind": "message", "parts": [{"kind": "text", "text": text}]}}
+
+
+class FakeAgents:
+    """エージェントカードを返し、message/send にはエージェントごとに決めた遅延・応答を返す"""
+
+    def __init__(self, behaviors: dict):
+        """behaviors: ホスト名 → 何回目の送信か（0 始まり）を受け取り、(遅延秒, 応答) を返す関数"""
+        self.behaviors = behaviors
+        self.sent = {host: 0 for host in behaviors}
+        self.cancelled = 0
+
+    async def __call__(self, request: httpx.Request):
+        host = request.url.host
+        if request.method == "GET":
+            return httpx.Response(200, json={"url": f"http://{host}/a2a"})
+        attempt = self.sent[host]
+        self.sent[host] += 1
+        delay, response = self.behaviors[host](attempt)
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return response
+
+    def client(self):
+        return httpx.AsyncClient(transport=httpx.MockTransport(self))
+
+
+@pytest.fixture(autouse=True)
+def short_hedge_delay(monkeypatch):
+    monkeypatch.setattr(remote_fanout, "DEFAULT_HEDGE_DELAY", 0.05)
+
+
+def test_result_text_reads_message_and_task_artifacts():
+    assert result_text(answer("なのだ")["result"]) == "なのだ"
+    task = {"kind": "task", "artifacts": [{"parts": [{"kind": "text", "text": "北口"}, {"kind": "data", "data": {}}]}]}
+    assert result_text(task) == "北口"
+    assert percentile([3, 1, 2, 5, 4], 50) == 3
+
+
+def test_slow_attempt_is_hedged_and_hedge_wins():
+    agents = FakeAgents({
+        # 1回目は返ってこず、重複送信した2回目がすぐ返る
+        "yatai.test": lambda attempt: (5.0 if attempt == 0 else 0.0, httpx.Response(200, json=answer("南口なのだ"))),
+    })
+
+    async def scenario():
+        async with agents.client() as client:
+            fanout = RemoteFanout({"yatai": CARDS["yatai"]}, deadline=2.0, client=client)
+            started = time.perf_counter()
+            assert await fanout.ask("yatai", "たこ焼きはどこ") == "南口なのだ"
+            elapsed = time.perf_counter() - started
+            await asyncio.sleep(0)
+            return fanout, elapsed
+
+    fanout, elapsed = asyncio.run(scenario())
+    assert elapsed < 1.0
+    assert fanout.counts["hedges"] == 1
+    assert fanout.counts["hedge_wins"] == 1
+    assert agents.sent["yatai.test"] == 2
+    # 負けた方の問い合わせはキャンセルされる
+    assert agents.cancelled == 1
+
+
+def test_deadline_returns_answers_so_far_and_cancels_late_agent():
+    agents = FakeAgents({
+        "yatai.test": lambda attempt: (0.0, httpx.Response(200, json=answer("南口なのだ"))),
+        "dayori.test": lambda attempt: (5.0, httpx.Response(200, json=answer("遅すぎたのだ"))),
+    })
+
+    async def scenario():
+        async with agents.client() as client:
+            fanout = RemoteFanout(CARDS, deadline=0.3, client=client)
+            started = time.perf_counter()
+            result = await fanout.ask_all("屋台を教えて")
+            elapsed = time.perf_counter() - started
+            await asyncio.sleep(0)
+            return fanout, result, elapsed
+
+    fanout, (answers, missing), elapsed = asyncio.run(scenario())
+    assert answers == {"yatai": "南口なのだ"}
+    assert missing == ["dayori"]
+    assert elapsed < 1.0
+    assert fanout.counts["calls"] == 2
+    assert fanout.counts["late"] == 1
+    assert fanout.counts["failed"] == 0
+    # 期限切れの問い合わせ（元の送信とヘッジの両方）はキャンセルされる
+    assert agents.sent["dayori.test"] == 2
+    assert agents.cancelled == 2
+
+
+def test_error_response_is_reported_as_failed():
+    agents = FakeAgents({
+        "yatai.test": lambda attempt: (0.0, httpx.Response(200, json=answer("南口なのだ"))),
+        "dayori.test": lambda attempt: (
+            0.0,
+            httpx.Response(200, content=json.dumps({"jsonrpc": "2.0", "id": "1", "error": {"message": "busy"}})),
+        ),
+    })
+
+    async def scenario():
+        async with agents.client() as client:
+            fanout = RemoteFanout(CARDS, deadline=2.0, client=client)
+            return fanout, await fanout.ask_all("屋台を教えて")
+
+    fanout, (answers, missing) = asyncio.run(scenario())
+    assert answers == {"yatai": "南口なのだ"}
+    assert missing == ["dayori"]
+    assert fanout.counts["failed"] == 1
+    assert fanout.counts["late"] == 0
+    # 失敗した場合もすぐにもう1回だけ送り直す
+    assert agents.sent["dayori.test"] == 2
@@ -0,0 +1,51 @@
+from response_cache import ResponseCache, is_follow_up, normalize_query
+
+
+def test_normalize_query_ignores_width_case_spaces_and_punctuation():
+    assert normalize_query("ＡＢＣ　屋台は？") == normalize_query("abc屋台は")
+    assert normalize_query("ﾀｺ焼き、どこ!") == normalize_query("タコ焼き どこ")
+    assert normalize_query("たこ焼きはどこ") != normalize_query("焼きそばはどこ")
+
+
+def test_is_follow_up_only_with_history():
+    assert not is_follow_up("それはどこ？", has_history=False)
+    assert is_follow_up("それはどこ？", has_history=True)
+    assert is_follow_up("ほんと？", has_history=True)
+    assert not is_follow_up("たこ焼きの屋台はどこにある？", has_history=True)
+
+
+def test_get_returns_cached_response_for_equivalent_query():
+    cache = ResponseCache(ttl=60, max_entries=8)
+    assert cache.get("たこ焼きはどこ？") is None
+    cache.put("たこ焼きはどこ？", "南口なのだ")
+    assert cache.get("たこ焼きは どこ") == "南口なのだ"
+    cache.bypass()
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["bypassed"]) == (1, 1, 1)
+    assert stats["hit_rate"] == 0.5
+
+
+def test_expired_response_is_dropped():
+    cache = ResponseCache(ttl=-1, max_entries=8)
+    cache.put("花火は何時から", "夜八時なのだ")
+    assert cache.get("花火は何時から") is None
+    assert cache.stats()["cached_responses"] == 0
+
+
+def test_evicts_least_recently_used():
+    cache = ResponseCache(ttl=60, max_entries=2)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    # a を参照して最近使ったものにすると、次に追い出されるのは b
+    assert cache.get("a") == "1"
+    cache.put("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+
+
+def test_empty_query_or_response_is_not_cached():
+    cache = ResponseCache(ttl=60, max_entries=8)
+    cache.put("？？", "なのだ")
+    cache.put("たこ焼き", "")
+    assert cache.stats()["cached_responses"] == 0
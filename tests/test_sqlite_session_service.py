@@ -0,0 +1,129 @@
+import time
+import asyncio
+
+import pytest
+
+pytest.importorskip("google.adk")
+
+from google.adk.events import Event, EventActions
+from google.genai import types
+
+from module.sqlite_session_service import SqliteSessionService
+
+
+APP = "zunda"
+
+
+def user_event(text: str, state_delta: dict = None, timestamp: float = None):
+    event = Event(
+        author="user",
+        invocation_id="test",
+        content=types.Content(role="user", parts=[types.Part(text=text)]),
+        actions=EventActions(state_delta=state_delta or {}),
+    )
+    if timestamp is not None:
+        event.timestamp = timestamp
+    return event
+
+
+def texts(session):
+    return [event.content.parts[0].text for event in session.events]
+
+
+def test_state_prefixes_are_shared_and_temp_is_dropped(tmp_path):
+    async def scenario():
+        service = SqliteSessionService(str(tmp_path / "sessions.db"), ttl=0)
+        try:
+            first = await service.create_session(
+                app_name=APP,
+                user_id="u1",
+                session_id="s1",
+                state={"app:festival": "博多", "user:name": "ずんだ", "temp:draft": 1, "topic": "屋台"},
+            )
+            assert first.state == {"app:festival": "博多", "user:name": "ずんだ", "topic": "屋台"}
+            # アプリ共通の状態は別ユーザーにも、ユーザー共通の状態は同じユーザーの別セッションにも見える
+            other_user = await service.create_session(app_name=APP, user_id="u2", session_id="s2")
+            assert other_user.state == {"app:festival": "博多"}
+            same_user = await service.create_session(app_name=APP, user_id="u1", session_id="s3")
+            assert same_user.state == {"app:festival": "博多", "user:name": "ずんだ"}
+            with pytest.raises(ValueError):
+                await service.create_session(app_name=APP, user_id="u1", session_id="s1")
+            listed = await service.list_sessions(app_name=APP, user_id="u1")
+            assert sorted(session.id for session in listed.sessions) == ["s1", "s3"]
+        finally:
+            service.close()
+
+    asyncio.run(scenario())
+
+
+def test_events_survive_reopening_the_database(tmp_path):
+    path = str(tmp_path / "sessions.db")
+
+    async def write():
+        service = SqliteSessionService(path, ttl=0)
+        try:
+            session = await service.create_session(app_name=APP, user_id="u1", session_id="s1")
+            await service.append_event(session, user_event("こんにちは", {"mood": "happy", "user:visits": 1}))
+            await service.append_event(session, user_event("屋台はどこ"))
+            # 途中経過のイベントは保存しない
+            partial = user_event("屋台は")
+            partial.partial = True
+            await service.append_event(session, partial)
+        finally:
+            service.close()
+
+    async def read():
+        service = SqliteSessionService(path, ttl=0)
+        try:
+            session = await service.get_session(app_name=APP, user_id="u1", session_id="s1")
+            assert texts(session) == ["こんにちは", "屋台はどこ"]
+            assert session.state == {"mood": "happy", "user:visits": 1}
+            assert service.stats()["loads"] == 1
+            await service.delete_session(app_name=APP, user_id="u1", session_id="s1")
+            assert await service.get_session(app_name=APP, user_id="u1", session_id="s1") is None
+        finally:
+            service.close()
+
+    asyncio.run(write())
+    asyncio.run(read())
+
+
+def test_sessions_beyond_hot_limit_are_reloaded_from_db(tmp_path):
+    async def scenario():
+        service = SqliteSessionService(str(tmp_path / "sessions.db"), max_hot_sessions=1, ttl=0)
+        try:
+            first = await service.create_session(app_name=APP, user_id="u1", session_id="s1")
+            await service.append_event(first, user_event("ひとつめ"))
+            second = await service.create_session(app_name=APP, user_id="u1", session_id="s2")
+            await service.append_event(second, user_event("ふたつめ"))
+            assert service.stats()["unloaded"] == 1
+
+            # s2 はメモリから、追い出された s1 は DB から読み込む
+            assert texts(await service.get_session(app_name=APP, user_id="u1", session_id="s2")) == ["ふたつめ"]
+            assert service.stats()["hits"] == 1
+            assert texts(await service.get_session(app_name=APP, user_id="u1", session_id="s1")) == ["ひとつめ"]
+            assert service.stats()["loads"] == 1
+            assert service.stats()["hot_sessions"] == 1
+        finally:
+            service.close()
+
+    asyncio.run(scenario())
+
+
+def test_evict_expired_removes_only_stale_sessions(tmp_path):
+    async def scenario():
+        service = SqliteSessionService(str(tmp_path / "sessions.db"), ttl=60)
+        try:
+            stale = await service.create_session(app_name=APP, user_id="u1", session_id="stale")
+            await service.append_event(stale, user_event("むかしの話", timestamp=time.time() - 120))
+            fresh = await service.create_session(app_name=APP, user_id="u1", session_id="fresh")
+            await service.append_event(fresh, user_event("いまの話"))
+
+            await service.evict_expired()
+            assert service.stats()["expired"] == 1
+            assert await service.get_session(app_name=APP, user_id="u1", session_id="stale") is None
+            assert texts(await service.get_session(app_name=APP, user_id="u1", session_id="fresh")) == ["いまの話"]
+        finally:
+            service.close()
+
+    asyncio.run(scenario())
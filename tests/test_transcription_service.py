@@ -0,0 +1,161 @@
+import asyncio
+import datetime
+
+import pytest
+
+pytest.importorskip("google.cloud.speech")
+
+from google.cloud import speech
+
+from benchmarks.fakes import ReplayCapture
+from module.transcription_service import ENDPOINT_COMMIT_TOLERANCE, TranscriptionService, strip_committed_prefix
+from module.realtime_transcription import CHANNEL_NUMS, SAMPLE_RATE
+
+
+CHUNK_SECONDS = 0.1
+CHUNK = b"\x00\x00" * int(SAMPLE_RATE * CHANNEL_NUMS * CHUNK_SECONDS)
+
+
+def recognize_response(transcript: str, is_final: bool, end_seconds: float):
+    return speech.StreamingRecognizeResponse(
+        results=[
+            speech.StreamingRecognitionResult(
+                alternatives=[speech.SpeechRecognitionAlternative(transcript=transcript)],
+                is_final=is_final,
+                stability=0.9,
+                result_end_time=datetime.timedelta(seconds=end_seconds),
+            )
+        ]
+    )
+
+
+class FakeSpeechClient:
+    """受け取った音声の秒数が台本の時刻に達したら、台本どおりの中間結果・確定結果を返す疑似クライアント"""
+
+    def __init__(self, script):
+        """script: (受け取った音声の秒数, テキスト, 確定結果かどうか) のリスト"""
+        self.script = list(script)
+        self.streams = 0
+
+    async def streaming_recognize(self, requests):
+        self.streams += 1
+        responses = asyncio.Queue()
+
+        async def consume():
+            received = 0.0
+            try:
+                async for request in requests:
+                    if not request.audio_content:
+                        continue
+                    received += len(request.audio_content) / (SAMPLE_RATE * CHANNEL_NUMS * 2)
+                    while self.script and self.script[0][0] <= received + 1e-6:
+                        _, transcript, is_final = self.script.pop(0)
+                        responses.put_nowait(recognize_response(transcript, is_final, received))
+            finally:
+                responses.put_nowait(None)
+
+        consumer = asyncio.create_task(consume())
+
+        async def iterate():
+            try:
+                while True:
+                    response = await responses.get()
+                    if response is None:
+                        break
+                    yield response
+            finally:
+                consumer.cancel()
+
+        return iterate()
+
+
+class ScriptedTurns:
+    """マイク入力の代わりに音声と発話終了を直接与えて、文字起こしサービスを動かす"""
+
+    def __init__(self, client: FakeSpeechClient):
+        self.service = TranscriptionService(capture=ReplayCapture(), client=client)
+        self.__task = asyncio.create_task(self.service._TranscriptionService__run_sessions())
+
+    async def speak(self, seconds: float):
+        for _ in range(round(seconds / CHUNK_SECONDS)):
+            await self.service.audio_queue.put(CHUNK)
+        # 疑似クライアントが音声を受け取り、結果を返し終わるまで待つ
+        while not self.service.audio_queue.empty():
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+
+    async def end_of_speech(self):
+        """発話終了を判定させ、送出されたターンの文字起こし結果を返す（なければ None）"""
+        self.service._TranscriptionService__endpoint_event.set()
+        transcripts = self.service._TranscriptionService__transcripts
+        try:
+            return await asyncio.wait_for(transcripts.get(), timeout=0.5)
+        except asyncio.TimeoutError:
+            return None
+
+    async def close(self):
+        self.__task.cancel()
+        try:
+            await self.__task
+        except asyncio.CancelledError:
+            pass
+
+
+def test_strip_committed_prefix_tolerates_notation_differences():
+    assert strip_committed_prefix("今日は晴れ、明日は雨", "今日は晴れ") == "明日は雨"
+    assert strip_committed_prefix("今日は晴れ。明日は雨", "きょうははれ") == "明日は雨"
+    assert strip_committed_prefix("ＡＢＣ ですか", "abc") == "ですか"
+    assert strip_committed_prefix("こんにちは", "こんにちは、") == ""
+    assert strip_committed_prefix("はい", "") == "はい"
+
+
+def test_final_after_committed_interim_emits_only_the_continuation():
+    client = FakeSpeechClient([
+        (0.5, "きょうははれ", False),
+        # 話し続けた後に、送出済みの部分と表記が異なる確定結果が、許容時間を過ぎた位置まで返ってくる
+        (2.0, "今日は晴れ。明日は雨", True),
+    ])
+
+    async def scenario():
+        turns = ScriptedTurns(client)
+        try:
+            await turns.speak(1.0)
+            first = await turns.end_of_speech()
+            await turns.speak(1.0)
+            second = await turns.end_of_speech()
+            return first, second
+        finally:
+            await turns.close()
+
+    first, second = asyncio.run(scenario())
+    assert 1.0 + ENDPOINT_COMMIT_TOLERANCE < 2.0
+    assert first == "きょうははれ"
+    assert second == "明日は雨"
+    # ストリームは発話の切れ目で閉じない
+    assert client.streams == 1
+
+
+def test_final_within_tolerance_of_committed_interim_is_dropped():
+    client = FakeSpeechClient([
+        (0.5, "こんにちは", False),
+        (1.1, "こんにちは。", True),
+        (2.1, "ずんだ餅が食べたい", False),
+    ])
+
+    async def scenario():
+        turns = ScriptedTurns(client)
+        try:
+            await turns.speak(1.0)
+            first = await turns.end_of_speech()
+            await turns.speak(0.1)
+            duplicate = await turns.end_of_speech()
+            await turns.speak(1.0)
+            second = await turns.end_of_speech()
+            return first, duplicate, second
+        finally:
+            await turns.close()
+
+    first, duplicate, second = asyncio.run(scenario())
+    assert first == "こんにちは"
+    assert duplicate is None
+    assert second == "ずんだ餅が食べたい"
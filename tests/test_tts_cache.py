@@ -0,0 +1,64 @@
+import os
+
+from module.tts_cache import TTSCache, normalize_text
+
+
+def test_make_key_ignores_width_and_whitespace():
+    assert normalize_text("ＡＢＣ　なのだ 1") == "ABCなのだ1"
+    assert TTSCache.make_key("wav", "こんにちは なのだ", 3) == TTSCache.make_key("wav", "こんにちは　なのだ", 3)
+    assert TTSCache.make_key("wav", "こんにちは", 3) != TTSCache.make_key("wav", "こんにちは", 1)
+    assert TTSCache.make_key("wav", "こんにちは", 3) != TTSCache.make_key("query", "こんにちは", 3)
+    assert TTSCache.make_key("wav", "こんにちは", 3, {"speedScale": 1.2}) != TTSCache.make_key("wav", "こんにちは", 3)
+
+
+def test_memory_evicts_least_recently_used():
+    cache = TTSCache(memory_budget=30)
+    cache.put("a", b"a" * 10)
+    cache.put("b", b"b" * 10)
+    cache.put("c", b"c" * 10)
+    # a を参照して最近使ったものにすると、次に追い出されるのは b
+    assert cache.get("a") == b"a" * 10
+    cache.put("d", b"d" * 10)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.get("d") is not None
+    assert cache.stats()["memory_bytes"] == 30
+
+
+def test_entry_larger_than_memory_budget_is_not_kept():
+    cache = TTSCache(memory_budget=10)
+    cache.put("big", b"x" * 11)
+    assert cache.get("big") is None
+    assert cache.stats()["memory_entries"] == 0
+
+
+def test_disk_hit_after_restart(tmp_path):
+    TTSCache(cache_dir=str(tmp_path)).put("a", b"wav")
+    cache = TTSCache(cache_dir=str(tmp_path))
+    assert cache.get("a") == b"wav"
+    assert cache.get("a") == b"wav"
+    stats = cache.stats()
+    assert (stats["disk_hits"], stats["memory_hits"], stats["misses"]) == (1, 1, 0)
+
+
+def test_disk_evicts_least_recently_accessed(tmp_path):
+    cache = TTSCache(cache_dir=str(tmp_path), memory_budget=0, disk_budget=25)
+    cache.put("a", b"a" * 10)
+    cache.put("b", b"b" * 10)
+    # 最終アクセス時刻で順序を決めるため、a を後からアクセスしたことにする
+    os.utime(tmp_path / "b.bin", (1, 1))
+    os.utime(tmp_path / "a.bin", (2, 2))
+    cache.put("c", b"c" * 10)
+    assert sorted(os.listdir(tmp_path)) == ["a.bin", "c.bin"]
+    assert cache.stats()["disk_bytes"] == 20
+
+
+def test_uncounted_lookup_does_not_change_hit_rate():
+    cache = TTSCache()
+    cache.put("query", b"{}")
+    assert cache.get("wav") is None
+    assert cache.get("query", count=False) == b"{}"
+    assert cache.get("missing", count=False) is None
+    stats = cache.stats()
+    assert (stats["memory_hits"], stats["misses"], stats["hit_rate"]) == (0, 1, 0.0)